@@ -10,7 +10,7 @@ validators = ()
 settings = Dynaconf(
     env_switcher="APP_MODE",
     envvar_prefix="DYNACONF",
-    default_env="DEVELOPMENT",
+    default_env="DEFAULT",
     env="DEVELOPMENT",
     root_path=PurePath(os.path.dirname(__file__)) / "config",
     environments=["DEFAULT", "DEVELOPMENT", "PRODUCTION"],
@@ -1,8 +1,33 @@
 from __future__ import annotations
 
+import threading
+from typing import TYPE_CHECKING, Any
+
 from loguru import logger
 
-from ethchange.providers import ProviderContainer
+if TYPE_CHECKING:
+    from ethchange.providers import ProviderContainer
+
+    injector: ProviderContainer
+
+_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Builds `ProviderContainer` and the `injector` on first access, so importing `ethchange` (as `ethchange.settings`
+    does) stays cheap. The providers themselves import their services on first use.
+    """
+    if name not in ("ProviderContainer", "injector"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lock:
+        if "injector" not in globals():
+            try:
+                from ethchange.providers import ProviderContainer
 
-injector = ProviderContainer()
-logger.success("Injector Intilized")
+                globals().update(ProviderContainer=ProviderContainer, injector=ProviderContainer())
+            except AttributeError as error:
+                # escaping this function it would read as `ethchange` having no such attribute, hiding the cause
+                raise RuntimeError(f"Building the {name} of {__name__!r} failed: {error}") from error
+            logger.success("Injector Intilized")
+    return globals()[name]
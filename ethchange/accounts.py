@@ -0,0 +1,159 @@
+"""
+Pool of Ethereum accounts created ahead of signup.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings as django_settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from loguru import logger
+from web3 import Web3
+
+from ethchange.keystore import KeystoreGenerator, keyfile_path, reencrypt_keyfile
+
+
+class AccountPool:
+    """
+    Hands out pre-generated geth accounts so signup does not wait for keystore key derivation.
+
+    Accounts are created under the pool passphrase, through `keystore_generator` when one is given and through the
+    node otherwise, by a background refill worker whenever the pool drops below
+    `low_water_mark`. A claimed account is re-encrypted under its user's password in the background by rewriting its
+    file in `keystore_dir`, which therefore has to be the keystore directory of the node.
+
+    A claim made inside a transaction is undone with it, the re-encryption only starts once the claim committed.
+    Until the claimed row is deleted the account is still under the pool passphrase, `ensure_rebound` finishes or
+    retries its re-encryption before the account is used.
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        keystore_generator: Optional[KeystoreGenerator],
+        passphrase: str,
+        keystore_dir: str,
+        low_water_mark: int,
+        size: int,
+        rebind_workers: int,
+    ):
+        self._web3 = web3
+        self._keystore_generator = keystore_generator
+        self._passphrase = passphrase
+        self._keystore_dir = Path(keystore_dir.format(base_dir=django_settings.BASE_DIR))
+        self._low_water_mark = low_water_mark
+        self._size = size
+        self._rebind_executor = ThreadPoolExecutor(max_workers=rebind_workers, thread_name_prefix="account-rebind")
+        self._rebinds: dict[str, Future] = dict()
+        self._rebinds_lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+
+    @staticmethod
+    def _available():
+        from ethchange.user.models import PooledEthAccount
+
+        return PooledEthAccount.objects.filter(claimed__isnull=True)
+
+    def available(self) -> int:
+        return self._available().count()
+
+    def refill(self, size: Optional[int] = None) -> int:
+        """Creates accounts until `size` of them are available, returns the number created"""
+        from ethchange.user.models import PooledEthAccount
+
+        created = 0
+        with self._refill_lock:
+            missing = max((size or self._size) - self.available(), 0)
+            if self._keystore_generator is not None:
+                accounts = self._keystore_generator.generate_many([self._passphrase] * missing)
+                PooledEthAccount.objects.bulk_create(
+                    [PooledEthAccount(eth_account=account.encode("utf-8")) for account in accounts]
+                )
+                created += len(accounts)
+            else:
+                for _ in range(missing):
+                    account = self._web3.geth.personal.new_account(self._passphrase)
+                    PooledEthAccount.objects.create(eth_account=account.encode("utf-8"))
+                    created += 1
+        logger.opt(lazy=True).debug(f"[{created}] Accounts added to the account pool")
+        return created
+
+    def _background_refill(self):
+        try:
+            self.refill()
+        finally:
+            close_old_connections()
+
+    def _refill_in_background(self):
+        if not self._refill_lock.locked():
+            threading.Thread(target=self._background_refill, name="account-pool-refill", daemon=True).start()
+
+    def _rebind(self, address: str, password: str) -> bool:
+        from ethchange.user.models import PooledEthAccount
+
+        try:
+            path = keyfile_path(self._keystore_dir, address)
+            if path is None:
+                raise FileNotFoundError(f"No keystore file for [{address}] in [{self._keystore_dir}]")
+            reencrypt_keyfile(path, self._passphrase, password)
+        except Exception:  # pylint: disable=broad-except
+            # the claimed row is kept, the next `ensure_rebound` of the account retries
+            logger.opt(exception=True).error(f"[{address}] Failed to rebind pooled account")
+            return False
+        PooledEthAccount.objects.filter(eth_account=address.encode("utf-8")).delete()
+        logger.opt(lazy=True).debug(f"[{address}] Pooled account rebound")
+        return True
+
+    def _background_rebind(self, address: str, password: str) -> bool:
+        try:
+            return self._rebind(address, password)
+        finally:
+            close_old_connections()
+            with self._rebinds_lock:
+                self._rebinds.pop(address, None)
+
+    def _submit_rebind(self, address: str, password: str):
+        with self._rebinds_lock:
+            self._rebinds[address] = self._rebind_executor.submit(self._background_rebind, address, password)
+
+    def claim(self, password: str) -> bytes:
+        """
+        Claims an available account and schedules its re-encryption under `password` once the claim is committed.
+
+        Returns an empty byte string when the pool is empty.
+        """
+        for account in self._available().order_by("pk")[:8]:
+            if self._available().filter(pk=account.pk).update(claimed=timezone.now()):
+                break
+        else:
+            self._refill_in_background()
+            return b""
+
+        if self.available() < self._low_water_mark:
+            self._refill_in_background()
+
+        eth_account = bytes(account.eth_account)
+        transaction.on_commit(lambda: self._submit_rebind(eth_account.decode("utf-8"), password))
+        return eth_account
+
+    def ensure_rebound(self, address: str, password: str) -> bool:
+        """
+        Makes sure the account `address` of a user is no longer under the pool passphrase before it is unlocked.
+
+        Waits for a re-encryption still running in this process, and re-encrypts the account under `password`, the
+        user's password just verified, when its claimed row is left over from one that failed or ran elsewhere.
+        Returns False if the account is still under the pool passphrase.
+        """
+        from ethchange.user.models import PooledEthAccount
+
+        with self._rebinds_lock:
+            rebind = self._rebinds.get(address)
+        if rebind is not None and rebind.result():
+            return True
+        if PooledEthAccount.objects.filter(eth_account=address.encode("utf-8"), claimed__isnull=False).exists():
+            return self._rebind(address, password)
+        return True
@@ -0,0 +1,257 @@
+"""
+Admission control in front of the geth node.
+
+Requests to the node backed endpoints take a token from the bucket of their endpoint group and from the bucket of
+their user in that group, and are answered 429 with Retry-After when either is empty. JSON-RPC calls then take one of
+a process wide number of node slots; a call that waits too long for one raises `NodeBusy`, answered 503.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+if TYPE_CHECKING:
+    from web3 import Web3
+    from web3.types import RPCEndpoint, RPCResponse
+
+
+class NodeBusy(APIException):
+    """Raised when a JSON-RPC call found no free node slot in time, rendered as 503 with Retry-After by DRF"""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Node is busy, retry later"
+    default_code = "node_busy"
+    # seconds clients wait before retrying, read by DRF for the Retry-After header
+    wait = 1
+
+
+class TokenBucket:
+    """Holds up to `burst` tokens, refilled at `rate` tokens per second; not thread safe on its own"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Takes a token, returns 0 or the seconds until a token is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class AdmissionController:
+    """
+    Token bucket rate limits of the node backed endpoints.
+
+    `routes` maps the URL names of the limited endpoints to an endpoint group, `limits` maps each group to the
+    [rate, burst] of the bucket shared by all its requests, and `user_limit` is the [rate, burst] of the bucket of
+    each user, or client address for anonymous requests, in each group. The buckets of the `max_users` most recently
+    seen users are kept.
+    """
+
+    def __init__(self, routes: dict[str, str], limits: dict[str, list], user_limit: list, max_users: int):
+        now = time.monotonic()
+        self._routes = dict(routes)
+        self._endpoints = {group: TokenBucket(rate, burst, now) for group, (rate, burst) in limits.items()}
+        self._user_rate, self._user_burst = user_limit
+        self._users: OrderedDict[tuple[str, Any], TokenBucket] = OrderedDict()
+        self._max_users = max_users
+        self._lock = threading.Lock()
+        self._counters = {group: dict(admitted=0, limited_user=0, limited_endpoint=0) for group in limits}
+
+    def group(self, route: Optional[str]) -> Optional[str]:
+        return self._routes.get(route)
+
+    def _user_bucket(self, key: tuple[str, Any], now: float) -> TokenBucket:
+        bucket = self._users.get(key)
+        if bucket is None:
+            bucket = self._users[key] = TokenBucket(self._user_rate, self._user_burst, now)
+            if len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(key)
+        return bucket
+
+    def admit(self, group: str, user: Any) -> float:
+        """Takes a token for a request of `user` to `group`, returns 0 or the seconds to wait before retrying"""
+        now = time.monotonic()
+        with self._lock:
+            counters = self._counters[group]
+            user_bucket = self._user_bucket((group, user), now)
+            wait = user_bucket.take(now)
+            if wait:
+                counters["limited_user"] += 1
+                return wait
+            wait = self._endpoints[group].take(now)
+            if wait:
+                # the request is not served, so it does not count against its user
+                user_bucket.give_back()
+                counters["limited_endpoint"] += 1
+                return wait
+            counters["admitted"] += 1
+            return 0.0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return dict(
+                groups={group: dict(counters) for group, counters in self._counters.items()}, users=len(self._users)
+            )
+
+
+class NodeLimiter:
+    """
+    Web3 middleware capping the JSON-RPC calls in flight to the node at `concurrency` per process.
+
+    A call without a free slot waits up to `wait` seconds for one and then raises `NodeBusy`, so a burst of requests
+    is shed at once instead of queueing behind a node that already slowed down. It is injected outside the metrics
+    middleware, so the recorded call latencies leave out the wait for a slot.
+    """
+
+    def __init__(self, concurrency: int, wait: float):
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._wait = wait
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = dict(calls=0, queued=0, shed=0, max_in_flight=0, wait_ms=0.0)
+
+    def _acquired(self, waited: float):
+        with self._lock:
+            self._in_flight += 1
+            self._counters["calls"] += 1
+            self._counters["max_in_flight"] = max(self._counters["max_in_flight"], self._in_flight)
+            if waited:
+                self._counters["queued"] += 1
+                self._counters["wait_ms"] += waited * 1000
+
+    def _shed(self):
+        with self._lock:
+            self._counters["queued"] += 1
+            self._counters["shed"] += 1
+            self._counters["wait_ms"] += self._wait * 1000
+        raise NodeBusy()
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """Holds a node slot, raises `NodeBusy` if none frees up within `wait` seconds"""
+        waited = 0.0
+        if not self._slots.acquire(blocking=False):
+            started = time.perf_counter()
+            if not self._slots.acquire(timeout=self._wait):
+                self._shed()
+            waited = time.perf_counter() - started
+        self._acquired(waited)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """Async variant of `slot`, polling for a slot without holding a thread"""
+        waited = 0.0
+        if not self._slots.acquire(blocking=False):
+            started = time.perf_counter()
+            deadline = time.monotonic() + self._wait
+            while not self._slots.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    self._shed()
+                await asyncio.sleep(0.005)
+            waited = time.perf_counter() - started
+        self._acquired(waited)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def __call__(self, make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3) -> Callable:
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            with self.slot():
+                return make_request(method, params)
+
+        return middleware
+
+    async def async_middleware(
+        self, make_request: Callable[[RPCEndpoint, Any], Awaitable[RPCResponse]], w3: Web3
+    ) -> Callable:
+        async def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            async with self.aslot():
+                return await make_request(method, params)
+
+        return middleware
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return dict(self._counters, in_flight=self._in_flight)
+
+
+def _route(request: HttpRequest) -> Optional[str]:
+    try:
+        return resolve(request.path_info).url_name
+    except Resolver404:
+        return None
+
+
+def _too_many_requests(wait: float) -> HttpResponse:
+    response = JsonResponse(dict(detail="Request was throttled."), status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+@sync_and_async_middleware
+def admission_middleware(get_response: Callable) -> Callable:
+    """Answers requests to the limited endpoints with 429 once their endpoint group or their user ran out of tokens"""
+    from ethchange import injector
+
+    controller: AdmissionController = injector.admission_controller()
+
+    def user_key(request: HttpRequest) -> Any:
+        return request.user.pk if request.user.is_authenticated else request.META.get("REMOTE_ADDR")
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request: HttpRequest) -> HttpResponse:
+            group = controller.group(_route(request))
+            if group is not None:
+                wait = controller.admit(group, await sync_to_async(user_key)(request))
+                if wait:
+                    return _too_many_requests(wait)
+            return await get_response(request)
+
+    else:
+
+        def middleware(request: HttpRequest) -> HttpResponse:
+            group = controller.group(_route(request))
+            if group is not None:
+                wait = controller.admit(group, user_key(request))
+                if wait:
+                    return _too_many_requests(wait)
+            return get_response(request)
+
+    return middleware
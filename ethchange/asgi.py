@@ -5,9 +5,13 @@ ASGI config for ethchange project.
 from __future__ import annotations
 
 import os
+from pathlib import Path
 
 from django.core.asgi import get_asgi_application
 
+from ethchange.logs import configure_logging
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ethchange.settings")
+configure_logging(Path(__file__).resolve().parent.parent / "volume")
 
 application = get_asgi_application()
@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Iterable, Optional
+
+from django.core.cache import BaseCache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from loguru import logger
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+    from web3 import Web3
+
+    from ethchange.user.models import UserModel
+
+# entries culled from each `CountingLocMemCache` location, shared like the locmem stores themselves
+_evictions: defaultdict[str, int] = defaultdict(int)
+
+
+class CountingLocMemCache(LocMemCache):
+    """Local memory cache that counts the entries culled once it is full"""
+
+    def __init__(self, name: str, params: dict[str, Any]):
+        super().__init__(name, params)
+        self._location = name
+
+    def _cull(self):
+        # called with the store lock held
+        size = len(self._cache)
+        super()._cull()
+        _evictions[self._location] += size - len(self._cache)
+
+    @property
+    def evictions(self) -> int:
+        return _evictions[self._location]
+
+
+class BalanceCache:
+    """
+    Balance cache keyed by (address, block number), stored in a Django cache alias so it is shared across workers.
+
+    Entries are never invalidated individually; a background new-head watcher, started by the first sync or async
+    lookup, advances the cached head block and lookups for older blocks are left to the backend's LRU eviction.
+
+    The hit, miss and head counters are process local, so counting a lookup costs no cache round trip.
+    """
+
+    HEAD_KEY = "balance:head"
+
+    def __init__(self, alias: str, poll_interval: float):
+        self._alias = alias
+        self._poll_interval = poll_interval
+        self._stats = dict(hits=0, misses=0, heads=0)
+        self._stats_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_lock = threading.Lock()
+
+    @property
+    def cache(self) -> BaseCache:
+        return caches[self._alias]
+
+    @staticmethod
+    def _key(address: str, block_number: int) -> str:
+        return f"balance:{address.lower()}:{block_number}"
+
+    def _count(self, stat: str, delta: int = 1):
+        with self._stats_lock:
+            self._stats[stat] += delta
+
+    def _set_head(self, block_number: int) -> int:
+        if self.cache.get(self.HEAD_KEY) != block_number:
+            self._count("heads")
+        # the head expires if the watcher stops, so a dead watcher can never pin lookups to a stale block
+        self.cache.set(self.HEAD_KEY, block_number, timeout=self._poll_interval * 3)
+        return block_number
+
+    def _watch(self, web3: Web3, asynchronous: bool):
+        # an async client polls on a loop of the watcher, the loop of the request that started it may be closed later
+        loop = asyncio.new_event_loop() if asynchronous else None
+        try:
+            while not self._stopped.is_set():
+                try:
+                    block_number = web3.eth.block_number
+                    self._set_head(loop.run_until_complete(block_number) if loop is not None else block_number)
+                except Exception:  # pylint: disable=broad-except
+                    logger.opt(exception=True).warning("Balance cache head watcher failed to poll eth_blockNumber")
+                self._stopped.wait(self._poll_interval)
+        finally:
+            if loop is not None:
+                loop.close()
+
+    def _ensure_watcher(self, web3: Web3, asynchronous: bool = False):
+        if self._watcher is None:
+            with self._watcher_lock:
+                if self._watcher is None:
+                    self._watcher = threading.Thread(
+                        target=self._watch, args=(web3, asynchronous), name="balance-head-watcher", daemon=True
+                    )
+                    self._watcher.start()
+                    logger.debug("Balance cache head watcher started")
+
+    def stop(self):
+        """Stops the watcher, the cached head then expires after three poll intervals"""
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+    def head(self, web3: Web3) -> int:
+        """Returns the latest block number seen by the watcher, asking the node only if none is cached"""
+        self._ensure_watcher(web3)
+        block_number = self.cache.get(self.HEAD_KEY)
+        if block_number is None:
+            block_number = self._set_head(web3.eth.block_number)
+        return block_number
+
+    def get_balance(self, address: str, web3: Web3) -> int:
+        block_number = self.head(web3)
+        key = self._key(address, block_number)
+        balance = self.cache.get(key)
+        if balance is None:
+            self._count("misses")
+            balance = web3.eth.get_balance(account=address, block_identifier=block_number)
+            self.cache.set(key, balance, timeout=None)
+        else:
+            self._count("hits")
+        return balance
+
+    async def aget_balance(self, address: str, web3: Web3) -> int:
+        """Async variant of `get_balance` for a `Web3` instance running the async eth module"""
+        self._ensure_watcher(web3, asynchronous=True)
+        block_number = await self.cache.aget(self.HEAD_KEY)
+        if block_number is None:
+            block_number = await web3.eth.block_number
+            await self.cache.aset(self.HEAD_KEY, block_number, timeout=self._poll_interval * 3)
+
+        key = self._key(address, block_number)
+        balance = await self.cache.aget(key)
+        if balance is None:
+            self._count("misses")
+            balance = await web3.eth.get_balance(address, block_identifier=block_number)
+            await self.cache.aset(key, balance, timeout=None)
+        else:
+            self._count("hits")
+        return balance
+
+    def get_balances(self, addresses: Iterable[str], block_number: int) -> dict[str, int]:
+        """Returns the cached balances of `addresses` at `block_number`, omitting the ones not cached"""
+        keys = {self._key(address, block_number): address for address in addresses}
+        cached = self.cache.get_many(keys.keys())
+        self._count("hits", len(cached))
+        self._count("misses", len(keys) - len(cached))
+        return {keys[key]: balance for key, balance in cached.items()}
+
+    def set_balances(self, balances: dict[str, int], block_number: int):
+        self.cache.set_many(
+            {self._key(address, block_number): balance for address, balance in balances.items()}, timeout=None
+        )
+
+    def stats(self) -> dict[str, Any]:
+        """Counters of this process, and the cached head"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["head"] = self.cache.get(self.HEAD_KEY)
+        return stats
+
+
+class UnlockCache:
+    """
+    Unlock state of the geth accounts, stored in a Django cache alias so it is shared across workers.
+
+    Accounts are unlocked for `duration` seconds and recorded as unlocked for `margin` seconds less, so an unlock while
+    the record lives skips `personal_unlockAccount` and the key derivation geth runs for it. Locking drops the record
+    at once. With a `duration` of 0 geth keeps the account unlocked until it is locked, the record then lasts for the
+    alias' default timeout so a geth restart is noticed eventually. The caller verifies the password before either.
+
+    The unlock, avoided and lock counters are shared through the alias like those of `BalanceCache`, and approximate
+    for the same reason: increments racing on a backend without an atomic `incr` can be lost.
+    """
+
+    STAT_KEYS = ("unlocks", "avoided", "locks")
+
+    def __init__(self, alias: str, node: str, duration: int, margin: float):
+        self._alias = alias
+        self._node = node
+        self._duration = duration
+        self._timeout = max(duration - margin, 0) if duration else DEFAULT_TIMEOUT
+
+    @property
+    def cache(self) -> BaseCache:
+        return caches[self._alias]
+
+    def _key(self, address: str) -> str:
+        return f"unlock:{self._node}:{address.lower()}"
+
+    def _count(self, stat: str):
+        key = f"unlock:stats:{stat}"
+        self.cache.add(key, 0, timeout=None)
+        self.cache.incr(key)
+
+    async def _acount(self, stat: str):
+        key = f"unlock:stats:{stat}"
+        await self.cache.aadd(key, 0, timeout=None)
+        await self.cache.aincr(key)
+
+    def unlock(self, address: str, password: str, web3: Web3) -> bool:
+        """Unlocks `address` unless it is recorded as unlocked, returns whether it is unlocked"""
+        if self.cache.get(self._key(address)):
+            self._count("avoided")
+            return True
+        unlocked = web3.geth.personal.unlock_account(address, password, self._duration)
+        self._count("unlocks")
+        if unlocked and self._timeout != 0:
+            self.cache.set(self._key(address), True, timeout=self._timeout)
+        return unlocked
+
+    async def aunlock(self, address: str, password: str, web3: Web3) -> bool:
+        """Async variant of `unlock` for a `Web3` instance running the async geth personal module"""
+        if await self.cache.aget(self._key(address)):
+            await self._acount("avoided")
+            return True
+        unlocked = await web3.geth.personal.unlock_account(address, password, self._duration)
+        await self._acount("unlocks")
+        if unlocked and self._timeout != 0:
+            await self.cache.aset(self._key(address), True, timeout=self._timeout)
+        return unlocked
+
+    def lock(self, address: str, web3: Web3):
+        try:
+            web3.geth.personal.lock_account(address)
+        finally:
+            # also dropped when the call failed, the next unlock then asks geth again
+            self.cache.delete(self._key(address))
+        self._count("locks")
+
+    async def alock(self, address: str, web3: Web3):
+        try:
+            await web3.geth.personal.lock_account(address)
+        finally:
+            await self.cache.adelete(self._key(address))
+        await self._acount("locks")
+
+    def stats(self) -> dict[str, int]:
+        values = self.cache.get_many([f"unlock:stats:{stat}" for stat in self.STAT_KEYS])
+        return {stat: values.get(f"unlock:stats:{stat}", 0) for stat in self.STAT_KEYS}
+
+
+class UserCache:
+    """
+    Process local cache of `UserModel` rows resolved by primary key, name, phone, email or address.
+
+    Rows are stored once under their primary key and every identity maps to that key, so the `post_save`/`post_delete`
+    receivers only have to drop the row. An identity still pointing at a row whose field changed since is treated as a
+    miss. Entries are bounded by the alias' timeout and LRU size; other processes' changes show up once they expire.
+
+    Authentication reads through `get_current`, which checks the credentials of a cached row against the database,
+    so a password or permission change or a deletion made by another process applies to the next request.
+    """
+
+    FIELDS = ("pk", "name", "phone", "email", "eth_account")
+    # the columns authentication and permission checks depend on
+    CREDENTIALS = ("password", "is_staff", "is_superuser")
+
+    def __init__(self, alias: str):
+        self._alias = alias
+        self._stats = dict(hits=0, misses=0, stale=0)
+        self._stats_lock = threading.Lock()
+
+    @property
+    def cache(self) -> BaseCache:
+        return caches[self._alias]
+
+    @staticmethod
+    def _value(value: Any) -> str:
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value).decode("utf-8")
+        return str(value)
+
+    @staticmethod
+    def _lookup(field: str, value: Any) -> Any:
+        # addresses are stored as the UTF-8 bytes of their hex string
+        return value.encode("utf-8") if field == "eth_account" and isinstance(value, str) else value
+
+    def _key(self, field: str, value: Any) -> str:
+        return f"user:{field}:{self._value(value)}"
+
+    def _count(self, stat: str):
+        with self._stats_lock:
+            self._stats[stat] += 1
+
+    def _cached(self, field: str, value: Any) -> Optional[UserModel]:
+        pk = value if field == "pk" else self.cache.get(self._key(field, value))
+        if pk is not None:
+            user = self.cache.get(self._key("pk", pk))
+            if user is not None and self._value(getattr(user, field)) == self._value(value):
+                self._count("hits")
+                return user
+        self._count("misses")
+
+    def _store(self, user: UserModel):
+        keys = {self._key(field, getattr(user, field)): user.pk for field in self.FIELDS if field != "pk"}
+        keys[self._key("pk", user.pk)] = user
+        self.cache.set_many(keys)
+
+    def _load(self, field: str, value: Any) -> Optional[UserModel]:
+        from ethchange.user.models import UserModel
+
+        user = UserModel.objects.filter(**{field: self._lookup(field, value)}).first()
+        if user is not None:
+            self._store(user)
+        return user
+
+    async def _aload(self, field: str, value: Any) -> Optional[UserModel]:
+        from ethchange.user.models import UserModel
+
+        user = await UserModel.objects.filter(**{field: self._lookup(field, value)}).afirst()
+        if user is not None:
+            self._store(user)
+        return user
+
+    def get(self, field: str, value: Any) -> Optional[UserModel]:
+        """Returns the user whose `field` equals `value`, querying the database only on a miss"""
+        user = self._cached(field, value)
+        return user if user is not None else self._load(field, value)
+
+    async def aget(self, field: str, value: Any) -> Optional[UserModel]:
+        """
+        Async variant of `get`, the local memory store is read in place rather than through the backend's thread
+        """
+        user = self._cached(field, value)
+        return user if user is not None else await self._aload(field, value)
+
+    def _credentials_query(self, user: UserModel) -> QuerySet:
+        from ethchange.user.models import UserModel
+
+        return UserModel.objects.filter(pk=user.pk).values_list(*self.CREDENTIALS)
+
+    def _is_current(self, user: UserModel, credentials: Optional[tuple]) -> bool:
+        if credentials == tuple(getattr(user, column) for column in self.CREDENTIALS):
+            return True
+        self._count("stale")
+        self.invalidate(user)
+        return False
+
+    def get_current(self, field: str, value: Any) -> Optional[UserModel]:
+        """
+        Returns the user whose `field` equals `value` like `get`, serving a cached row only while its credentials
+        still match the database
+        """
+        user = self._cached(field, value)
+        if user is not None and self._is_current(user, self._credentials_query(user).first()):
+            return user
+        return self._load(field, value)
+
+    async def aget_current(self, field: str, value: Any) -> Optional[UserModel]:
+        user = self._cached(field, value)
+        if user is not None and self._is_current(user, await self._credentials_query(user).afirst()):
+            return user
+        return await self._aload(field, value)
+
+    def invalidate(self, user: UserModel):
+        self.cache.delete(self._key("pk", user.pk))
+
+    def update(self, user: UserModel):
+        """Replaces the cached row of `user` after a save that left every looked up field unchanged"""
+        self.cache.set(self._key("pk", user.pk), user)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else None
+        stats["evictions"] = getattr(self.cache, "evictions", None)
+        return stats
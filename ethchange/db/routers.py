@@ -0,0 +1,52 @@
+"""
+Database router sending the reads of read-only views to replicas.
+"""
+from __future__ import annotations
+
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica_reads: ContextVar[bool] = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def replica_reads() -> Iterator[None]:
+    """
+    Routes the reads made inside the block to a replica.
+
+    Reads are only sent to replicas on request, so a user reading back what they just wrote is never served from a
+    lagging replica. Also usable as a view decorator.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """Every database alias but the default one is a read replica of it, picked round-robin"""
+
+    def __init__(self):
+        replicas = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+        self._replicas = itertools.cycle(replicas) if replicas else None
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        # reads inside a transaction of the primary have to see its uncommitted writes
+        if self._replicas is not None and _replica_reads.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return next(self._replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str:
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, model_name: Optional[str] = None, **hints) -> bool:
+        return db == DEFAULT_DB_ALIAS
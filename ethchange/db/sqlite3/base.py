@@ -0,0 +1,34 @@
+"""
+SQLite backend taking per connection pragmas and the transaction BEGIN mode from its OPTIONS.
+"""
+from __future__ import annotations
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend accepting two extra OPTIONS:
+
+    - `pragmas`: PRAGMA statements run on every new connection
+    - `transaction_mode`: BEGIN mode of transactions, `IMMEDIATE` takes the write lock when the transaction starts so
+      concurrent writers wait on the busy timeout instead of failing when a read lock cannot be upgraded
+    """
+
+    EXTRA_OPTIONS = ("pragmas", "transaction_mode")
+
+    def get_connection_params(self) -> dict:
+        params = super().get_connection_params()
+        for option in self.EXTRA_OPTIONS:
+            params.pop(option, None)
+        return params
+
+    def get_new_connection(self, conn_params: dict):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict["OPTIONS"].get("pragmas", dict()).items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        self.cursor().execute(f"BEGIN {transaction_mode}" if transaction_mode else "BEGIN")
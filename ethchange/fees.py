@@ -0,0 +1,147 @@
+"""
+Fee estimates refreshed in the background, read by requests without a node round trip.
+"""
+from __future__ import annotations
+
+import statistics
+import threading
+import time
+from typing import Any, Optional
+
+from django.core.cache import BaseCache, caches
+from loguru import logger
+from web3 import Web3
+
+
+class FeeOracle:
+    """
+    Fee estimates per tier, computed from `eth_feeHistory` and stored in a Django cache alias shared across workers.
+
+    A background watcher polls `eth_blockNumber` every `poll_interval` seconds and recomputes the estimates once per
+    new block: the base fee of the next block plus, per tier, the median over the last `history_blocks` blocks of the
+    priority fee paid at the tier's reward percentile. Nodes without `eth_feeHistory`, or answering it without
+    rewards, fall back to `eth_gasPrice` for every tier and to `eth_maxPriorityFeePerGas` for the priority fee.
+    Estimates expire after `max_age` seconds, so a dead watcher makes requests refresh them instead of reading stale
+    fees.
+    """
+
+    ESTIMATE_KEY = "fees:estimate"
+    HEAD_KEY = "fees:head"
+
+    def __init__(self, alias: str, poll_interval: float, history_blocks: int, tiers: dict[str, float], max_age: float):
+        self._alias = alias
+        self._poll_interval = poll_interval
+        self._history_blocks = history_blocks
+        self._tiers = dict(sorted(tiers.items(), key=lambda tier: tier[1]))
+        self._max_age = max_age
+        self._refreshes = 0
+        self._stopped = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_lock = threading.Lock()
+
+    @property
+    def cache(self) -> BaseCache:
+        return caches[self._alias]
+
+    @property
+    def tiers(self) -> list[str]:
+        return list(self._tiers)
+
+    def _from_gas_price(self, web3: Web3, base_fee: Optional[int]) -> dict[str, Any]:
+        """Estimates without a fee history: `eth_gasPrice` for every tier, priority fees from the node's suggestion"""
+        block_number, gas_price = web3.eth.block_number, web3.eth.gas_price
+        estimate = dict(gas_price=gas_price)
+        if base_fee is not None:
+            try:
+                priority_fee = web3.eth.max_priority_fee
+            except ValueError:
+                priority_fee = max(gas_price - base_fee, 0)
+            estimate.update(max_priority_fee_per_gas=priority_fee, max_fee_per_gas=2 * base_fee + priority_fee)
+        tiers = {tier: dict(estimate) for tier in self._tiers}
+        return dict(block_number=block_number, base_fee=base_fee, tiers=tiers)
+
+    def _compute(self, web3: Web3) -> dict[str, Any]:
+        try:
+            history = web3.eth.fee_history(self._history_blocks, "latest", list(self._tiers.values()))
+        except ValueError:
+            return self._from_gas_price(web3, base_fee=None)
+
+        # the last base fee is the one of the block after the newest block of the history
+        base_fee = history["baseFeePerGas"][-1]
+        rewards = history.get("reward") or []
+        if not rewards:
+            # nodes answer without rewards for a history they cannot serve, e.g. blocks already pruned
+            return self._from_gas_price(web3, base_fee=base_fee)
+
+        tiers = dict()
+        for index, tier in enumerate(self._tiers):
+            priority_fee = int(statistics.median(reward[index] for reward in rewards))
+            tiers[tier] = dict(
+                max_priority_fee_per_gas=priority_fee,
+                # covers the base fee doubling over the next blocks, only base fee plus priority fee is paid
+                max_fee_per_gas=2 * base_fee + priority_fee,
+                gas_price=base_fee + priority_fee,
+            )
+        block_number = history["oldestBlock"] + len(rewards) - 1
+        return dict(block_number=block_number, base_fee=base_fee, tiers=tiers)
+
+    def refresh(self, web3: Web3) -> dict[str, Any]:
+        estimate = dict(self._compute(web3), updated=time.time())
+        self.cache.set_many(
+            {self.ESTIMATE_KEY: estimate, self.HEAD_KEY: estimate["block_number"]}, timeout=self._max_age
+        )
+        self._refreshes += 1
+        logger.opt(lazy=True).debug(f"Fee estimates refreshed at block [{estimate['block_number']}]")
+        return estimate
+
+    def _watch(self, web3: Web3):
+        while not self._stopped.wait(self._poll_interval):
+            try:
+                head = web3.eth.block_number
+                estimate = self.cache.get(self.ESTIMATE_KEY)
+                if estimate is None or estimate["block_number"] < head:
+                    self.refresh(web3)
+                else:
+                    self.cache.set(self.HEAD_KEY, head, timeout=self._max_age)
+            except Exception:  # pylint: disable=broad-except
+                logger.opt(exception=True).warning("Fee oracle failed to refresh the fee estimates")
+
+    def _ensure_watcher(self, web3: Web3):
+        if self._watcher is None:
+            with self._watcher_lock:
+                if self._watcher is None:
+                    self._watcher = threading.Thread(target=self._watch, args=(web3,), name="fee-oracle", daemon=True)
+                    self._watcher.start()
+                    logger.debug("Fee oracle watcher started")
+
+    def stop(self):
+        """Stops the watcher, waiting for a refresh in progress so it does not write after the oracle stopped"""
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+    def estimates(self, web3: Web3) -> dict[str, Any]:
+        """
+        Returns the cached estimates with their staleness: `age` in seconds and `blocks_behind` the newest head the
+        watcher saw. Only asks the node if no estimate is cached.
+        """
+        self._ensure_watcher(web3)
+        cached = self.cache.get_many([self.ESTIMATE_KEY, self.HEAD_KEY])
+        estimate = cached.get(self.ESTIMATE_KEY)
+        if estimate is None:
+            estimate = self.refresh(web3)
+        head = max(cached.get(self.HEAD_KEY, estimate["block_number"]), estimate["block_number"])
+        return dict(
+            estimate, age=round(time.time() - estimate["updated"], 3), blocks_behind=head - estimate["block_number"]
+        )
+
+    def gas_price(self, web3: Web3, tier: str) -> int:
+        return self.estimates(web3)["tiers"][tier]["gas_price"]
+
+    def stats(self) -> dict[str, Any]:
+        estimate = self.cache.get(self.ESTIMATE_KEY)
+        return dict(
+            refreshes=self._refreshes,
+            block_number=estimate["block_number"] if estimate else None,
+            age=round(time.time() - estimate["updated"], 3) if estimate else None,
+        )
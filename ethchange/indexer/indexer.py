@@ -0,0 +1,161 @@
+"""
+Indexer recording the ETH transfers of user addresses.
+"""
+from __future__ import annotations
+
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from django.db import transaction
+from loguru import logger
+from web3 import Web3
+
+from ethchange.rpc import batch_request
+from ethchange.user.index import AddressIndex
+
+
+class ReorgTooDeep(Exception):
+    """The chain diverged from the indexed blocks further back than the kept reorg window"""
+
+
+class TransactionIndexer:
+    """
+    Walks blocks from the last checkpoint to the node's head and records transfers touching a user address.
+
+    Block ranges are fetched concurrently through JSON-RPC batches but applied in order, one database transaction
+    per range. The hashes of the last `reorg_depth` blocks are kept; a block whose parent hash does not match the
+    indexed chain rolls the index back to the fork point before indexing resumes.
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        address_index: AddressIndex,
+        batch_size: int,
+        workers: int,
+        reorg_depth: int,
+        start_block: int,
+    ):
+        self._web3 = web3
+        self._address_index = address_index
+        self._batch_size = batch_size
+        self._workers = workers
+        self._reorg_depth = reorg_depth
+        self._start_block = start_block
+
+    @staticmethod
+    def checkpoint() -> Optional[int]:
+        from ethchange.indexer.models import IndexedBlock
+
+        block = IndexedBlock.objects.order_by("-number").first()
+        return block.number if block else None
+
+    def _fetch(self, numbers: range) -> list[dict[str, Any]]:
+        return batch_request(self._web3, [("eth_getBlockByNumber", [hex(number), True]) for number in numbers])
+
+    def _find_fork(self) -> int:
+        """Returns the newest indexed block number still on the node's chain"""
+        from ethchange.indexer.models import IndexedBlock
+
+        blocks = list(IndexedBlock.objects.order_by("-number").values_list("number", "hash"))
+        if not blocks:
+            raise ReorgTooDeep("No indexed block left to compare against")
+
+        node_blocks = self._fetch(range(blocks[-1][0], blocks[0][0] + 1))
+        node_hashes = {int(block["number"], 16): block["hash"] for block in node_blocks if block}
+        for number, block_hash in blocks:
+            if node_hashes.get(number) == block_hash:
+                return number
+        raise ReorgTooDeep(f"Chain diverged before block [{blocks[-1][0]}]")
+
+    def rollback(self, number: int):
+        """Removes every indexed block and transfer after block `number`"""
+        from ethchange.indexer.models import IndexedBlock, Transfer
+
+        with transaction.atomic():
+            Transfer.objects.filter(block_number__gt=number).delete()
+            IndexedBlock.objects.filter(number__gt=number).delete()
+        logger.warning(f"Transaction index rolled back to block [{number}]")
+
+    def _apply(self, blocks: list[Optional[dict[str, Any]]], parent_hash: Optional[str]) -> tuple[Optional[str], int]:
+        """
+        Stores `blocks` and their transfers, stopping at the first block missing on the node or not extending
+        `parent_hash`.
+
+        Returns the hash of the last stored block and the number of blocks stored.
+        """
+        from ethchange.indexer.models import IndexedBlock, Transfer
+
+        indexed_blocks, transfers = [], []
+        for block in blocks:
+            if block is None or (parent_hash is not None and block["parentHash"] != parent_hash):
+                break
+
+            number = int(block["number"], 16)
+            indexed_blocks.append(IndexedBlock(number=number, hash=block["hash"], parent_hash=block["parentHash"]))
+            # every address of the block is matched against the user index in one pass
+            matches = self._address_index.get_many(
+                {address for tx in block["transactions"] for address in (tx["from"], tx["to"]) if address}
+            )
+            for tx in block["transactions"]:
+                if tx["from"] in matches or tx["to"] in matches:
+                    transfers.append(
+                        Transfer(
+                            tx_hash=tx["hash"],
+                            block_number=number,
+                            block_hash=block["hash"],
+                            transaction_index=int(tx["transactionIndex"], 16),
+                            sender=tx["from"].lower(),
+                            receiver=(tx["to"] or "").lower(),
+                            value=int(tx["value"], 16),
+                        )
+                    )
+            parent_hash = block["hash"]
+
+        with transaction.atomic():
+            IndexedBlock.objects.bulk_create(indexed_blocks)
+            Transfer.objects.bulk_create(transfers)
+            if indexed_blocks:
+                IndexedBlock.objects.filter(number__lte=indexed_blocks[-1].number - self._reorg_depth).delete()
+
+        logger.opt(lazy=True).debug(f"[{len(indexed_blocks)}] Blocks indexed with [{len(transfers)}] transfers")
+        return parent_hash, len(indexed_blocks)
+
+    def sync(self) -> int:
+        """Indexes blocks up to the node's head, returns the new checkpoint"""
+        from ethchange.indexer.models import IndexedBlock
+
+        head = self._web3.eth.block_number
+        checkpoint = self.checkpoint()
+        if checkpoint is None:
+            start = head if self._start_block < 0 else self._start_block
+            parent_hash = None
+        else:
+            parent_hash = IndexedBlock.objects.get(number=checkpoint).hash
+            start = checkpoint + 1
+
+        self._address_index.refresh()
+        ranges = (
+            range(first, min(first + self._batch_size, head + 1)) for first in range(start, head + 1, self._batch_size)
+        )
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="indexer") as executor:
+            # ranges are fetched ahead concurrently, at most two per worker, but applied in chain order
+            pending = deque(
+                executor.submit(self._fetch, numbers) for numbers in itertools.islice(ranges, self._workers * 2)
+            )
+            while pending:
+                blocks = pending.popleft().result()
+                parent_hash, stored = self._apply(blocks, parent_hash)
+                if stored < len(blocks):
+                    for future in pending:
+                        future.cancel()
+                    # a block missing on the node just ends this pass, one not extending the chain is a reorg
+                    if blocks[stored] is not None:
+                        self.rollback(self._find_fork())
+                    break
+                for numbers in itertools.islice(ranges, 1):
+                    pending.append(executor.submit(self._fetch, numbers))
+
+        return self.checkpoint()
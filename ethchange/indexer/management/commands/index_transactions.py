@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from config import settings
+from ethchange import injector
+
+
+class Command(BaseCommand):
+    help = "Indexes the ETH transfers of user addresses, following the chain head"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Index up to the current head and exit")
+        parser.add_argument("--rollback-to", type=int, default=None, help="Drop everything indexed after this block")
+
+    def handle(self, *args, **options):
+        indexer = injector.transaction_indexer()
+        if options["rollback_to"] is not None:
+            indexer.rollback(options["rollback_to"])
+            return
+
+        while True:
+            checkpoint = indexer.sync()
+            self.stdout.write(f"Indexed up to block {checkpoint}")
+            if options["once"]:
+                return
+            time.sleep(settings.indexer_interval)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from django.db import models
+from rest_framework import serializers
+
+
+class WeiField(models.CharField):
+    """
+    Wei amount stored as a decimal string, read back as int.
+
+    Amounts reach 2**256 while SQLite keeps integers and decimals beyond 2**63 as 8 byte REAL, so they are stored as
+    text on every backend.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_length", 78)
+        super().__init__(*args, **kwargs)
+
+    def from_db_value(self, value: Optional[str], expression, connection) -> Optional[int]:
+        return None if value is None else int(value)
+
+    def to_python(self, value: Any) -> Optional[int]:
+        return None if value is None else int(value)
+
+    def get_prep_value(self, value: Any) -> Optional[str]:
+        return None if value is None else str(int(value))
+
+
+class IndexedBlock(models.Model):
+    """Recently indexed block, the newest one is the indexer checkpoint and their hashes are used to detect reorgs"""
+
+    number = models.BigIntegerField(primary_key=True)
+    hash = models.CharField(max_length=66, blank=False)
+    parent_hash = models.CharField(max_length=66, blank=False)
+
+
+class Transfer(models.Model):
+    """Transaction moving ETH from or to a user address"""
+
+    tx_hash = models.CharField(max_length=66, blank=False)
+    block_number = models.BigIntegerField(db_index=True)
+    block_hash = models.CharField(max_length=66, blank=False)
+    transaction_index = models.IntegerField()
+    # lowercase hex addresses, receiver is empty for contract creations
+    sender = models.CharField(max_length=42, db_index=True)
+    receiver = models.CharField(max_length=42, blank=True, default="", db_index=True)
+    value = WeiField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["tx_hash"], name="unique_transfer_tx_hash")]
+
+
+class TransferSerializer(serializers.ModelSerializer):
+    """
+    Transfer Serializer
+    """
+
+    class Meta:
+        model = Transfer
+        fields = [
+            "tx_hash",
+            "block_number",
+            "block_hash",
+            "transaction_index",
+            "sender",
+            "receiver",
+            "value",
+        ]
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from config import settings
+from ethchange import injector
+from ethchange.jobs.queue import JobWorker
+
+
+class Command(BaseCommand):
+    help = "Runs the background jobs queued by the user endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.jobs_workers)
+        parser.add_argument("--once", action="store_true", help="Runs the jobs ready now and exits")
+
+    def handle(self, *args, **options):
+        if settings.metrics_enabled:
+            injector.metrics_exporter().start()
+        worker = JobWorker(injector.job_queue(), workers=options["workers"], poll_interval=settings.jobs_poll_interval)
+        self.stdout.write(f"Running jobs on {options['workers']} workers")
+        try:
+            worker.run(once=options["once"])
+        except KeyboardInterrupt:
+            worker.stop()
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Slow node operation run in the background by the `run_jobs` workers, polled by clients at `jobs/{id}/`"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUSES = (QUEUED, RUNNING, SUCCEEDED, FAILED)
+
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    kind = models.CharField(max_length=32, blank=False)
+    # node serving the job, the number of running jobs per node is capped
+    node = models.CharField(max_length=256, blank=False)
+    # name of the user allowed to read the job, empty if holding the job id is enough
+    owner = models.CharField(max_length=128, blank=True, default="")
+    # encrypted arguments of the handler, they include passwords and are cleared once the job finished
+    payload = models.BinaryField(blank=True, default=b"")
+    status = models.CharField(max_length=16, choices=[(status, status) for status in STATUSES], default=QUEUED)
+    result = models.JSONField(null=True, default=None)
+    # state recorded by the handler while running, kept across attempts so a retried job resumes from it
+    progress = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default="")
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, default=None)
+    finished = models.DateTimeField(null=True, default=None)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"], name="job_status_run_after")]
+
+    def attempt(self) -> models.QuerySet[Job]:
+        """The job while it still runs the attempt of this instance, empty once it was queued and claimed again"""
+        return Job.objects.filter(pk=self.pk, status=Job.RUNNING, attempts=self.attempts)
+
+    def record(self, **progress) -> bool:
+        """
+        Saves progress of the running attempt for the attempts after it, False if the job was queued again and
+        claimed by another attempt since this one started.
+        """
+        self.progress = dict(self.progress, **progress)
+        return bool(self.attempt().update(progress=self.progress))
+
+
+class JobNode(models.Model):
+    """Node running jobs, its row is locked while jobs are claimed for it so its cap holds across workers"""
+
+    node = models.CharField(max_length=256, primary_key=True)
@@ -0,0 +1,234 @@
+"""
+Database backed job queue for slow node operations, run by the worker pool of `manage.py run_jobs`.
+"""
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Any, Callable
+
+from Crypto.Cipher import AES
+from django.conf import settings as django_settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from loguru import logger
+
+from ethchange.jobs.models import Job, JobNode
+
+
+def _key() -> bytes:
+    return hashlib.sha256(b"ethchange.jobs:" + django_settings.SECRET_KEY.encode("utf-8")).digest()
+
+
+def seal(payload: dict[str, Any]) -> bytes:
+    """Encrypts a job payload with AES-GCM under a key derived from the secret key"""
+    cipher = AES.new(_key(), AES.MODE_GCM)
+    ciphertext, tag = cipher.encrypt_and_digest(json.dumps(payload).encode("utf-8"))
+    return cipher.nonce + tag + ciphertext
+
+
+def unseal(sealed: bytes) -> dict[str, Any]:
+    sealed = bytes(sealed)
+    cipher = AES.new(_key(), AES.MODE_GCM, nonce=sealed[:16])
+    return json.loads(cipher.decrypt_and_verify(sealed[32:], sealed[16:32]))
+
+
+class JobQueue:
+    """
+    Queue of jobs stored in the `Job` table, shared by the processes enqueuing jobs and the `run_jobs` workers.
+
+    `handlers` maps a job kind to the dotted path of the callable running it, called with the job payload as keyword
+    arguments, and the running job as `job` if it takes one, and returning a JSON serializable result. A `ValueError`
+    fails the job at once, as the node or the handler rejected it; any other error is retried up to `max_attempts`
+    times, after `retry_backoff` seconds doubled per attempt and capped at `retry_max_delay`. At most
+    `node_concurrency` jobs run at once against one node across all workers, and jobs still running after `timeout`
+    seconds are queued again as their worker is presumed dead. An attempt only records its outcome while no later
+    attempt claimed the job; handlers with effects on the node record them with `Job.record`, so a job queued again
+    while its first attempt still runs does not repeat them.
+    """
+
+    def __init__(
+        self,
+        handlers: dict[str, str],
+        node: str,
+        node_concurrency: int,
+        max_attempts: int,
+        retry_backoff: float,
+        retry_max_delay: float,
+        timeout: float,
+        retention: float,
+    ):
+        self._handlers = handlers
+        self._node = node
+        self._node_concurrency = node_concurrency
+        self._max_attempts = max_attempts
+        self._retry_backoff = retry_backoff
+        self._retry_max_delay = retry_max_delay
+        self._timeout = timeout
+        self._retention = retention
+        self._counters = dict(enqueued=0, claimed=0, succeeded=0, failed=0, retried=0, requeued=0, pruned=0)
+        self._counters_lock = threading.Lock()
+
+    def _count(self, counter: str, value: int = 1):
+        with self._counters_lock:
+            self._counters[counter] += value
+
+    def enqueue(self, kind: str, payload: dict[str, Any], owner: str = "") -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind [{kind}]")
+        job = Job.objects.create(kind=kind, node=self._node, owner=owner, payload=seal(payload))
+        self._count("enqueued")
+        logger.opt(lazy=True).debug(f"[{job.pk}] Job [{kind}] queued")
+        return job
+
+    def claim(self, limit: int) -> list[Job]:
+        """
+        Marks up to `limit` queued jobs whose retry delay elapsed as running and returns them, skipping the jobs of
+        nodes already running `node_concurrency` jobs. Queued jobs locked by another claiming worker are skipped, and
+        the claims for one node wait on its `JobNode` row so the running jobs counted for it cannot change until the
+        claim commits.
+        """
+        now = timezone.now()
+        claimed = []
+        with transaction.atomic():
+            ready = Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED, run_after__lte=now)
+            ready = list(ready.order_by("run_after").values_list("pk", "node")[: limit * 4])
+            nodes = sorted({node for _, node in ready})
+            JobNode.objects.bulk_create([JobNode(node=node) for node in nodes], ignore_conflicts=True)
+            list(JobNode.objects.select_for_update().filter(node__in=nodes).order_by("node"))
+            running = Job.objects.filter(status=Job.RUNNING, node__in=nodes)
+            running = dict(running.values_list("node").annotate(count=Count("pk")))
+            for pk, node in ready:
+                if len(claimed) >= limit:
+                    break
+                if running.get(node, 0) >= self._node_concurrency:
+                    continue
+                updated = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+                    status=Job.RUNNING, started=now, attempts=F("attempts") + 1
+                )
+                if updated:
+                    running[node] = running.get(node, 0) + 1
+                    claimed.append(pk)
+        self._count("claimed", len(claimed))
+        return list(Job.objects.filter(pk__in=claimed).order_by("run_after"))
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: str = ""):
+        finished = job.attempt().update(status=status, result=result, error=error, finished=timezone.now(), payload=b"")
+        if not finished:
+            logger.warning(f"[{job.pk}] Job [{job.kind}] attempt [{job.attempts}] was superseded")
+            return
+        self._count("succeeded" if status == Job.SUCCEEDED else "failed")
+
+    def run(self, job: Job):
+        """Runs a claimed job and records its result, its failure or its next attempt"""
+        handler: Callable[..., Any] = import_string(self._handlers[job.kind])
+        kwargs = unseal(job.payload)
+        if "job" in inspect.signature(handler).parameters:
+            kwargs["job"] = job
+        try:
+            result = handler(**kwargs)
+        except ValueError as error:
+            logger.info(f"[{job.pk}] Job [{job.kind}] rejected: {error}")
+            self._finish(job, Job.FAILED, error=str(error))
+        except Exception as error:  # pylint: disable=broad-except
+            if job.attempts >= self._max_attempts:
+                logger.warning(f"[{job.pk}] Job [{job.kind}] failed after [{job.attempts}] attempts: {error}")
+                self._finish(job, Job.FAILED, error=str(error))
+                return
+            delay = min(self._retry_backoff * 2 ** (job.attempts - 1), self._retry_max_delay)
+            retried = job.attempt().update(
+                status=Job.QUEUED, run_after=timezone.now() + timedelta(seconds=delay), error=str(error)
+            )
+            self._count("retried", retried)
+            logger.opt(lazy=True).debug(f"[{job.pk}] Job [{job.kind}] retried in [{delay}]s: {error}")
+        else:
+            self._finish(job, Job.SUCCEEDED, result=result)
+            logger.opt(lazy=True).debug(f"[{job.pk}] Job [{job.kind}] succeeded")
+
+    def maintain(self):
+        """Queues the jobs of dead workers again and deletes the jobs finished longer than `retention` seconds ago"""
+        now = timezone.now()
+        requeued = Job.objects.filter(status=Job.RUNNING, started__lt=now - timedelta(seconds=self._timeout)).update(
+            status=Job.QUEUED, run_after=now
+        )
+        pruned, _ = Job.objects.filter(
+            status__in=(Job.SUCCEEDED, Job.FAILED), finished__lt=now - timedelta(seconds=self._retention)
+        ).delete()
+        self._count("requeued", requeued)
+        self._count("pruned", pruned)
+        if requeued:
+            logger.warning(f"[{requeued}] Jobs of dead workers queued again")
+
+    def depths(self) -> dict[str, Any]:
+        """Jobs per status, queued jobs ready to run and the age of the oldest of them, running jobs per node"""
+        now = timezone.now()
+        statuses = dict(Job.objects.values_list("status").annotate(count=Count("pk")))
+        ready = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).aggregate(
+            count=Count("pk"), oldest=Min("created")
+        )
+        running = dict(Job.objects.filter(status=Job.RUNNING).values_list("node").annotate(count=Count("pk")))
+        return dict(
+            statuses={status: statuses.get(status, 0) for status in Job.STATUSES},
+            ready=ready["count"],
+            oldest_ready_age=round((now - ready["oldest"]).total_seconds(), 3) if ready["oldest"] else 0.0,
+            running_per_node=running,
+        )
+
+    def stats(self) -> dict[str, Any]:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return dict(counters, **self.depths())
+
+
+class JobWorker:
+    """
+    Runs claimed jobs on `workers` threads, claiming as many jobs as threads are idle and polling the queue every
+    `poll_interval` seconds while nothing can be claimed.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int, poll_interval: float, maintenance_interval: float = 30.0):
+        self._queue = queue
+        self._workers = workers
+        self._poll_interval = poll_interval
+        self._maintenance_interval = maintenance_interval
+        self._stopped = threading.Event()
+
+    def _run(self, job: Job):
+        try:
+            self._queue.run(job)
+        except Exception:  # pylint: disable=broad-except
+            logger.opt(exception=True).error(f"[{job.pk}] Job [{job.kind}] could not be recorded")
+        finally:
+            close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self, once: bool = False):
+        """Runs jobs until stopped, or with `once` until no queued job is ready and every claimed job finished"""
+        in_flight: set[Future] = set()
+        next_maintenance = 0.0
+        with ThreadPoolExecutor(self._workers, thread_name_prefix="job-worker") as executor:
+            while not self._stopped.is_set():
+                if time.monotonic() >= next_maintenance:
+                    self._queue.maintain()
+                    next_maintenance = time.monotonic() + self._maintenance_interval
+
+                idle = self._workers - len(in_flight)
+                jobs = self._queue.claim(idle) if idle else []
+                in_flight.update(executor.submit(self._run, job) for job in jobs)
+                if once and not in_flight:
+                    return
+                if not jobs:
+                    if in_flight:
+                        wait(in_flight, timeout=self._poll_interval, return_when=FIRST_COMPLETED)
+                    else:
+                        self._stopped.wait(self._poll_interval)
+                in_flight = {future for future in in_flight if not future.done()}
@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+from django.urls import path
+
+from ethchange.jobs.views import job_status
+
+urlpatterns = (path("jobs/<uuid:pk>/", job_status, name="job-status"),)
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from ethchange.jobs.models import Job
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@permission_classes([AllowAny])
+def job_status(request: Request, pk: Optional[str] = None) -> Response:
+    """Status of a background job, with its result once it succeeded or its error once it failed"""
+    job = Job.objects.filter(pk=pk).defer("payload").first()
+    if job is None or (job.owner and not request.user.is_staff and request.user.get_username() != job.owner):
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    data = dict(
+        id=str(job.pk),
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        created=job.created,
+        started=job.started,
+        finished=job.finished,
+    )
+    if job.status == Job.SUCCEEDED:
+        data["result"] = job.result
+    if job.error:
+        data["error"] = job.error
+    return Response(data=data, status=status.HTTP_200_OK)
@@ -0,0 +1,147 @@
+"""
+Helpers for the V3 keystore files of the geth keystore directory.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from Crypto.Cipher import AES
+from Crypto.Protocol.KDF import scrypt
+from django.conf import settings as django_settings
+from eth_account import Account
+from eth_utils import keccak
+
+# scrypt block size and parallelism geth uses for its keystore files
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+
+
+def keyfile_path(keystore_dir: Path, address: str) -> Optional[Path]:
+    """Returns the keystore file of `address`, geth names them `UTC--<created>--<address without 0x>`"""
+    address = address.lower().removeprefix("0x")
+    return next(Path(keystore_dir).glob(f"UTC--*--{address}"), None)
+
+
+def keyfile_name(address: str, created: datetime) -> str:
+    """Returns the file name geth gives the keystore file of `address`"""
+    created = created.astimezone(timezone.utc)
+    return f"UTC--{created:%Y-%m-%dT%H-%M-%S}.{created.microsecond * 1000:09d}Z--{address.lower().removeprefix('0x')}"
+
+
+def dump_keyfile(keyfile: dict) -> str:
+    """Serializes `keyfile` the way geth does: compact, in geth's field order, with sorted kdfparams"""
+    crypto = keyfile.get("crypto") or keyfile["Crypto"]
+    return json.dumps(
+        dict(
+            address=keyfile["address"].lower().removeprefix("0x"),
+            crypto=dict(
+                cipher=crypto["cipher"],
+                ciphertext=crypto["ciphertext"],
+                cipherparams=crypto["cipherparams"],
+                kdf=crypto["kdf"],
+                kdfparams=dict(sorted(crypto["kdfparams"].items())),
+                mac=crypto["mac"],
+            ),
+            id=keyfile["id"],
+            version=keyfile["version"],
+        ),
+        separators=(",", ":"),
+    )
+
+
+def encrypt_keyfile(private_key: bytes, password: str, scrypt_n: int) -> dict:
+    """Encrypts `private_key` into a V3 keystore dict with the same scrypt parameters and cipher as geth"""
+    salt = os.urandom(32)
+    iv = os.urandom(16)
+    derived_key = scrypt(password.encode("utf-8"), salt, SCRYPT_DKLEN, N=scrypt_n, r=SCRYPT_R, p=SCRYPT_P)
+    ciphertext = AES.new(derived_key[:16], AES.MODE_CTR, nonce=b"", initial_value=iv).encrypt(private_key)
+    return dict(
+        address=Account.from_key(private_key).address,
+        crypto=dict(
+            cipher="aes-128-ctr",
+            ciphertext=ciphertext.hex(),
+            cipherparams=dict(iv=iv.hex()),
+            kdf="scrypt",
+            kdfparams=dict(dklen=SCRYPT_DKLEN, n=scrypt_n, p=SCRYPT_P, r=SCRYPT_R, salt=salt.hex()),
+            mac=keccak(derived_key[16:32] + ciphertext).hex(),
+        ),
+        id=str(uuid.uuid4()),
+        version=3,
+    )
+
+
+def write_keyfile(path: Path, keyfile: dict):
+    """
+    Atomically writes `keyfile` to `path`.
+
+    The temporary file is a dotfile, which geth skips while scanning the keystore directory.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=path.parent)
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        file.write(dump_keyfile(keyfile))
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+
+
+def reencrypt_keyfile(path: Path, password: str, new_password: str):
+    """Re-encrypts the keystore file at `path` under `new_password`, keeping its scrypt parameters"""
+    with open(path, encoding="utf-8") as file:
+        keyfile = json.load(file)
+
+    private_key = Account.decrypt(keyfile, password)
+    kdfparams = (keyfile.get("crypto") or keyfile["Crypto"])["kdfparams"]
+    new_keyfile = encrypt_keyfile(private_key, new_password, kdfparams["n"])
+    new_keyfile["id"] = keyfile.get("id", new_keyfile["id"])
+    write_keyfile(path, new_keyfile)
+
+
+def create_keyfile(keystore_dir: str, password: str, scrypt_n: int) -> str:
+    """Generates a key, writes it to `keystore_dir` as a geth V3 keystore file and returns its address"""
+    private_key = os.urandom(32)
+    keyfile = encrypt_keyfile(private_key, password, scrypt_n)
+    write_keyfile(Path(keystore_dir) / keyfile_name(keyfile["address"], datetime.now(timezone.utc)), keyfile)
+    return keyfile["address"]
+
+
+class KeystoreGenerator:
+    """
+    Creates accounts by writing keystore files straight into the node's keystore directory.
+
+    The scrypt key derivation runs in a process pool so bulk account creation uses every core, geth picks the new
+    files up by watching the directory.
+    """
+
+    def __init__(self, keystore_dir: str, scrypt_n: int, workers: int):
+        self._keystore_dir = str(keystore_dir).format(base_dir=django_settings.BASE_DIR)
+        self._scrypt_n = scrypt_n
+        self._workers = workers or None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # spawned workers do not inherit the locks and threads of the server process
+                    self._executor = ProcessPoolExecutor(self._workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, password: str) -> Future[str]:
+        return self.executor.submit(create_keyfile, self._keystore_dir, password, self._scrypt_n)
+
+    def generate(self, password: str) -> str:
+        return self.submit(password).result()
+
+    def generate_many(self, passwords: Iterable[str]) -> list[str]:
+        return [future.result() for future in [self.submit(password) for password in passwords]]
@@ -0,0 +1,143 @@
+"""
+Loguru sinks configured from the LOG_* settings, and rate limited logging for call sites hit on every request.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from config import settings
+
+FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}"
+
+
+def rotation(max_bytes: int, at: str) -> Callable[[Any, Any], bool]:
+    """
+    Rotation check of a file sink, starting a new file once it would grow past `max_bytes` or once the time of day
+    `at` ("HH:MM") passed; either is disabled by 0 or "".
+    """
+    next_time: list[Optional[datetime]] = [None]
+
+    def rollover(now: datetime) -> datetime:
+        hour, minute = map(int, at.split(":"))
+        rollover_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return rollover_at if rollover_at > now else rollover_at + timedelta(days=1)
+
+    def should_rotate(message: Any, file: Any) -> bool:
+        if max_bytes and file.tell() + len(message) > max_bytes:
+            return True
+        if at:
+            now = datetime.now()
+            if next_time[0] is None:
+                next_time[0] = rollover(now)
+            elif now >= next_time[0]:
+                next_time[0] = rollover(now)
+                return True
+        return False
+
+    return should_rotate
+
+
+def configure_logging(base_dir: Path) -> list[int]:
+    """
+    Replaces the loguru handlers with the console and file sinks of the LOG_* settings, returns their handler ids.
+
+    With LOG_ENQUEUE the sinks are written by loguru's queue worker thread, a log call only formats and queues the
+    record. Records below the level of their module in LOG_LEVELS are dropped before they are formatted. No sink is
+    added when LOG_LEVELS silences every module.
+    """
+    levels = dict(settings.log_levels)
+    logger.remove()
+    handlers = []
+    # modules missing from LOG_LEVELS are logged unless the "" entry silences them
+    if "" in levels and not any(levels.values()):
+        return handlers
+
+    # the lowest configured level, records under it are discarded by loguru without building them
+    level = min((logger.level(name).no for name in levels.values() if name), default=logger.level("DEBUG").no)
+    options = dict(level=level, filter=levels, enqueue=settings.log_enqueue, serialize=settings.log_json)
+
+    if settings.log_console:
+        handlers.append(logger.add(sys.stderr, format=FORMAT, **options))
+    if settings.log_file:
+        path = Path(settings.log_file.format(base_dir=base_dir))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(
+            logger.add(
+                path,
+                format=FORMAT,
+                rotation=rotation(settings.log_rotation_bytes, settings.log_rotation_time),
+                retention=settings.log_retention or None,
+                compression=settings.log_compression or None,
+                **options,
+            )
+        )
+    return handlers
+
+
+class RateLimitedLogger:
+    """
+    Logs at most `limit` messages every `interval` seconds for one call site and drops the rest.
+
+    The first message of the next interval carries the number of messages dropped in between as `dropped`, bound to
+    the record and appended to the message.
+    """
+
+    def __init__(self, site: str, limit: int, interval: float):
+        self.site = site
+        self._limit = limit
+        self._interval = interval
+        self._window = 0.0
+        self._logged = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def _admit(self) -> Optional[int]:
+        """Returns None to drop the message, or the number of messages dropped since the last one logged"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window >= self._interval:
+                self._window, self._logged = now, 0
+            if self._logged >= self._limit:
+                self._dropped += 1
+                return None
+            self._logged += 1
+            dropped, self._dropped = self._dropped, 0
+            return dropped
+
+    def log(self, level: str, message: str, *args, depth: int = 0, **kwargs):
+        dropped = self._admit()
+        if dropped is None:
+            return
+        if dropped:
+            message = f"{message} ([{dropped}] similar messages dropped)"
+        logger.opt(depth=depth + 1).bind(site=self.site, dropped=dropped).log(level, message, *args, **kwargs)
+
+    def debug(self, message: str, *args, **kwargs):
+        self.log("DEBUG", message, *args, depth=1, **kwargs)
+
+    def info(self, message: str, *args, **kwargs):
+        self.log("INFO", message, *args, depth=1, **kwargs)
+
+    def warning(self, message: str, *args, **kwargs):
+        self.log("WARNING", message, *args, depth=1, **kwargs)
+
+
+_rate_limited: dict[str, RateLimitedLogger] = dict()
+_rate_limited_lock = threading.Lock()
+
+
+def rate_limited(site: str) -> RateLimitedLogger:
+    """Shared `RateLimitedLogger` of `site`, limited by its LOG_RATE_LIMITS entry or LOG_RATE_LIMIT"""
+    if site not in _rate_limited:
+        with _rate_limited_lock:
+            if site not in _rate_limited:
+                limit, interval = settings.log_rate_limits.get(site, settings.log_rate_limit)
+                _rate_limited[site] = RateLimitedLogger(site, limit, interval)
+    return _rate_limited[site]
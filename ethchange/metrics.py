@@ -0,0 +1,516 @@
+"""
+Request metrics collected by a middleware and written to InfluxDB from a background thread.
+"""
+from __future__ import annotations
+
+import bisect
+import copy
+import itertools
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+import requests
+from asgiref.sync import iscoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from loguru import logger
+
+if TYPE_CHECKING:
+    from web3 import Web3
+    from web3.types import RPCEndpoint, RPCResponse
+
+    from ethchange.admission import AdmissionController, NodeLimiter
+    from ethchange.jobs.queue import JobQueue
+
+# [query count, query seconds] of the request running in the current context, copied into sync_to_async threads
+_query_stats: ContextVar[Optional[list]] = ContextVar("query_stats", default=None)
+
+
+def _record_query(execute: Callable, sql: str, params: Any, many: bool, context: dict) -> Any:
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def _install_query_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _escape_tag(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+class MetricsRegistry:
+    """
+    Thread safe aggregation of request metrics between two exports.
+
+    Requests only update counters under a lock; `snapshot` hands the counters of the elapsed interval to the exporter
+    and starts a new interval.
+    """
+
+    def __init__(self, latency_buckets: list[float]):
+        self._buckets = sorted(latency_buckets)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._reset()
+
+    def _reset(self):
+        self._statuses: defaultdict[tuple[str, str, int], int] = defaultdict(int)
+        # per endpoint: one count per latency bucket plus +Inf, latency sum, request count, query count, query seconds
+        self._endpoints: dict[tuple[str, str], list] = dict()
+        self._max_in_flight = self._in_flight
+
+    @property
+    def buckets(self) -> list[float]:
+        return self._buckets
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def start_request(self):
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+    def finish_request(self, method: str, route: str, status: int, latency_ms: float, queries: int, query_time: float):
+        with self._lock:
+            self._in_flight -= 1
+            self._statuses[(method, route, status)] += 1
+            endpoint = self._endpoints.get((method, route))
+            if endpoint is None:
+                endpoint = self._endpoints[(method, route)] = [[0] * (len(self._buckets) + 1), 0.0, 0, 0, 0.0]
+            endpoint[0][bisect.bisect_left(self._buckets, latency_ms)] += 1
+            endpoint[1] += latency_ms
+            endpoint[2] += 1
+            endpoint[3] += queries
+            endpoint[4] += query_time
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            snapshot = dict(
+                statuses=self._statuses,
+                endpoints=self._endpoints,
+                in_flight=self._in_flight,
+                max_in_flight=self._max_in_flight,
+            )
+            self._reset()
+        return snapshot
+
+
+# transport details of the JSON-RPC call being instrumented in the current context, filled in by the providers
+rpc_transport: ContextVar[Optional[dict[str, Any]]] = ContextVar("rpc_transport", default=None)
+
+
+def note_transport(retries: int = 0, **details):
+    """Records which node served the instrumented call, the payload sizes and the number of retries"""
+    transport = rpc_transport.get()
+    if transport is not None:
+        transport["retries"] += retries
+        transport.update(details)
+
+
+class RpcMetrics:
+    """
+    Thread safe totals of the JSON-RPC calls made per method and node since the process started.
+
+    `snapshot` returns what changed since the previous snapshot, so the exporter writes the same per interval values
+    as for requests while `stats` keeps reporting process totals.
+    """
+
+    FIELDS = ("count", "errors", "retries", "latency_sum", "latency_max", "request_bytes", "response_bytes")
+
+    def __init__(self, latency_buckets: list[float]):
+        self._buckets = sorted(latency_buckets)
+        self._lock = threading.Lock()
+        # per (method, node): one count per latency bucket plus +Inf, then FIELDS
+        self._calls: dict[tuple[str, str], list] = dict()
+        self._exported: dict[tuple[str, str], list] = dict()
+
+    @property
+    def buckets(self) -> list[float]:
+        return self._buckets
+
+    def record(
+        self,
+        method: str,
+        node: str,
+        latency_ms: float,
+        request_bytes: int,
+        response_bytes: int,
+        failed: bool,
+        retries: int,
+    ):
+        with self._lock:
+            call = self._calls.get((method, node))
+            if call is None:
+                call = self._calls[(method, node)] = [[0] * (len(self._buckets) + 1), 0, 0, 0, 0.0, 0.0, 0, 0]
+            call[0][bisect.bisect_left(self._buckets, latency_ms)] += 1
+            call[1] += 1
+            call[2] += failed
+            call[3] += retries
+            call[4] += latency_ms
+            call[5] = max(call[5], latency_ms)
+            call[6] += request_bytes
+            call[7] += response_bytes
+
+    def snapshot(self) -> dict[tuple[str, str], list]:
+        with self._lock:
+            calls = copy.deepcopy(self._calls)
+        deltas = dict()
+        for key, call in calls.items():
+            exported = self._exported.get(key)
+            if exported is None:
+                deltas[key] = call
+            elif call[1] != exported[1]:
+                deltas[key] = [
+                    [count - exported_count for count, exported_count in zip(call[0], exported[0])],
+                    *(value - exported_value for value, exported_value in zip(call[1:5], exported[1:5])),
+                    # the maximum is not additive, the process maximum is reported as is
+                    call[5],
+                    *(value - exported_value for value, exported_value in zip(call[6:], exported[6:])),
+                ]
+        self._exported = calls
+        return deltas
+
+    def stats(self) -> dict[str, dict[str, dict[str, Any]]]:
+        with self._lock:
+            calls = copy.deepcopy(self._calls)
+        stats = defaultdict(dict)
+        for (method, node), (buckets, *values) in calls.items():
+            call = dict(zip(self.FIELDS, values))
+            call["error_rate"] = call["errors"] / call["count"]
+            call["latency_avg"] = call.pop("latency_sum") / call["count"]
+            call["latency_buckets"] = dict(zip([*map(str, self._buckets), "inf"], buckets))
+            stats[method][node] = call
+        return stats
+
+
+class RpcMetricsMiddleware:
+    """
+    Web3 middleware timing every JSON-RPC call into `RpcMetrics`.
+
+    It is injected as the innermost middleware so the timings leave out the request and result formatting of the
+    other middlewares. Calls taking `slow_call_ms` or longer are logged, 0 disables the log.
+    """
+
+    def __init__(self, metrics: RpcMetrics, slow_call_ms: float):
+        self.metrics = metrics
+        self._slow_call_ms = slow_call_ms
+
+    def _record(self, method: str, w3: Web3, transport: dict[str, Any], latency_ms: float, failed: bool):
+        node = transport.get("node") or getattr(w3.provider, "endpoint_uri", None) or str(w3.provider)
+        self.metrics.record(
+            method,
+            node,
+            latency_ms,
+            transport["request_bytes"],
+            transport["response_bytes"],
+            failed,
+            transport["retries"],
+        )
+        if self._slow_call_ms and latency_ms >= self._slow_call_ms:
+            logger.warning(f"Slow JSON-RPC call [{method}] on [{node}] took [{latency_ms:.1f}] ms")
+
+    def call(self, method: str, w3: Web3, send: Callable[[], Any]) -> Any:
+        """Runs `send`, which makes the JSON-RPC call `method`, and records it"""
+        transport = dict(request_bytes=0, response_bytes=0, retries=0)
+        token = rpc_transport.set(transport)
+        started, failed = time.perf_counter(), True
+        try:
+            response = send()
+            failed = isinstance(response, dict) and "error" in response
+            return response
+        finally:
+            rpc_transport.reset(token)
+            self._record(method, w3, transport, (time.perf_counter() - started) * 1000, failed)
+
+    async def acall(self, method: str, w3: Web3, send: Callable[[], Awaitable[Any]]) -> Any:
+        transport = dict(request_bytes=0, response_bytes=0, retries=0)
+        token = rpc_transport.set(transport)
+        started, failed = time.perf_counter(), True
+        try:
+            response = await send()
+            failed = isinstance(response, dict) and "error" in response
+            return response
+        finally:
+            rpc_transport.reset(token)
+            self._record(method, w3, transport, (time.perf_counter() - started) * 1000, failed)
+
+    def __call__(self, make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3) -> Callable:
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            return self.call(method, w3, lambda: make_request(method, params))
+
+        return middleware
+
+    async def async_middleware(
+        self, make_request: Callable[[RPCEndpoint, Any], Awaitable[RPCResponse]], w3: Web3
+    ) -> Callable:
+        async def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            return await self.acall(method, w3, lambda: make_request(method, params))
+
+        return middleware
+
+
+def instrumented_web3(
+    provider: Any, middleware: Optional[RpcMetricsMiddleware], limiter: Optional[NodeLimiter] = None, **kwargs
+) -> Web3:
+    """
+    Builds a `Web3` client with `middleware` as its innermost middleware and `limiter` right outside of it, when given
+    """
+    from web3 import Web3
+    from web3.providers.async_base import AsyncBaseProvider
+
+    w3 = Web3(provider, **kwargs)
+    if limiter is not None:
+        if isinstance(provider, AsyncBaseProvider):
+            w3.middleware_onion.inject(limiter.async_middleware, name="node_limiter", layer=0)
+        else:
+            w3.middleware_onion.inject(limiter, name="node_limiter", layer=0)
+    if middleware is not None:
+        if isinstance(provider, AsyncBaseProvider):
+            w3.middleware_onion.inject(middleware.async_middleware, name="rpc_metrics", layer=0)
+        else:
+            w3.middleware_onion.inject(middleware, name="rpc_metrics", layer=0)
+    return w3
+
+
+class InfluxExporter:
+    """
+    Writes the registry to InfluxDB v2 in line protocol every `interval` seconds from a daemon thread.
+
+    Lines wait in a buffer of at most `buffer_size` lines and are written `batch_size` at a time; while InfluxDB is
+    unreachable the oldest lines are dropped, so requests never wait on the metrics backend.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        rpc_metrics: RpcMetrics,
+        url: str,
+        org: str,
+        bucket: str,
+        token: str,
+        interval: float,
+        batch_size: int,
+        buffer_size: int,
+        timeout: float,
+        job_queue: Optional[JobQueue] = None,
+        admission: Optional[AdmissionController] = None,
+        node_limiter: Optional[NodeLimiter] = None,
+    ):
+        self._registry = registry
+        self._rpc_metrics = rpc_metrics
+        self._job_queue = job_queue
+        self._admission = admission
+        self._node_limiter = node_limiter
+        self._write_url = f"{url.rstrip('/')}/api/v2/write"
+        self._params = dict(org=org, bucket=bucket, precision="ms")
+        self._interval = interval
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._buffer: deque[str] = deque(maxlen=buffer_size)
+        self._session = requests.Session()
+        self._session.headers.update({"Authorization": f"Token {token}", "Content-Type": "text/plain; charset=utf-8"})
+        self._host = _escape_tag(socket.gethostname())
+        self._counters = dict(written=0, dropped=0, failures=0)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def lines(self, snapshot: dict[str, Any], timestamp: int) -> list[str]:
+        """Formats a registry snapshot as line protocol"""
+        lines = [
+            f"http_in_flight,host={self._host} value={snapshot['in_flight']}i,max={snapshot['max_in_flight']}i "
+            f"{timestamp}"
+        ]
+        for (method, route, status), count in snapshot["statuses"].items():
+            lines.append(
+                f"http_requests,host={self._host},method={method},route={_escape_tag(route)},status={status} "
+                f"count={count}i {timestamp}"
+            )
+        for (method, route), (buckets, latency_sum, count, queries, query_time) in snapshot["endpoints"].items():
+            cumulative, fields = 0, []
+            for bound, bucket_count in zip([*self._registry.buckets, "inf"], buckets):
+                cumulative += bucket_count
+                fields.append(f"le_{bound}={cumulative}i")
+            lines.append(
+                f"http_latency,host={self._host},method={method},route={_escape_tag(route)} "
+                f"{','.join(fields)},sum={latency_sum},count={count}i,db_queries={queries}i,db_time={query_time} "
+                f"{timestamp}"
+            )
+        return lines
+
+    def rpc_lines(self, snapshot: dict[tuple[str, str], list], timestamp: int) -> list[str]:
+        """Formats a JSON-RPC metrics snapshot as line protocol"""
+        lines = []
+        for (method, node), (
+            buckets,
+            count,
+            errors,
+            retries,
+            latency_sum,
+            latency_max,
+            sent,
+            received,
+        ) in snapshot.items():
+            cumulative, fields = 0, []
+            for bound, bucket_count in zip([*self._rpc_metrics.buckets, "inf"], buckets):
+                cumulative += bucket_count
+                fields.append(f"le_{bound}={cumulative}i")
+            lines.append(
+                f"rpc_calls,host={self._host},method={_escape_tag(method)},node={_escape_tag(node)} "
+                f"{','.join(fields)},sum={latency_sum},max={latency_max},count={count}i,errors={errors}i,"
+                f"retries={retries}i,request_bytes={sent}i,response_bytes={received}i {timestamp}"
+            )
+        return lines
+
+    def job_lines(self, depths: dict[str, Any], timestamp: int) -> list[str]:
+        """Formats the job queue depths as line protocol"""
+        statuses = ",".join(f"{status}={count}i" for status, count in depths["statuses"].items())
+        lines = [
+            f"job_queue,host={self._host} {statuses},ready={depths['ready']}i,"
+            f"oldest_ready_age={depths['oldest_ready_age']} {timestamp}"
+        ]
+        for node, running in depths["running_per_node"].items():
+            lines.append(f"job_queue_node,host={self._host},node={_escape_tag(node)} running={running}i {timestamp}")
+        return lines
+
+    def admission_lines(
+        self, admission: Optional[dict[str, Any]], node_limiter: Optional[dict[str, Any]], timestamp: int
+    ) -> list[str]:
+        """Formats the admitted and shed requests and the node slot usage as line protocol, both are running totals"""
+        lines = []
+        for group, counters in (admission or dict()).get("groups", dict()).items():
+            fields = ",".join(f"{name}={count}i" for name, count in counters.items())
+            lines.append(f"admission,host={self._host},group={_escape_tag(group)} {fields} {timestamp}")
+        if node_limiter is not None:
+            lines.append(
+                f"node_slots,host={self._host} in_flight={node_limiter['in_flight']}i,"
+                f"max_in_flight={node_limiter['max_in_flight']}i,calls={node_limiter['calls']}i,"
+                f"queued={node_limiter['queued']}i,shed={node_limiter['shed']}i,wait_ms={node_limiter['wait_ms']} "
+                f"{timestamp}"
+            )
+        return lines
+
+    def collect(self):
+        """Moves the registry counters of the elapsed interval into the buffer"""
+        timestamp = int(time.time() * 1000)
+        lines = [
+            *self.lines(self._registry.snapshot(), timestamp),
+            *self.rpc_lines(self._rpc_metrics.snapshot(), timestamp),
+        ]
+        if self._job_queue is not None:
+            lines.extend(self.job_lines(self._job_queue.depths(), timestamp))
+        if self._admission is not None or self._node_limiter is not None:
+            lines.extend(
+                self.admission_lines(
+                    self._admission.stats() if self._admission is not None else None,
+                    self._node_limiter.stats() if self._node_limiter is not None else None,
+                    timestamp,
+                )
+            )
+        # the bounded deque discards the oldest lines on overflow
+        self._counters["dropped"] += max(len(self._buffer) + len(lines) - self._buffer.maxlen, 0)
+        self._buffer.extend(lines)
+
+    def flush(self) -> bool:
+        """Writes the buffer in batches, returns False and keeps the unwritten lines if InfluxDB fails"""
+        while self._buffer:
+            batch = list(itertools.islice(self._buffer, self._batch_size))
+            try:
+                response = self._session.post(
+                    self._write_url, params=self._params, data="\n".join(batch).encode("utf-8"), timeout=self._timeout
+                )
+                response.raise_for_status()
+            except requests.RequestException as error:
+                self._counters["failures"] += 1
+                logger.warning(f"Metrics export to InfluxDB failed, [{len(self._buffer)}] lines buffered: {error}")
+                return False
+            for _ in batch:
+                self._buffer.popleft()
+            self._counters["written"] += len(batch)
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.collect()
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.opt(exception=True).error("Metrics exporter failed")
+
+    def start(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+                    self._thread.start()
+                    logger.debug("Metrics exporter started")
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._counters, buffered=len(self._buffer), in_flight=self._registry.in_flight)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response: Callable) -> Callable:
+    """Records latency, status, database queries and in-flight count of every request"""
+    from ethchange import injector
+
+    registry: MetricsRegistry = injector.metrics_registry()
+    injector.metrics_exporter().start()
+    connection_created.connect(_install_query_recorder, dispatch_uid="ethchange.metrics")
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(None, connection)
+
+    def finish(request: HttpRequest, status: int, started: float, query_stats: list):
+        match = request.resolver_match
+        route = match.route if match is not None else "unresolved"
+        latency_ms = (time.perf_counter() - started) * 1000
+        registry.finish_request(request.method, route, status, latency_ms, query_stats[0], query_stats[1])
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request: HttpRequest) -> HttpResponse:
+            query_stats, status = [0, 0.0], 500
+            token = _query_stats.set(query_stats)
+            registry.start_request()
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                finish(request, status, started, query_stats)
+                _query_stats.reset(token)
+
+    else:
+
+        def middleware(request: HttpRequest) -> HttpResponse:
+            query_stats, status = [0, 0.0], 500
+            token = _query_stats.set(query_stats)
+            registry.start_request()
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                finish(request, status, started, query_stats)
+                _query_stats.reset(token)
+
+    return middleware
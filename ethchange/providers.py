@@ -1,11 +1,210 @@
 from __future__ import annotations
 
+from typing import Any, Callable as CallableType
+
 from dependency_injector import containers
-from dependency_injector.providers import Factory
-from web3 import Web3
+from dependency_injector.providers import Callable, Factory, Object, Selector, Singleton
+from django.utils.module_loading import import_string
 
 from config import settings
 
 
+def _lazy(dotted_path: str) -> CallableType[..., Any]:
+    """
+    Callable importing `dotted_path` on its first call, so building the container does not import web3 and the
+    services; they are imported by the first request or command that resolves a provider.
+    """
+    target = None
+
+    def call(*args, **kwargs) -> Any:
+        nonlocal target
+        if target is None:
+            target = import_string(dotted_path)
+        return target(*args, **kwargs)
+
+    call.__qualname__ = call.__name__ = dotted_path
+    return call
+
+
 class ProviderContainer(containers.DeclarativeContainer):
-    web3_provider = Factory(Web3, Web3.HTTPProvider(settings.node_uri))
+    pooled_http_provider = Singleton(
+        _lazy("ethchange.rpc.PooledHTTPProvider"),
+        settings.node_uri,
+        pool_size=settings.web3_pool_size,
+        timeout=settings.web3_timeout,
+        retries=settings.web3_retries,
+        backoff_factor=settings.web3_backoff_factor,
+    )
+    router_provider = Singleton(
+        _lazy("ethchange.rpc.RouterProvider"),
+        settings.node_uris or [settings.node_uri],
+        settings.keystore_node_uri or settings.node_uri,
+        max_lag=settings.router_max_lag,
+        max_failures=settings.router_max_failures,
+        health_interval=settings.router_health_interval,
+        pool_size=settings.web3_pool_size,
+        timeout=settings.web3_timeout,
+        retries=settings.web3_retries,
+        backoff_factor=settings.web3_backoff_factor,
+    )
+    rpc_metrics = Singleton(_lazy("ethchange.metrics.RpcMetrics"), latency_buckets=settings.rpc_latency_buckets)
+    rpc_middleware = Selector(
+        lambda: "enabled" if settings.rpc_metrics_enabled else "disabled",
+        enabled=Singleton(
+            _lazy("ethchange.metrics.RpcMetricsMiddleware"), metrics=rpc_metrics, slow_call_ms=settings.rpc_slow_call_ms
+        ),
+        disabled=Object(None),
+    )
+    node_limiter = Selector(
+        lambda: "enabled" if settings.admission_node_concurrency else "disabled",
+        enabled=Singleton(
+            _lazy("ethchange.admission.NodeLimiter"),
+            concurrency=settings.admission_node_concurrency,
+            wait=settings.admission_node_wait,
+        ),
+        disabled=Object(None),
+    )
+    admission_controller = Singleton(
+        _lazy("ethchange.admission.AdmissionController"),
+        routes=settings.admission_routes,
+        limits=settings.admission_limits,
+        user_limit=settings.admission_user_limit,
+        max_users=settings.admission_max_users,
+    )
+    http_provider = Singleton(_lazy("web3.HTTPProvider"), settings.node_uri)
+    async_http_provider = Singleton(_lazy("web3.AsyncHTTPProvider"), settings.node_uri)
+    web3_provider = Selector(
+        lambda: settings.web3_provider_mode,
+        factory=Factory(
+            _lazy("ethchange.metrics.instrumented_web3"),
+            http_provider,
+            middleware=rpc_middleware,
+            limiter=node_limiter,
+        ),
+        pooled=Singleton(
+            _lazy("ethchange.metrics.instrumented_web3"),
+            pooled_http_provider,
+            middleware=rpc_middleware,
+            limiter=node_limiter,
+        ),
+        router=Singleton(
+            _lazy("ethchange.metrics.instrumented_web3"),
+            router_provider,
+            middleware=rpc_middleware,
+            limiter=node_limiter,
+        ),
+    )
+    async_web3_provider = Factory(
+        _lazy("ethchange.metrics.instrumented_web3"),
+        async_http_provider,
+        middleware=rpc_middleware,
+        limiter=node_limiter,
+        modules=Callable(_lazy("ethchange.rpc.async_modules")),
+        middlewares=[],
+    )
+    balance_cache = Singleton(
+        _lazy("ethchange.cache.BalanceCache"), alias="balances", poll_interval=settings.balance_head_poll_interval
+    )
+    user_cache = Singleton(_lazy("ethchange.cache.UserCache"), alias="users")
+    unlock_cache = Singleton(
+        _lazy("ethchange.cache.UnlockCache"),
+        alias="unlocks",
+        # the personal API is pinned to the keystore node in router mode
+        node=settings.keystore_node_uri or settings.node_uri,
+        duration=settings.wallet_unlock_duration,
+        margin=settings.wallet_unlock_margin,
+    )
+    password_hasher = Singleton(
+        _lazy("ethchange.user.backends.PasswordHasher"),
+        workers=settings.auth_hash_workers,
+        queue_size=settings.auth_hash_queue,
+        timeout=settings.auth_hash_timeout,
+    )
+    keystore_generator = Singleton(
+        _lazy("ethchange.keystore.KeystoreGenerator"),
+        keystore_dir=settings.keystore_dir,
+        scrypt_n=settings.keystore_scrypt_n,
+        workers=settings.keystore_workers,
+    )
+    account_pool = Singleton(
+        _lazy("ethchange.accounts.AccountPool"),
+        web3=web3_provider,
+        keystore_generator=Selector(lambda: settings.account_backend, geth=Object(None), keystore=keystore_generator),
+        passphrase=settings.account_pool_passphrase or settings.secret_key,
+        keystore_dir=settings.keystore_dir,
+        low_water_mark=settings.account_pool_low_water_mark,
+        size=settings.account_pool_size,
+        rebind_workers=settings.account_pool_rebind_workers,
+    )
+    address_index = Singleton(
+        _lazy("ethchange.user.index.AddressIndex"), refresh_interval=settings.address_index_refresh_interval
+    )
+    transaction_indexer = Factory(
+        _lazy("ethchange.indexer.indexer.TransactionIndexer"),
+        web3=web3_provider,
+        address_index=address_index,
+        batch_size=settings.indexer_batch_size,
+        workers=settings.indexer_workers,
+        reorg_depth=settings.indexer_reorg_depth,
+        start_block=settings.indexer_start_block,
+    )
+    fee_oracle = Singleton(
+        _lazy("ethchange.fees.FeeOracle"),
+        alias="fees",
+        poll_interval=settings.fee_poll_interval,
+        history_blocks=settings.fee_history_blocks,
+        tiers=settings.fee_tiers,
+        max_age=settings.fee_max_age,
+    )
+    transaction_sender = Singleton(
+        _lazy("ethchange.transactions.TransactionSender"),
+        web3=web3_provider,
+        fee_oracle=fee_oracle,
+        gas=settings.tx_gas,
+        gas_price=settings.tx_gas_price,
+        fee_tier=settings.tx_fee_tier,
+        batch_size=settings.tx_batch_size,
+        batch_interval=settings.tx_batch_interval,
+        timeout=settings.tx_timeout,
+    )
+    job_queue = Singleton(
+        _lazy("ethchange.jobs.queue.JobQueue"),
+        handlers=dict(
+            signup="ethchange.user.jobs.signup",
+            lock_wallet="ethchange.user.jobs.lock_wallet",
+            unlock_wallet="ethchange.user.jobs.unlock_wallet",
+        ),
+        # the personal API serving these jobs is pinned to the keystore node in router mode
+        node=settings.keystore_node_uri or settings.node_uri,
+        node_concurrency=settings.jobs_node_concurrency,
+        max_attempts=settings.jobs_max_attempts,
+        retry_backoff=settings.jobs_retry_backoff,
+        retry_max_delay=settings.jobs_retry_max_delay,
+        timeout=settings.jobs_timeout,
+        retention=settings.jobs_retention,
+    )
+    metrics_registry = Singleton(
+        _lazy("ethchange.metrics.MetricsRegistry"), latency_buckets=settings.metrics_latency_buckets
+    )
+    metrics_exporter = Singleton(
+        _lazy("ethchange.metrics.InfluxExporter"),
+        registry=metrics_registry,
+        rpc_metrics=rpc_metrics,
+        job_queue=Selector(
+            lambda: "enabled" if settings.jobs_enabled else "disabled", enabled=job_queue, disabled=Object(None)
+        ),
+        admission=Selector(
+            lambda: "enabled" if settings.admission_enabled else "disabled",
+            enabled=admission_controller,
+            disabled=Object(None),
+        ),
+        node_limiter=node_limiter,
+        url=settings.metrics_influx_url or f"http://localhost:{settings.get('influx_port', 8086)}",
+        org="ethchange",
+        bucket="ethchange_admin_bucket",
+        token=settings.secret_key,
+        interval=settings.metrics_interval,
+        batch_size=settings.metrics_batch_size,
+        buffer_size=settings.metrics_buffer_size,
+        timeout=settings.metrics_timeout,
+    )
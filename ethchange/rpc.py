@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import contextlib
+import itertools
+import json
+import threading
+import time
+from typing import Any, Callable, Optional, Sequence, TypeVar
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from web3 import HTTPProvider, Web3
+from web3._utils.request import make_post_request
+from web3.eth import AsyncEth
+from web3.geth import AsyncGethPersonal, Geth
+from web3.providers import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from ethchange.metrics import note_transport
+
+
+T = TypeVar("T")
+
+# JSON-RPC errors of the node itself rather than of the call: internal errors and geth's request limit
+NODE_ERROR_CODES = frozenset({-32603, -32005})
+
+
+def async_modules() -> dict[str, Any]:
+    """Web3 modules of the async client: `eth` and the personal API of `geth`"""
+    return dict(eth=(AsyncEth,), geth=(Geth, dict(personal=(AsyncGethPersonal,))))
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider holding one keep-alive session for the whole process.
+
+    `HTTPProvider` caches one session per thread, so every worker thread opens its own connections. This provider
+    shares a single bounded connection pool between all threads instead. Only connection failures are retried, as
+    a JSON-RPC call that reached the node may not be safe to send twice.
+    """
+
+    def __init__(self, endpoint_uri: str, pool_size: int, timeout: float, retries: int, backoff_factor: float):
+        super().__init__(endpoint_uri, request_kwargs=dict(timeout=timeout))
+        self._adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=backoff_factor),
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+    def post(self, data: bytes) -> bytes:
+        note_transport(node=self.endpoint_uri, request_bytes=len(data), response_bytes=0)
+        response = self.session.post(self.endpoint_uri, data=data, **self.get_request_kwargs())
+        retries = response.raw.retries
+        note_transport(retries=len(retries.history) if retries else 0, response_bytes=len(response.content))
+        response.raise_for_status()
+        return response.content
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return self.decode_rpc_response(self.post(self.encode_rpc_request(method, params)))
+
+    def stats(self) -> dict[str, int]:
+        """Number of requests sent, connections newly opened and requests served over a reused connection"""
+        pools = self._adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        requests_sent = sum(pool.num_requests for pool in pools)
+        connections_opened = sum(pool.num_connections for pool in pools)
+        return dict(requests=requests_sent, opened=connections_opened, reused=requests_sent - connections_opened)
+
+
+class NodeState:
+    """Health and request metrics of one node behind a `RouterProvider`"""
+
+    def __init__(self, provider: PooledHTTPProvider):
+        self.provider = provider
+        self.block_number = -1
+        self.in_sync = False
+        self.failures = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, failed: bool):
+        with self._lock:
+            self.requests += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if failed:
+                self.errors += 1
+                self.failures += 1
+            else:
+                self.failures = 0
+
+    def stats(self) -> dict[str, Any]:
+        return dict(
+            block_number=self.block_number,
+            in_sync=self.in_sync,
+            failures=self.failures,
+            requests=self.requests,
+            errors=self.errors,
+            latency_avg=self.latency_total / self.requests if self.requests else 0.0,
+            latency_max=self.latency_max,
+        )
+
+
+class RouterProvider(JSONBaseProvider):
+    """
+    Spreads reads over several nodes and pins `personal_*` calls to the node holding the keystore, along with the
+    `pending` transaction counts the nonces of the transfers it signs are read from.
+
+    A background health check polls `eth_blockNumber` on every node; reads go round-robin to the nodes within
+    `max_lag` blocks of the highest head that have not failed `max_failures` requests in a row, and fail over to
+    the next node on transport errors, timeouts and the node level errors of `NODE_ERROR_CODES`. Any other error
+    response is an answer to the call itself and is returned as is.
+    """
+
+    def __init__(
+        self,
+        node_uris: Sequence[str],
+        keystore_uri: str,
+        max_lag: int,
+        max_failures: int,
+        health_interval: float,
+        **pool_kwargs,
+    ):
+        super().__init__()
+        uris = dict.fromkeys([*node_uris, keystore_uri])
+        self.nodes = {uri: NodeState(PooledHTTPProvider(uri, **pool_kwargs)) for uri in uris}
+        self._readers = [self.nodes[uri] for uri in dict.fromkeys(node_uris)]
+        self._keystore = self.nodes[keystore_uri]
+        self._max_lag = max_lag
+        self._max_failures = max_failures
+        self._health_interval = health_interval
+        self._cursor = itertools.count()
+        self._checker: Optional[threading.Thread] = None
+        self._checker_lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f"RPC router over {', '.join(self.nodes)}"
+
+    def check_health(self):
+        for uri, node in self.nodes.items():
+            try:
+                response = node.provider.make_request(RPCEndpoint("eth_blockNumber"), [])
+                node.block_number = int(response["result"], 16)
+                node.failures = 0
+            except Exception as exc:  # pylint: disable=broad-except
+                node.failures += 1
+                logger.warning(f"Health check of node [{uri}] failed: {exc}")
+
+        head = max(node.block_number for node in self.nodes.values())
+        for node in self.nodes.values():
+            node.in_sync = node.failures == 0 and head - node.block_number <= self._max_lag
+
+    def _watch(self):
+        while True:
+            time.sleep(self._health_interval)
+            self.check_health()
+
+    def _ensure_checker(self):
+        if self._checker is None:
+            with self._checker_lock:
+                if self._checker is None:
+                    self.check_health()
+                    self._checker = threading.Thread(target=self._watch, name="rpc-router-health", daemon=True)
+                    self._checker.start()
+
+    def _read_nodes(self) -> list[NodeState]:
+        nodes = [node for node in self._readers if node.in_sync and node.failures < self._max_failures]
+        if not nodes:
+            # with no node in rotation, trying every node beats failing the request outright
+            nodes = self._readers
+        start = next(self._cursor) % len(nodes)
+        return nodes[start:] + nodes[:start]
+
+    @staticmethod
+    def _node_error(response: Any) -> bool:
+        """Whether `response`, a decoded response or the raw body of a batch, is a node level error"""
+        if isinstance(response, bytes):
+            if not response.lstrip().startswith(b"{"):
+                return False
+            response = json.loads(response)
+        return isinstance(response, dict) and response.get("error", {}).get("code") in NODE_ERROR_CODES
+
+    def _send(self, node: NodeState, send: Callable[[PooledHTTPProvider], T]) -> T:
+        start = time.perf_counter()
+        try:
+            response = send(node.provider)
+        except Exception:
+            node.record(time.perf_counter() - start, failed=True)
+            raise
+        node.record(time.perf_counter() - start, failed=self._node_error(response))
+        return response
+
+    def _failover(self, send: Callable[[PooledHTTPProvider], T]) -> T:
+        nodes = self._read_nodes()
+        for node in nodes[:-1]:
+            try:
+                response = self._send(node, send)
+            except requests.RequestException:
+                note_transport(retries=1)
+                continue
+            if not self._node_error(response):
+                return response
+            note_transport(retries=1)
+        return self._send(nodes[-1], send)
+
+    @staticmethod
+    def _pinned(method: RPCEndpoint, params: Any) -> bool:
+        if method.startswith("personal_"):
+            return True
+        return method == "eth_getTransactionCount" and len(params) > 1 and params[1] == "pending"
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        self._ensure_checker()
+        if self._pinned(method, params):
+            return self._send(self._keystore, lambda provider: provider.make_request(method, params))
+        return self._failover(lambda provider: provider.make_request(method, params))
+
+    def post(self, data: bytes) -> bytes:
+        """Sends a raw JSON-RPC payload to a read node"""
+        self._ensure_checker()
+        return self._failover(lambda provider: provider.post(data))
+
+    def is_connected(self) -> bool:
+        return any(node.provider.is_connected() for node in self.nodes.values())
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {uri: node.stats() for uri, node in self.nodes.items()}
+
+
+def batch_request(web3: Web3, calls: Sequence[tuple[str, Sequence[Any]]], raise_errors: bool = True) -> list[Any]:
+    """
+    Sends `calls` as a single JSON-RPC batch and returns the results in call order.
+
+    Raises ValueError if any call in the batch returned an error, or with `raise_errors` off returns that ValueError
+    in place of the result of the failed call.
+    """
+    if not calls:
+        return []
+
+    payload = [
+        dict(jsonrpc="2.0", id=index, method=method, params=list(params))
+        for index, (method, params) in enumerate(calls)
+    ]
+    provider = web3.provider
+    data = json.dumps(payload).encode("utf-8")
+
+    def send() -> bytes:
+        if isinstance(provider, (PooledHTTPProvider, RouterProvider)):
+            return provider.post(data)
+        note_transport(node=provider.endpoint_uri, request_bytes=len(data), response_bytes=0)
+        response = make_post_request(provider.endpoint_uri, data, **provider.get_request_kwargs())
+        note_transport(response_bytes=len(response))
+        return response
+
+    # batches bypass the web3 middlewares, the node slot and the instrumentation are applied here instead
+    instrumentation = web3.middleware_onion.get("rpc_metrics")
+    limiter = web3.middleware_onion.get("node_limiter")
+    methods = {method for method, _ in calls}
+    batch_method = f"batch:{methods.pop()}" if len(methods) == 1 else "batch"
+    with limiter.slot() if limiter else contextlib.nullcontext():
+        raw_response = instrumentation.call(batch_method, web3, send) if instrumentation else send()
+
+    responses = json.loads(raw_response)
+    if isinstance(responses, dict):
+        # the node rejected the batch as a whole
+        raise ValueError(responses.get("error", responses))
+    responses = sorted(responses, key=lambda response: response["id"])
+    for response in responses:
+        if "error" in response and raise_errors:
+            raise ValueError(response["error"])
+    return [ValueError(response["error"]) if "error" in response else response["result"] for response in responses]
@@ -34,14 +34,18 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     # first party
     "ethchange.user",
+    "ethchange.indexer",
+    "ethchange.jobs",
 ]
 
 MIDDLEWARE = [
+    *(["ethchange.metrics.metrics_middleware"] if settings.metrics_enabled else []),
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    *(["ethchange.admission.admission_middleware"] if settings.admission_enabled else []),
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -85,13 +89,74 @@ REST_FRAMEWORK = {
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+if settings.database_engine == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": settings.database_name,
+            "USER": settings.database_user,
+            "PASSWORD": settings.database_password,
+            "HOST": settings.database_host,
+            "PORT": settings.database_port,
+            "CONN_MAX_AGE": settings.database_conn_max_age,
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+    # replicas share the credentials of the primary, reads of read-only views are routed to them
+    for index, host in enumerate(settings.database_replicas):
+        DATABASES[f"replica_{index}"] = {**DATABASES["default"], "HOST": host, "TEST": {"MIRROR": "default"}}
+    DATABASE_ROUTERS = ["ethchange.db.routers.ReplicaRouter"]
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "ethchange.db.sqlite3",
+            "NAME": settings.sqlite_name.format(base_dir=BASE_DIR),
+            "OPTIONS": {
+                "timeout": settings.sqlite_timeout,
+                "transaction_mode": settings.sqlite_transaction_mode,
+                "pragmas": settings.sqlite_pragmas,
+            },
+        }
     }
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "balances": {
+        "BACKEND": settings.balance_cache_backend,
+        "LOCATION": settings.balance_cache_location.format(base_dir=BASE_DIR),
+        "OPTIONS": {"MAX_ENTRIES": settings.balance_cache_size},
+    },
+    "fees": {
+        "BACKEND": settings.fee_cache_backend,
+        "LOCATION": settings.fee_cache_location.format(base_dir=BASE_DIR),
+    },
+    "sessions": {
+        "BACKEND": settings.session_cache_backend,
+        "LOCATION": settings.session_cache_location.format(base_dir=BASE_DIR),
+    },
+    "unlocks": {
+        "BACKEND": settings.unlock_cache_backend,
+        "LOCATION": settings.unlock_cache_location.format(base_dir=BASE_DIR),
+    },
+    "users": {
+        "BACKEND": "ethchange.cache.CountingLocMemCache",
+        "LOCATION": "ethchange-users",
+        "TIMEOUT": settings.user_cache_timeout,
+        "OPTIONS": {"MAX_ENTRIES": settings.user_cache_size},
+    },
 }
 
+# Sessions
+# https://docs.djangoproject.com/en/4.1/topics/http/sessions/
+
+SESSION_ENGINE = f"django.contrib.sessions.backends.{settings.session_backend}"
+SESSION_CACHE_ALIAS = "sessions"
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -132,3 +197,4 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "user.UserModel"
+AUTHENTICATION_BACKENDS = ["ethchange.user.backends.CachedModelBackend"]
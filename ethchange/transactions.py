@@ -0,0 +1,201 @@
+"""
+Signing and submission of ETH transfers with nonces tracked in the database.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import F
+from loguru import logger
+from web3 import Web3
+from web3.types import RPCEndpoint
+
+from ethchange.fees import FeeOracle
+from ethchange.rpc import batch_request
+from ethchange.user.models import AccountNonce
+
+
+class NonceManager:
+    """
+    Hands out the nonces of the accounts this deployment sends from.
+
+    The next nonce of an account lives in its `AccountNonce` row, read with `eth_getTransactionCount` on the first
+    send and incremented under a row lock from then on, so concurrent sends from any process or worker get
+    consecutive nonces without a node round trip each. A failed send calls `resync`, which deletes the row so the
+    next send reads the nonce from the node again.
+    """
+
+    def __init__(self, web3: Web3):
+        self._web3 = web3
+        self._locks: defaultdict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+        self.resyncs = 0
+
+    def _lock(self, address: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks[address]
+
+    def _pending_count(self, address: str) -> int:
+        return self._web3.eth.get_transaction_count(Web3.toChecksumAddress(address), "pending")
+
+    def next(self, address: str) -> int:
+        address = address.lower()
+        # the local lock queues the threads of this process, the row lock those of other processes
+        with self._lock(address), transaction.atomic():
+            row, _ = AccountNonce.objects.select_for_update().get_or_create(
+                address=address, defaults=dict(nonce=lambda: self._pending_count(address))
+            )
+            AccountNonce.objects.filter(address=address).update(nonce=F("nonce") + 1)
+            return row.nonce
+
+    def resync(self, address: str):
+        address = address.lower()
+        with self._lock(address):
+            deleted, _ = AccountNonce.objects.filter(address=address).delete()
+            if deleted:
+                self.resyncs += 1
+                logger.opt(lazy=True).debug(f"[{address}] Nonce dropped, resyncing from the node")
+
+
+class TransactionTimeout(Exception):
+    """Raised when the node did not take a queued transaction within the send timeout"""
+
+
+class TransactionSender:
+    """
+    Signs transfers with the node holding the keystore and submits them in JSON-RPC batches.
+
+    Signed transactions wait in a queue that a background thread submits as one `eth_sendRawTransaction` batch
+    once `batch_size` of them are queued or `batch_interval` seconds after the first one, so concurrent sends share
+    node round trips. A gas price of 0 uses the gas price the fee oracle estimates for `fee_tier`. A send that times
+    out cancels its queued transaction, so it is never submitted with a nonce handed out again after the resync.
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        fee_oracle: FeeOracle,
+        gas: int,
+        gas_price: int,
+        fee_tier: str,
+        batch_size: int,
+        batch_interval: float,
+        timeout: float,
+    ):
+        self._web3 = web3
+        self._fee_oracle = fee_oracle
+        self._gas = gas
+        self._gas_price = gas_price
+        self._fee_tier = fee_tier
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._timeout = timeout
+        self.nonces = NonceManager(web3)
+        self._chain_id: Optional[int] = None
+        self._queue: queue.Queue[tuple[str, str, Future[str]]] = queue.Queue()
+        self._counters = dict(sent=0, failed=0, batches=0)
+        self._submitter: Optional[threading.Thread] = None
+        self._submitter_lock = threading.Lock()
+
+    @property
+    def chain_id(self) -> int:
+        if self._chain_id is None:
+            self._chain_id = self._web3.eth.chain_id
+        return self._chain_id
+
+    def _ensure_submitter(self):
+        if self._submitter is None:
+            with self._submitter_lock:
+                if self._submitter is None:
+                    self._submitter = threading.Thread(target=self._run, name="transaction-submitter", daemon=True)
+                    self._submitter.start()
+
+    def sign(self, address: str, password: str, to: str, value: int, nonce: int) -> str:
+        """Returns the raw transaction signed by the node under `password`"""
+        tx = {
+            "from": Web3.toChecksumAddress(address),
+            "to": Web3.toChecksumAddress(to),
+            "value": hex(value),
+            "gas": hex(self._gas),
+            "gasPrice": hex(self._gas_price or self._fee_oracle.gas_price(self._web3, self._fee_tier)),
+            "nonce": hex(nonce),
+            "chainId": hex(self.chain_id),
+        }
+        signed = self._web3.manager.request_blocking(RPCEndpoint("personal_signTransaction"), [tx, password])
+        return signed["raw"]
+
+    def submit(self, raw_transaction: str, address: str) -> Future[str]:
+        """Queues a signed transaction, the future resolves to its hash once the node accepted it"""
+        future: Future[str] = Future()
+        self._ensure_submitter()
+        self._queue.put((raw_transaction, address, future))
+        return future
+
+    def send(self, address: str, password: str, to: str, value: int) -> str:
+        """Sends `value` wei from `address` to `to`, returns the transaction hash"""
+        nonce = self.nonces.next(address)
+        try:
+            future = self.submit(self.sign(address, password, to, value, nonce), address)
+        except Exception:
+            self.nonces.resync(address)
+            raise
+
+        try:
+            return future.result(self._timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                self.nonces.resync(address)
+            else:
+                # the batch holding it is on its way to the node, the nonce is only left unused if the node rejects it
+                future.add_done_callback(lambda done: done.exception() and self.nonces.resync(address))
+            raise TransactionTimeout(f"Transaction from [{address}] not submitted within [{self._timeout}] seconds")
+        except Exception:
+            # the nonce may be taken or left unused, either way the stored count no longer matches the node
+            self.nonces.resync(address)
+            raise
+
+    def _flush(self, batch: list[tuple[str, str, Future[str]]]):
+        # drops the transactions of sends that timed out while queued
+        batch = [entry for entry in batch if entry[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = batch_request(
+                self._web3,
+                [("eth_sendRawTransaction", [raw_transaction]) for raw_transaction, _, _ in batch],
+                raise_errors=False,
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            results = [error] * len(batch)
+
+        self._counters["batches"] += 1
+        for (_, address, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                self._counters["failed"] += 1
+                logger.warning(f"[{address}] Transaction rejected: {result}")
+                future.set_exception(result)
+            else:
+                self._counters["sent"] += 1
+                future.set_result(result)
+        logger.opt(lazy=True).debug(f"[{len(batch)}] Transactions submitted")
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._batch_interval
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+            self._flush(batch)
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._counters, queued=self._queue.qsize(), resyncs=self.nonces.resyncs)
@@ -6,6 +6,14 @@ from __future__ import annotations
 from django.contrib import admin
 from django.urls import path
 
+from ethchange.jobs.urls import urlpatterns as job_urlpatterns
 from ethchange.user.urls import urlpatterns as user_urlpatterns
+from ethchange.views import fees, stats
 
-urlpatterns = [path("admin/", admin.site.urls), *user_urlpatterns]
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("stats/", stats, name="stats"),
+    path("fees/", fees, name="fees"),
+    *user_urlpatterns,
+    *job_urlpatterns,
+]
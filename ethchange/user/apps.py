@@ -10,4 +10,4 @@ class UserConfig(AppConfig):
     def ready(self):
         from ethchange import injector
 
-        injector.wire(modules=["ethchange.user.models"])
+        injector.wire(modules=["ethchange.user.models", "ethchange.user.signals"])
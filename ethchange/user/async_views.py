@@ -0,0 +1,151 @@
+"""
+Async counterparts of the geth backed user endpoints, served without blocking a worker thread under ASGI.
+"""
+from __future__ import annotations
+
+import functools
+import json
+from typing import Awaitable, Callable
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth import login as _login
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from rest_framework import status
+
+from config import settings
+from ethchange.admission import NodeBusy
+from ethchange.user.backends import PasswordHasherBusy
+from ethchange.user.models import UserModel
+from ethchange.user.views import RETRY_LATER, parse_login_lookup, parse_signup_info
+
+
+def _json_body(request: HttpRequest) -> dict:
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return dict()
+    return data if isinstance(data, dict) else dict()
+
+
+def _endpoint(*methods: str, authenticated: bool = False, exempt: bool = False):
+    """
+    Method, authentication and csrf handling for async views.
+
+    Django's own view decorators only wrap sync views in this Django version, so they cannot be used here.
+    """
+
+    def decorator(view: Callable[..., Awaitable[JsonResponse]]) -> Callable[..., Awaitable[HttpResponse]]:
+        @functools.wraps(view)
+        async def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+
+            if authenticated:
+                is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+                if not is_authenticated:
+                    return JsonResponse(
+                        dict(detail="Authentication credentials were not provided."), status=status.HTTP_403_FORBIDDEN
+                    )
+            try:
+                return await view(request, *args, **kwargs)
+            except NodeBusy as error:
+                response = JsonResponse(dict(detail=str(error.detail)), status=error.status_code)
+                response["Retry-After"] = str(error.wait)
+                return response
+
+        wrapper.csrf_exempt = exempt
+        return wrapper
+
+    return decorator
+
+
+@_endpoint("POST", exempt=True)
+async def signup(request: HttpRequest) -> JsonResponse:
+    user_info, message = parse_signup_info(_json_body(request))
+    if message:
+        return JsonResponse(dict(message=message), status=status.HTTP_400_BAD_REQUEST)
+
+    if await UserModel.objects.filter(name=user_info["name"]).aexists():
+        return JsonResponse(dict(message="User Account Exists"), status=status.HTTP_400_BAD_REQUEST)
+
+    user = await UserModel.objects.acreate_user(**user_info)
+    if user is not None and settings.auth_login_mode == "low_write":
+        await sync_to_async(_login)(request, user)
+        return JsonResponse({"message": "Success"}, status=status.HTTP_201_CREATED)
+
+    if user is not None:
+        user = await sync_to_async(authenticate)(request, name=user_info["name"], password=user_info["password"])
+        if user is not None:
+            await sync_to_async(_login)(request, user)
+            await sync_to_async(user.save)()
+            return JsonResponse({"message": "Success"}, status=status.HTTP_201_CREATED)
+
+    return JsonResponse(dict(), status=status.HTTP_400_BAD_REQUEST)
+
+
+@_endpoint("POST", exempt=True)
+async def login(request: HttpRequest) -> JsonResponse:
+    req_data = _json_body(request)
+
+    if "password" not in req_data.keys():
+        return JsonResponse(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
+
+    lookup = parse_login_lookup(req_data)
+    if lookup is None:
+        return JsonResponse(dict(message="Missing UserInfoAttributes"), status=status.HTTP_400_BAD_REQUEST)
+
+    user = await UserModel.objects.aget_current(*lookup.popitem())
+    if user and settings.auth_login_mode == "low_write":
+        try:
+            verified = await UserModel.objects.averify_password(user, req_data["password"])
+        except PasswordHasherBusy as error:
+            response = JsonResponse(dict(message=str(error)), status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response.headers.update(RETRY_LATER)
+            return response
+        if verified and user.is_active:
+            await sync_to_async(_login)(request, user)
+            return JsonResponse({"message": "Success"}, status=status.HTTP_200_OK)
+
+    elif user:
+        user = await sync_to_async(authenticate)(request, username=user.name, password=req_data["password"])
+        if user is not None:
+            await sync_to_async(_login)(request, user)
+            await sync_to_async(user.save)()
+            return JsonResponse({"message": "Success"}, status=status.HTTP_200_OK)
+
+    return JsonResponse(dict(), status=status.HTTP_400_BAD_REQUEST)
+
+
+@_endpoint("POST", authenticated=True)
+async def lock_wallet(request: HttpRequest, name: str) -> JsonResponse:
+    req_data = _json_body(request)
+    if "password" not in req_data.keys():
+        return JsonResponse(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
+
+    if await UserModel.objects.alock_eth_account(name=name, password=req_data["password"]):
+        return JsonResponse(dict(), status=status.HTTP_200_OK)
+    return JsonResponse(dict(), status=status.HTTP_400_BAD_REQUEST)
+
+
+@_endpoint("POST", authenticated=True)
+async def unlock_wallet(request: HttpRequest, name: str) -> JsonResponse:
+    req_data = _json_body(request)
+    if "password" not in req_data.keys():
+        return JsonResponse(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
+
+    if await UserModel.objects.aunlock_eth_account(name=name, password=req_data["password"]):
+        return JsonResponse(dict(), status=status.HTTP_200_OK)
+    return JsonResponse(dict(), status=status.HTTP_400_BAD_REQUEST)
+
+
+@_endpoint("GET", authenticated=True)
+async def balance_eth_account(request: HttpRequest, name: str) -> JsonResponse:
+    req_data = _json_body(request)
+    if "password" not in req_data.keys():
+        return JsonResponse(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
+
+    balance = await UserModel.objects.abalance_eth_account(name=name, password=req_data["password"])
+    if balance is not None:
+        return JsonResponse(dict(balance=balance), status=status.HTTP_200_OK)
+    return JsonResponse(dict(), status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password
+
+from ethchange.user.models import UserModel
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Model backend resolving session users through the process local user cache, a cached row is served only while
+    its password and permissions match the database
+    """
+
+    def get_user(self, user_id) -> Optional[UserModel]:
+        user = UserModel.objects.get_current("pk", user_id)
+        return user if self.user_can_authenticate(user) else None
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hasher has no slot left for another login"""
+
+
+class PasswordHasher:
+    """
+    Bounded pool checking login passwords.
+
+    At most `workers` hashes run at once, so a burst of logins leaves CPU time to the other endpoints, and at most
+    `queue_size` more logins wait for one. Logins past that raise `PasswordHasherBusy` at once instead of queueing
+    behind hashes that would finish after their client gave up.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="password-hasher")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._timeout = timeout
+        self._counters = dict(verified=0, rejected=0, upgraded=0, shed=0)
+        self._counters_lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def _submit(self, user: UserModel, password: str, upgrade: list) -> Future:
+        if not self._slots.acquire(blocking=False):
+            self._count("shed")
+            raise PasswordHasherBusy("Too many logins in progress")
+        # the slot is held until the hash finished, also when its login stopped waiting for it
+        future = self._executor.submit(check_password, password, user.password, upgrade.append)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _record(self, user: UserModel, password: str, verified: bool, upgrade: list):
+        self._count("verified" if verified else "rejected")
+        if verified and upgrade:
+            # the hash uses outdated parameters, the new hash is the only column written
+            user.set_password(password)
+            user.save(update_fields=["password"])
+            self._count("upgraded")
+
+    def check(self, user: UserModel, password: str) -> bool:
+        """Checks `password` against the hash of `user` on the pool"""
+        upgrade = []
+        try:
+            verified = self._submit(user, password, upgrade).result(self._timeout)
+        except FutureTimeoutError as error:
+            self._count("shed")
+            raise PasswordHasherBusy("Password hash timed out") from error
+        self._record(user, password, verified, upgrade)
+        return verified
+
+    async def acheck(self, user: UserModel, password: str) -> bool:
+        """Async variant of `check`, awaiting the hash without holding a thread"""
+        upgrade = []
+        try:
+            verified = await asyncio.wait_for(asyncio.wrap_future(self._submit(user, password, upgrade)), self._timeout)
+        except asyncio.TimeoutError as error:
+            self._count("shed")
+            raise PasswordHasherBusy("Password hash timed out") from error
+        if verified and upgrade:
+            await sync_to_async(self._record)(user, password, verified, upgrade)
+        else:
+            self._record(user, password, verified, upgrade)
+        return verified
+
+    def stats(self) -> dict[str, int]:
+        with self._counters_lock:
+            return dict(self._counters)
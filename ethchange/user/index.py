@@ -0,0 +1,76 @@
+"""
+In-memory index of user addresses for matching whole blocks of transactions at once.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from typing import Iterable, Optional, Union
+
+
+def pack_address(address: Union[str, bytes, memoryview]) -> bytes:
+    """Packs a hex address, as text or as the UTF-8 bytes stored in `UserModel.eth_account`, into 20 bytes"""
+    if not isinstance(address, str):
+        address = bytes(address).decode("utf-8")
+    return bytes.fromhex(address.removeprefix("0x").removeprefix("0X"))
+
+
+class AddressIndex:
+    """
+    Maps packed user addresses to user primary keys.
+
+    The index is built from `UserModel` on first use and rebuilt once it is older than `refresh_interval` seconds,
+    which picks up users created or removed by other processes. Changes made in this process are applied right away
+    by the `post_save`/`post_delete` receivers.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self._refresh_interval = refresh_interval
+        self._index: dict[bytes, uuid.UUID] = dict()
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def rebuild(self):
+        from ethchange.user.models import UserModel
+
+        index = {pack_address(account): pk for pk, account in UserModel.objects.values_list("pkid", "eth_account")}
+        with self._lock:
+            self._index, self._built_at = index, time.monotonic()
+
+    def refresh(self):
+        """Rebuilds the index if it was never built or is older than the refresh interval"""
+        if self._built_at is None or time.monotonic() - self._built_at > self._refresh_interval:
+            self.rebuild()
+
+    def add(self, address: Union[str, bytes], pk: uuid.UUID):
+        if self._built_at is not None:
+            packed = pack_address(address)
+            with self._lock:
+                self._index[packed] = pk
+
+    def remove(self, address: Union[str, bytes]):
+        if self._built_at is not None:
+            with self._lock:
+                self._index.pop(pack_address(address), None)
+
+    def get(self, address: Union[str, bytes]) -> Optional[uuid.UUID]:
+        self.refresh()
+        return self._index.get(pack_address(address))
+
+    def __contains__(self, address: Union[str, bytes]) -> bool:
+        return self.get(address) is not None
+
+    def get_many(self, addresses: Iterable[Union[str, bytes]]) -> dict[str, uuid.UUID]:
+        """Returns the user primary key of every address in `addresses` that belongs to a user"""
+        self.refresh()
+        index = self._index
+        matches = dict()
+        for address in addresses:
+            pk = index.get(pack_address(address))
+            if pk is not None:
+                matches[address] = pk
+        return matches
+
+    def __len__(self) -> int:
+        return len(self._index)
@@ -0,0 +1,45 @@
+"""
+Handlers of the background jobs queued by the user endpoints, run by `manage.py run_jobs`.
+"""
+from __future__ import annotations
+
+from ethchange.jobs.models import Job
+from ethchange.user.models import UserModel
+
+
+class Superseded(Exception):
+    """The job was queued again and claimed by another attempt while this one ran"""
+
+
+def signup(name: str, password: str, phone: int, email: str, job: Job) -> dict:
+    user = UserModel.objects.filter(name=name).first()
+    # a retried job may find the user its previous attempt created
+    if user is None:
+        # the account is recorded before the user is created, a later attempt uses it instead of orphaning it
+        eth_account = job.progress.get("eth_account")
+        if eth_account is None:
+            eth_account = UserModel.objects.create_eth_account(password).decode("utf-8")
+            if not eth_account:
+                raise ValueError("Account could not be created")
+            if not job.record(eth_account=eth_account):
+                raise Superseded(f"Attempt superseded, account [{eth_account}] is not used")
+        user = UserModel.objects.create_user(
+            name=name, password=password, phone=phone, email=email, eth_account=eth_account.encode("utf-8")
+        )
+    elif not user.check_password(password):
+        raise ValueError("User Account Exists")
+    if user is None:
+        raise ValueError("Account could not be created")
+    return dict(name=user.name, eth_account=user.eth_account.decode("utf-8"))
+
+
+def lock_wallet(name: str, password: str) -> dict:
+    if not UserModel.objects.lock_eth_account(name=name, password=password):
+        raise ValueError("Invalid Credentials")
+    return dict(locked=True)
+
+
+def unlock_wallet(name: str, password: str) -> dict:
+    if not UserModel.objects.unlock_eth_account(name=name, password=password):
+        raise ValueError("Invalid Credentials")
+    return dict(unlocked=True)
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from ethchange.user.models import UserModel
+
+
+class Command(BaseCommand):
+    help = "Dumps the balance of every user as NDJSON, pinned to a single block"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--name", action="append", dest="names", help="Restrict the dump to the given user names")
+
+    def handle(self, *args, **options):
+        block_number, balances = UserModel.objects.balance_eth_accounts(names=options["names"])
+        for name, balance in balances.items():
+            self.stdout.write(json.dumps(dict(name=name, balance=balance, block_number=block_number)))
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import csv
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from config import settings
+from ethchange.user.models import UserModel
+from ethchange.user.views import parse_signup_info
+from ethchange.utils import chunked
+
+
+def read_csv(path: Path) -> Iterator[Optional[dict]]:
+    with path.open(newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            if row.get("phone", "").isdigit():
+                row["phone"] = int(row["phone"])
+            yield row
+
+
+def read_ndjson(path: Path) -> Iterator[Optional[dict]]:
+    with path.open(encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    yield None
+
+
+READERS = dict(csv=read_csv, ndjson=read_ndjson)
+
+
+class Command(BaseCommand):
+    help = "Imports users from a CSV or NDJSON file of signup payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, help="CSV file with a header row, or NDJSON file")
+        parser.add_argument("--format", choices=READERS.keys(), default=None, help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=settings.import_batch_size)
+        parser.add_argument("--workers", type=int, default=settings.import_workers)
+        parser.add_argument(
+            "--checkpoint", type=Path, default=None, help="Progress file, defaults to the path with .checkpoint added"
+        )
+        parser.add_argument("--resume", action="store_true", help="Skips the rows recorded in the checkpoint")
+
+    def _validate(self, batch: list[tuple[int, Optional[dict]]]) -> list[dict]:
+        """Returns the valid rows of `batch` whose name, email and phone are unused, reporting the others"""
+        user_infos = []
+        for row_number, row in batch:
+            user_info, message = parse_signup_info(row) if isinstance(row, dict) else (None, "Malformed row")
+            if message:
+                self.stderr.write(f"Row {row_number}: {message}")
+            else:
+                user_infos.append((row_number, user_info))
+
+        existing = list(
+            UserModel.objects.filter(
+                Q(name__in=[user_info["name"] for _, user_info in user_infos])
+                | Q(email__in=[user_info["email"] for _, user_info in user_infos])
+                | Q(phone__in=[user_info["phone"] for _, user_info in user_infos])
+            ).values_list("name", "email", "phone")
+        )
+        names, emails, phones = (set(values) for values in zip(*existing)) if existing else (set(), set(), set())
+
+        valid = []
+        for row_number, user_info in user_infos:
+            if user_info["name"] in names or user_info["email"] in emails or user_info["phone"] in phones:
+                self.stderr.write(f"Row {row_number}: User Account Exists")
+                continue
+            names.add(user_info["name"])
+            emails.add(user_info["email"])
+            phones.add(user_info["phone"])
+            valid.append(user_info)
+        return valid
+
+    @staticmethod
+    def _save_checkpoint(checkpoint: Path, rows: int):
+        temp = checkpoint.with_name(f".{checkpoint.name}.tmp")
+        temp.write_text(json.dumps(dict(rows=rows)))
+        os.replace(temp, checkpoint)
+
+    def handle(self, *args, **options):
+        path: Path = options["path"]
+        if not path.is_file():
+            raise CommandError(f"No such file [{path}]")
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unknown format [{file_format}], pass --format")
+
+        checkpoint = options["checkpoint"] or path.with_name(f"{path.name}.checkpoint")
+        done = 0
+        if options["resume"] and checkpoint.is_file():
+            done = json.loads(checkpoint.read_text())["rows"]
+            self.stdout.write(f"Resuming after row {done}")
+
+        # rows are numbered from 1 and committed batch by batch, the checkpoint records the last committed row
+        rows = itertools.islice(enumerate(READERS[file_format](path), start=1), done, None)
+        created = skipped = 0
+        started = time.perf_counter()
+        for batch in chunked(rows, options["batch_size"]):
+            user_infos = self._validate(batch)
+            users = UserModel.objects.bulk_create_users(user_infos, workers=options["workers"])
+            done = batch[-1][0]
+            self._save_checkpoint(checkpoint, done)
+
+            created += len(users)
+            skipped += len(batch) - len(users)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Row {done}: {created} created, {skipped} skipped, {created / elapsed:.1f} users/s")
+
+        checkpoint.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} users, {skipped} skipped"))
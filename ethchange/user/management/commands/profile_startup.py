@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+# project root holding manage.py, the targets run from there like a deployment would
+ROOT_DIR = Path(__file__).resolve().parents[4]
+
+TARGETS = dict(
+    check='import runpy, sys; sys.argv = ["manage.py", "check"]; runpy.run_path("manage.py", run_name="__main__")',
+    wsgi="from ethchange.wsgi import application",
+    asgi="from ethchange.asgi import application",
+)
+
+# `-X importtime` only reports `import` statements, Django loads settings, apps, models and middleware through
+# `importlib.import_module`, so those are timed by wrapping it
+IMPORT_MODULE_TIMER = """
+import importlib, importlib.util, sys, time
+_import_module = importlib.import_module
+def import_module(name, package=None):
+    name = importlib.util.resolve_name(name, package)
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter_ns()
+    try:
+        return _import_module(name)
+    finally:
+        sys.stderr.write(f"import_module time: {(time.perf_counter_ns() - start) // 1000} | {name}\\n")
+importlib.import_module = import_module
+"""
+
+
+def parse_importtime(output: str) -> tuple[list[tuple[str, int, int]], dict[str, int]]:
+    """
+    Returns (module, self us, cumulative us) of every import reported by `python -X importtime`, and the cumulative
+    us of every module loaded through `importlib.import_module`
+    """
+    imports, dynamic = [], dict()
+    for line in output.splitlines():
+        if line.startswith("import time:"):
+            self_us, cumulative_us, module = line[len("import time:") :].split("|")
+            if self_us.strip().isdigit():
+                imports.append((module.strip(), int(self_us), int(cumulative_us)))
+        elif line.startswith("import_module time:"):
+            cumulative_us, module = line[len("import_module time:") :].split("|")
+            dynamic[module.strip()] = int(cumulative_us)
+    return imports, dynamic
+
+
+def breakdown(imports: list[tuple[str, int, int]], dynamic: dict[str, int], top: int) -> dict[str, dict[str, float]]:
+    """
+    Self time in ms summed per top-level package, and the cumulative time in ms of each project module. Modules loaded
+    through `importlib.import_module` count towards the self time of the module that loaded them.
+    """
+    packages = defaultdict(int)
+    project = {module: us for module, us in dynamic.items() if module.split(".")[0] == "ethchange"}
+    for module, self_us, cumulative_us in imports:
+        packages[module.split(".")[0]] += self_us
+        if module.split(".")[0] == "ethchange":
+            project[module] = cumulative_us
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return dict(
+        packages={package: round(us / 1000, 1) for package, us in ranked},
+        ethchange={module: round(us / 1000, 1) for module, us in sorted(project.items(), key=lambda item: -item[1])},
+    )
+
+
+class Command(BaseCommand):
+    help = "Reports the import time breakdown and the cold start time of manage.py check and the WSGI/ASGI apps"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--targets", nargs="+", choices=TARGETS.keys(), default=list(TARGETS))
+        parser.add_argument("--runs", type=int, default=5, help="Cold starts timed per target")
+        parser.add_argument("--top", type=int, default=15, help="Top-level packages listed per target")
+        parser.add_argument("--json", action="store_true", help="Prints the report as JSON")
+
+    @staticmethod
+    def _run(args: list[str]) -> tuple[float, str]:
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, *args], cwd=ROOT_DIR, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if process.returncode != 0:
+            raise CommandError(f"{args[-1]} exited with {process.returncode}:\n{process.stderr[-2000:]}")
+        return elapsed, process.stderr
+
+    def profile(self, target: str, runs: int, top: int) -> dict:
+        args = ["-c", TARGETS[target]]
+        # the first run warms the bytecode and OS file caches, it is not counted
+        self._run(args)
+        wall = [self._run(args)[0] * 1000 for _ in range(runs)]
+        imports, dynamic = parse_importtime(
+            self._run(["-X", "importtime", "-c", IMPORT_MODULE_TIMER + TARGETS[target]])[1]
+        )
+        return dict(
+            target=target,
+            runs=runs,
+            wall_min_ms=round(min(wall), 1),
+            wall_median_ms=round(statistics.median(wall), 1),
+            import_ms=round(sum(self_us for _, self_us, _ in imports) / 1000, 1),
+            modules=len(imports),
+            **breakdown(imports, dynamic, top),
+        )
+
+    def handle(self, *args, **options):
+        reports = [self.profile(target, options["runs"], options["top"]) for target in options["targets"]]
+        if options["json"]:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+
+        for report in reports:
+            self.stdout.write(
+                f"{report['target']}: wall min {report['wall_min_ms']} ms, median {report['wall_median_ms']} ms "
+                f"over {report['runs']} runs; {report['modules']} modules imported in {report['import_ms']} ms"
+            )
+            self.stdout.write("  self time per package (ms)")
+            for package, ms in report["packages"].items():
+                self.stdout.write(f"    {package:<32}{ms:>10}")
+            self.stdout.write("  ethchange modules, cumulative (ms)")
+            for module, ms in report["ethchange"].items():
+                self.stdout.write(f"    {module:<32}{ms:>10}")
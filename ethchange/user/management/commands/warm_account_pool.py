@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from ethchange import injector
+
+
+class Command(BaseCommand):
+    help = "Fills the account pool with pre-generated Ethereum accounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=None, help="Number of available accounts to reach")
+
+    def handle(self, *args, **options):
+        account_pool = injector.account_pool()
+        created = account_pool.refill(options["size"])
+        self.stdout.write(f"Created {created} accounts, {account_pool.available()} available")
@@ -1,18 +1,33 @@
 from __future__ import annotations
 
+import asyncio
 import uuid
-from typing import Optional
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Optional
 
+from asgiref.sync import sync_to_async
 from dependency_injector.wiring import Provide, inject
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.contrib.auth.models import UserManager as ModelUserManager
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save
 from loguru import logger
 from rest_framework import serializers
-from web3 import Web3
 
+from config import settings
 from ethchange import ProviderContainer
+from ethchange.utils import chunked
+
+if TYPE_CHECKING:
+    from web3 import Web3
+
+    from ethchange.accounts import AccountPool
+    from ethchange.cache import BalanceCache, UnlockCache, UserCache
+    from ethchange.keystore import KeystoreGenerator
+    from ethchange.transactions import TransactionSender
+    from ethchange.user.backends import PasswordHasher
 
 
 # noinspection PyMethodOverriding
@@ -20,52 +35,344 @@ class UserManager(ModelUserManager):
     """UserManager"""
 
     @inject
-    def _generate_eth_account(self, password: str, web3: Web3 = Provide[ProviderContainer.web3_provider]) -> bytes:
-        account = web3.geth.personal.new_account(password).encode("utf-8")
+    def _claim_eth_account(
+            self, password: str, account_pool: AccountPool = Provide[ProviderContainer.account_pool]
+    ) -> bytes:
+        """Claims an account of the account pool, an empty byte string when the pool is disabled or empty"""
+        return account_pool.claim(password) if settings.account_pool_enabled else b""
+
+    @inject
+    def _ensure_rebound(
+            self, user: UserModel, password: str, account_pool: AccountPool = Provide[ProviderContainer.account_pool]
+    ):
+        account_pool.ensure_rebound(user.eth_account.decode("utf-8"), password)
+
+    def _create_pooled_user(self, password: str, fields: dict) -> Optional[UserModel]:
+        """
+        Creates a user with an account of the account pool, claimed in the transaction of the insert so it goes back
+        to the pool if the insert fails. Returns None when the pool is empty.
+        """
+        with transaction.atomic(using=self._db):
+            eth_account = self._claim_eth_account(password)
+            if eth_account:
+                return self.create(eth_account=eth_account, **fields)
+
+    def create_eth_account(self, password: str) -> bytes:
+        """Claims an account of the account pool or generates one, an empty byte string if none could be created"""
+        return self._claim_eth_account(password) or self._generate_eth_account(password=password)
+
+    @inject
+    def _generate_eth_account(
+            self,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.web3_provider],
+            keystore_generator: KeystoreGenerator = Provide[ProviderContainer.keystore_generator],
+    ) -> bytes:
+        if settings.account_backend == "keystore":
+            account = keystore_generator.generate(password).encode("utf-8")
+        else:
+            account = web3.geth.personal.new_account(password).encode("utf-8")
         if account:
             return account
         else:
             return b""
 
     @inject
-    def lock_eth_account(self, name: str, password: str, web3: Web3 = Provide[ProviderContainer.web3_provider]) -> bool:
-        user = self.filter(name=name, password=make_password(password)).first()
+    def get_cached(
+            self, field: str, value, user_cache: UserCache = Provide[ProviderContainer.user_cache]
+    ) -> Optional[UserModel]:
+        """Returns the user whose `field` equals `value` through the process local user cache"""
+        return user_cache.get(field, value)
+
+    @inject
+    async def aget_cached(
+            self, field: str, value, user_cache: UserCache = Provide[ProviderContainer.user_cache]
+    ) -> Optional[UserModel]:
+        return await user_cache.aget(field, value)
+
+    @inject
+    def get_current(
+            self, field: str, value, user_cache: UserCache = Provide[ProviderContainer.user_cache]
+    ) -> Optional[UserModel]:
+        """
+        Returns the user whose `field` equals `value` for authentication, a cached row is served only while its
+        password and permissions still match the database
+        """
+        return user_cache.get_current(field, value)
+
+    @inject
+    async def aget_current(
+            self, field: str, value, user_cache: UserCache = Provide[ProviderContainer.user_cache]
+    ) -> Optional[UserModel]:
+        return await user_cache.aget_current(field, value)
+
+    def get_by_natural_key(self, username: str) -> UserModel:
+        user = self.get_current(self.model.USERNAME_FIELD, username)
+        if user is None:
+            raise self.model.DoesNotExist
+        return user
+
+    def _verify_user(self, name: str, password: str) -> Optional[UserModel]:
+        user = self.get_current("name", name)
+        if user and user.check_password(password):
+            if settings.account_pool_enabled:
+                self._ensure_rebound(user, password)
+            return user
+
+    @inject
+    def verify_password(
+            self,
+            user: UserModel,
+            password: str,
+            password_hasher: PasswordHasher = Provide[ProviderContainer.password_hasher],
+    ) -> bool:
+        """Checks the password of a login on the bounded password hasher, raises `PasswordHasherBusy` if it is full"""
+        return password_hasher.check(user, password)
+
+    @inject
+    async def averify_password(
+            self,
+            user: UserModel,
+            password: str,
+            password_hasher: PasswordHasher = Provide[ProviderContainer.password_hasher],
+    ) -> bool:
+        return await password_hasher.acheck(user, password)
+
+    @inject
+    def lock_eth_account(
+            self,
+            name: str,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.web3_provider],
+            unlock_cache: UnlockCache = Provide[ProviderContainer.unlock_cache],
+    ) -> bool:
+        user = self._verify_user(name, password)
         if user:
-            web3.geth.personal.lock_account(user.eth_account)
+            unlock_cache.lock(user.eth_account.decode("utf-8"), web3)
         return bool(user)
 
     @inject
     def unlock_eth_account(
-            self, name: str, password: str, web3: Web3 = Provide[ProviderContainer.web3_provider]
+            self,
+            name: str,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.web3_provider],
+            unlock_cache: UnlockCache = Provide[ProviderContainer.unlock_cache],
     ) -> bool:
-        user = self.filter(name=name, password=make_password(password)).first()
+        user = self._verify_user(name, password)
         if user:
-            web3.geth.personal.unlock_account(user.eth_account, passphrase=password)
+            unlock_cache.unlock(user.eth_account.decode("utf-8"), password, web3)
         return bool(user)
 
     @inject
     def balance_eth_account(
-            self, name: str, password: str, web3: Web3 = Provide[ProviderContainer.web3_provider]
+            self,
+            name: str,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.web3_provider],
+            balance_cache: BalanceCache = Provide[ProviderContainer.balance_cache],
+    ) -> Optional[int]:
+        user = self.get_cached("name", name)
+        if user:
+            return balance_cache.get_balance(user.eth_account.decode("utf-8"), web3)
+
+    @inject
+    def send_eth(
+            self,
+            name: str,
+            password: str,
+            to: str,
+            value: int,
+            transaction_sender: TransactionSender = Provide[ProviderContainer.transaction_sender],
+    ) -> Optional[str]:
+        """
+        Sends `value` wei from the account of user `name` to `to`, returns the transaction hash or None if the password
+        is wrong. Raises ValueError if the node rejects the transaction and TransactionTimeout if it was not submitted in
+        time.
+        """
+        user = self._verify_user(name, password)
+        if user:
+            tx_hash = transaction_sender.send(user.eth_account.decode("utf-8"), password, to, value)
+            logger.opt(lazy=True).debug(f"[{user}] Sent [{value}] wei to [{to}] in [{tx_hash}]")
+            return tx_hash
+
+    @inject
+    def balance_eth_accounts(
+            self,
+            names: Optional[Iterable[str]] = None,
+            web3: Web3 = Provide[ProviderContainer.web3_provider],
+            balance_cache: BalanceCache = Provide[ProviderContainer.balance_cache],
+    ) -> tuple[int, dict[str, int]]:
+        """
+        Fetches the balances of many users through chunked JSON-RPC batches, all pinned to one block number.
+        Balances already in the balance cache for that block are not requested again.
+
+        Returns the block number of the snapshot and a mapping of user name to balance in wei.
+        """
+        from ethchange.rpc import batch_request
+
+        users = self.all() if names is None else self.filter(name__in=names)
+        block_number = balance_cache.head(web3)
+        accounts = users.values_list("name", "eth_account").iterator(chunk_size=settings.balance_batch_size)
+
+        balances = dict()
+        for chunk in chunked(accounts, settings.balance_batch_size):
+            addresses = {name: bytes(account).decode("utf-8") for name, account in chunk}
+            cached = balance_cache.get_balances(addresses.values(), block_number)
+            missing = [address for address in addresses.values() if address not in cached]
+            calls = [("eth_getBalance", [address, hex(block_number)]) for address in missing]
+            fetched = {address: int(balance, 16) for address, balance in zip(missing, batch_request(web3, calls))}
+            balance_cache.set_balances(fetched, block_number)
+            balances.update({name: cached.get(address, fetched.get(address)) for name, address in addresses.items()})
+
+        logger.opt(lazy=True).debug(f"[{len(balances)}] Balances fetched at block [{block_number}]")
+        return block_number, balances
+
+    @inject
+    async def _agenerate_eth_account(
+            self,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.async_web3_provider],
+            keystore_generator: KeystoreGenerator = Provide[ProviderContainer.keystore_generator],
+    ) -> bytes:
+        if settings.account_backend == "keystore":
+            account = await asyncio.wrap_future(keystore_generator.submit(password))
+        else:
+            account = await web3.geth.personal.new_account(password)
+        return account.encode("utf-8") if account else b""
+
+    async def _averify_user(self, name: str, password: str) -> Optional[UserModel]:
+        user = await self.aget_current("name", name)
+        if user and await sync_to_async(user.check_password, thread_sensitive=False)(password):
+            if settings.account_pool_enabled:
+                await sync_to_async(self._ensure_rebound)(user, password)
+            return user
+
+    @inject
+    async def alock_eth_account(
+            self,
+            name: str,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.async_web3_provider],
+            unlock_cache: UnlockCache = Provide[ProviderContainer.unlock_cache],
+    ) -> bool:
+        user = await self._averify_user(name, password)
+        if user:
+            await unlock_cache.alock(user.eth_account.decode("utf-8"), web3)
+        return bool(user)
+
+    @inject
+    async def aunlock_eth_account(
+            self,
+            name: str,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.async_web3_provider],
+            unlock_cache: UnlockCache = Provide[ProviderContainer.unlock_cache],
+    ) -> bool:
+        user = await self._averify_user(name, password)
+        if user:
+            await unlock_cache.aunlock(user.eth_account.decode("utf-8"), password, web3)
+        return bool(user)
+
+    @inject
+    async def abalance_eth_account(
+            self,
+            name: str,
+            password: str,
+            web3: Web3 = Provide[ProviderContainer.async_web3_provider],
+            balance_cache: BalanceCache = Provide[ProviderContainer.balance_cache],
     ) -> Optional[int]:
-        user = self.filter(name=name).first()
+        user = await self.aget_cached("name", name)
         if user:
-            return web3.eth.get_balance(account=user.eth_account.decode("utf-8"))
+            return await balance_cache.aget_balance(user.eth_account.decode("utf-8"), web3)
+
+    async def acreate_user(
+            self, name: str, password: str, phone: int, email: str, **extra_fields
+    ) -> Optional[UserModel]:
+        """Async variant of `create_user`, the node call and password hashing do not block the event loop"""
+        if not name:
+            raise ValueError("The given username must be set")
+
+        extra_fields.setdefault("is_staff", False)
+        extra_fields.setdefault("is_superuser", False)
+        if not await self.filter(name=name).afirst():
+            fields = dict(
+                name=self.model.normalize_username(name),
+                password=await sync_to_async(make_password, thread_sensitive=False)(password),
+                phone=phone,
+                email=self.normalize_email(email),
+                **extra_fields,
+            )
+            user = None
+            if settings.account_pool_enabled:
+                user = await sync_to_async(self._create_pooled_user)(password, fields)
+            if user is None:
+                eth_account = await self._agenerate_eth_account(password=password)
+                if eth_account:
+                    user = await self.acreate(eth_account=eth_account, **fields)
+            if user:
+                logger.opt(lazy=True).debug(f"[{user}] Created as Normal User")
+                return user
 
     def _create_user(self, name: str, password: str, phone: int, email: str, **extra_fields) -> Optional[UserModel]:
         if not name:
             raise ValueError("The given username must be set")
 
+        # an account created ahead, as by a signup job, is used instead of creating one
+        eth_account = extra_fields.pop("eth_account", b"")
         if not self.filter(name=name).first():
-            email = self.normalize_email(email)
-            name = self.model.normalize_username(name)
-            eth_account = self._generate_eth_account(password=password)
-            password = make_password(password)
+            fields = dict(
+                name=self.model.normalize_username(name),
+                password=make_password(password),
+                phone=phone,
+                email=self.normalize_email(email),
+                **extra_fields,
+            )
+            if not eth_account and settings.account_pool_enabled:
+                user = self._create_pooled_user(password, fields)
+                if user:
+                    return user
+            eth_account = eth_account or self._generate_eth_account(password=password)
+            if eth_account:
+                return self.create(eth_account=eth_account, **fields)
+
+    def bulk_create_users(self, user_infos: list[dict], workers: int) -> list[UserModel]:
+        """
+        Creates users from validated signup infos in a single transaction, generating their accounts and hashing their
+        passwords `workers` at a time.
+
+        Accounts of the account pool are claimed in the transaction of the insert, so they go back to the pool if it
+        fails. The `post_save` signals `bulk_create` skips are sent after the insert, which adds the users to the
+        address index and drops them from the user cache.
+        """
+
+        def build(user_info: dict, eth_account: bytes) -> Optional[UserModel]:
+            eth_account = eth_account or self._generate_eth_account(password=user_info["password"])
             if eth_account:
-                user = self.model(
-                    name=name, password=password, phone=phone, email=email, eth_account=eth_account, **extra_fields
+                return self.model(
+                    name=self.model.normalize_username(user_info["name"]),
+                    password=make_password(user_info["password"]),
+                    phone=user_info["phone"],
+                    email=self.normalize_email(user_info["email"]),
+                    eth_account=eth_account,
                 )
-                user.save(using=self._db)
-                return user
+
+        with transaction.atomic(using=self._db):
+            claimed = []
+            for user_info in user_infos:
+                eth_account = self._claim_eth_account(user_info["password"])
+                if not eth_account:
+                    break
+                claimed.append(eth_account)
+            claimed.extend(b"" for _ in range(len(user_infos) - len(claimed)))
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-create-users") as executor:
+                users = [user for user in executor.map(build, user_infos, claimed) if user is not None]
+            users = self.bulk_create(users)
+
+        for user in users:
+            post_save.send(sender=self.model, instance=user, created=True, update_fields=None, raw=False, using=self._db)
+        return users
 
     def remove_user(self, name: str) -> bool:
         # password = make_password(password)
@@ -119,6 +426,22 @@ class UserModel(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = ["email", "phone", "password"]
 
 
+class PooledEthAccount(models.Model):
+    """Account created ahead of signup under the account pool passphrase"""
+
+    eth_account = models.BinaryField(unique=True, blank=False, max_length=20)
+    created = models.DateTimeField(auto_now_add=True)
+    # set when handed out at signup, the row is deleted once the account is re-encrypted for its user
+    claimed = models.DateTimeField(null=True, blank=True, default=None)
+
+
+class AccountNonce(models.Model):
+    """Next nonce of an account sending transfers, shared by every process sending from it"""
+
+    address = models.CharField(primary_key=True, max_length=42)
+    nonce = models.BigIntegerField()
+
+
 class UserModelSerializer(serializers.ModelSerializer):
     """
     User Model Serializer
@@ -132,3 +455,11 @@ class UserModelSerializer(serializers.ModelSerializer):
             "email",
             "phone",
         ]
+
+
+def serialize_user_values(row: dict) -> dict:
+    """
+    Representation of `UserModelSerializer` built from a row of `.values(*UserModelSerializer.Meta.fields)`, without
+    the DRF field machinery. The `eth_account` bytes are base64 encoded like `BinaryField.value_to_string` does.
+    """
+    return dict(row, eth_account=b64encode(bytes(row["eth_account"])).decode("ascii"))
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from dependency_injector.wiring import Provide, inject
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ethchange import ProviderContainer
+from ethchange.cache import UserCache
+from ethchange.user.index import AddressIndex
+from ethchange.user.models import UserModel
+
+
+@receiver(post_save, sender=UserModel)
+@inject
+def index_user_address(
+    sender, instance: UserModel, address_index: AddressIndex = Provide[ProviderContainer.address_index], **kwargs
+):
+    if instance.eth_account:
+        address_index.add(instance.eth_account, instance.pk)
+
+
+@receiver(post_delete, sender=UserModel)
+@inject
+def unindex_user_address(
+    sender, instance: UserModel, address_index: AddressIndex = Provide[ProviderContainer.address_index], **kwargs
+):
+    if instance.eth_account:
+        address_index.remove(instance.eth_account)
+
+
+@receiver(post_save, sender=UserModel)
+@receiver(post_delete, sender=UserModel)
+@inject
+def invalidate_cached_user(
+    sender,
+    instance: UserModel,
+    user_cache: UserCache = Provide[ProviderContainer.user_cache],
+    update_fields: Optional[frozenset] = None,
+    **kwargs,
+):
+    # logins only write last_login or an upgraded password hash, the cached row is replaced rather than dropped
+    if update_fields and update_fields <= {"last_login", "password"}:
+        user_cache.update(instance)
+    else:
+        user_cache.invalidate(instance)
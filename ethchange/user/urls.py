@@ -3,8 +3,21 @@ from __future__ import annotations
 from django.urls import path
 from rest_framework import routers
 
+from ethchange.user import async_views
 from ethchange.user.views import UserViewSet, login, signup
 
 router = routers.SimpleRouter()
 router.register(r"users", UserViewSet)
-urlpatterns = (path("users/login/", login, name="login"), path("users/signup/", signup, name="signup"), *router.urls)
+async_urlpatterns = (
+    path("async/users/login/", async_views.login, name="async-login"),
+    path("async/users/signup/", async_views.signup, name="async-signup"),
+    path("async/users/<str:name>/lock_wallet/", async_views.lock_wallet, name="async-lock-wallet"),
+    path("async/users/<str:name>/unlock_wallet/", async_views.unlock_wallet, name="async-unlock-wallet"),
+    path("async/users/<str:name>/balance_eth_account/", async_views.balance_eth_account, name="async-balance"),
+)
+urlpatterns = (
+    path("users/login/", login, name="login"),
+    path("users/signup/", signup, name="signup"),
+    *router.urls,
+    *async_urlpatterns,
+)
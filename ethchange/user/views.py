@@ -1,53 +1,153 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import AsyncIterator, Iterator, Optional
 
+import orjson
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
 from django.contrib.auth import login as _login
 from django.contrib.auth import logout as _logout
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q, QuerySet
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from eth_utils import is_address
 from rest_framework import status, viewsets
 from rest_framework.decorators import action, api_view, parser_classes, permission_classes
+from rest_framework.pagination import CursorPagination
 from rest_framework.parsers import JSONParser
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from ethchange.user.models import UserModel, UserModelSerializer
-
-
-@api_view(["POST"])
-@parser_classes([JSONParser])
-@permission_classes([AllowAny])
-def signup(request: Request) -> Response:
+from config import settings
+from ethchange import injector
+from ethchange.db.routers import replica_reads
+from ethchange.indexer.models import Transfer, TransferSerializer
+from ethchange.logs import rate_limited
+from ethchange.transactions import TransactionTimeout
+from ethchange.user.backends import PasswordHasherBusy
+from ethchange.user.models import UserModel, UserModelSerializer, serialize_user_values
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson, the output is the same as the one of JSONRenderer. Types orjson does not
+    encode natively, and datetimes which DRF formats its own way, go through the DRF encoder; data holding integers
+    beyond 64 bits is rendered by JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}) or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            rendered = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            # orjson only encodes 64 bit integers, wei amounts above that go through the json module
+            return super().render(data, accepted_media_type, renderer_context)
+        return rendered.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders a list as newline delimited JSON, one item per line"""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        items = data if isinstance(data, list) else [data]
+        renderer = ORJSONRenderer()
+        return b"".join(renderer.render(item) + b"\n" for item in items)
+
+
+class UserCursorPagination(CursorPagination):
+    """Keyset pagination over the unique, indexed name column"""
+
+    ordering = "name"
+    page_size = settings.user_page_size
+    page_size_query_param = "page_size"
+    max_page_size = settings.user_max_page_size
+
+
+def parse_signup_info(req_data: dict) -> tuple[dict, Optional[str]]:
+    """Validates a signup payload, returns the user info and an error message if the payload is invalid"""
     user_info = dict()
-    req_data = request.data
 
     if "password" in req_data.keys():
         user_info["password"] = req_data["password"]
     else:
-        return Response(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
+        return user_info, "Missing UserInfoAttribute [password]"
 
     if "name" in req_data.keys():
         user_info["name"] = req_data["name"]
-        if UserModel.objects.filter(name=req_data["name"]).first():
-            return Response(dict(message="User Account Exists"), status=status.HTTP_400_BAD_REQUEST)
     else:
-        return Response(dict(message="Missing UserInfoAttribute [name]"), status=status.HTTP_400_BAD_REQUEST)
+        return user_info, "Missing UserInfoAttribute [name]"
 
     if "phone" in req_data.keys() and (
             isinstance(req_data.get("phone"), int) and 1000000000 <= req_data.get("phone") <= 9999999999
     ):
         user_info["phone"] = req_data["phone"]
     else:
-        return Response(dict(message="Missing UserInfoAttribute [phone]"), status=status.HTTP_400_BAD_REQUEST)
+        return user_info, "Missing UserInfoAttribute [phone]"
 
     if "email" in req_data.keys():
         user_info["email"] = req_data["email"]
     else:
-        return Response(dict(message="Missing UserInfoAttribute [email]"), status=status.HTTP_400_BAD_REQUEST)
+        return user_info, "Missing UserInfoAttribute [email]"
+
+    return user_info, None
+
+
+# answer of requests shed under load, clients retry after a second
+RETRY_LATER = {"Retry-After": "1"}
+
+
+def accepted(job) -> Response:
+    """Answers a request whose work was queued as `job`, polled at the job status endpoint"""
+    return Response(
+        dict(job_id=str(job.pk), status=job.status),
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": reverse("job-status", args=[job.pk])},
+    )
 
-    if UserModel.objects.create_user(**user_info) is not None:
+
+def parse_login_lookup(req_data: dict) -> Optional[dict]:
+    """Returns the field lookup identifying the user of a login payload"""
+    for field in ("name", "phone", "email"):
+        if field in req_data.keys():
+            return {field: req_data[field]}
+
+
+@api_view(["POST"])
+@parser_classes([JSONParser])
+@permission_classes([AllowAny])
+def signup(request: Request) -> Response:
+    user_info, message = parse_signup_info(request.data)
+    if message:
+        return Response(dict(message=message), status=status.HTTP_400_BAD_REQUEST)
+
+    if UserModel.objects.get_cached("name", user_info["name"]):
+        return Response(dict(message="User Account Exists"), status=status.HTTP_400_BAD_REQUEST)
+
+    if settings.jobs_enabled:
+        return accepted(injector.job_queue().enqueue("signup", user_info))
+
+    user = UserModel.objects.create_user(**user_info)
+    if user is not None and settings.auth_login_mode == "low_write":
+        # create_user just hashed the password, the new user is logged in without checking it again
+        _login(request, user)
+        return Response({"message": "Success"}, status=status.HTTP_201_CREATED)
+
+    if user is not None:
         user = authenticate(request, name=user_info["name"], password=user_info["password"])
         if user is not None:
             _login(request, user)
@@ -61,54 +161,107 @@ def signup(request: Request) -> Response:
 @parser_classes([JSONParser])
 @permission_classes([AllowAny])
 def login(request: Request) -> Response:
-    user_info = dict()
     req_data = request.data
 
-    if "password" in req_data.keys():
-        user_info["password"] = req_data["password"]
-    else:
+    if "password" not in req_data.keys():
         return Response(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
 
-    if "name" in req_data.keys():
-        user = UserModel.objects.filter(name=req_data["name"]).first()
-
-    elif "phone" in req_data.keys():
-        user = UserModel.objects.filter(phone=req_data["phone"]).first()
-
-    elif "email" in req_data.keys():
-        user = UserModel.objects.filter(email=req_data["email"]).first()
-
-    else:
+    lookup = parse_login_lookup(req_data)
+    if lookup is None:
         return Response(dict(message="Missing UserInfoAttributes"), status=status.HTTP_400_BAD_REQUEST)
 
-    if user:
+    user = UserModel.objects.get_current(*lookup.popitem())
+    if user and settings.auth_login_mode == "low_write":
+        try:
+            verified = UserModel.objects.verify_password(user, req_data["password"])
+        except PasswordHasherBusy as error:
+            return Response(dict(message=str(error)), status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=RETRY_LATER)
+        if verified and user.is_active:
+            # writes the session and last_login, nothing else of the user row
+            _login(request, user)
+            return Response({"message": "Success"}, status=status.HTTP_200_OK)
+
+    elif user:
         password = req_data["password"]
         user = authenticate(request, username=user.name, password=password)
         if user is not None:
             _login(request, user)
             user.save()
-
-        return Response({"message": "Success"}, status=status.HTTP_200_OK)
+            return Response({"message": "Success"}, status=status.HTTP_200_OK)
 
     return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+class TransferCursorPagination(CursorPagination):
+    """Keyset pagination over the insertion order of transfers, newest first"""
+
+    ordering = "-pk"
+    page_size = settings.user_page_size
+    page_size_query_param = "page_size"
+    max_page_size = settings.user_max_page_size
+
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = UserModel.objects.all()
     serializer_class = UserModelSerializer
-    renderer_classes = [JSONRenderer]
+    renderer_classes = [ORJSONRenderer, NDJSONRenderer]
     parser_classes = [JSONParser]
     permission_classes = [IsAuthenticated]
-
-    def list(self, request: Request, *args, **kwargs) -> Response:
-        user = UserModel.objects.all()
-        if user:
-            serializer = self.get_serializer_class()(user, many=True)
-            return Response(data=serializer.data, status=status.HTTP_200_OK)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
+    pagination_class = UserCursorPagination
+
+    def _chunk(self, queryset: QuerySet, after: Optional[str]) -> list[dict]:
+        """Returns the represented users of the chunk following the user named `after`, ordered by name"""
+        serializer = self.get_serializer_class()()
+        if after is not None:
+            queryset = queryset.filter(name__gt=after)
+        if settings.user_fast_reads:
+            users, represent = queryset.values(*serializer.Meta.fields), serialize_user_values
+        else:
+            users, represent = queryset.only(*serializer.Meta.fields), serializer.to_representation
+        # the stream is consumed after the view returned, outside of its replica_reads block
+        with replica_reads():
+            return [represent(user) for user in users[: settings.user_stream_chunk_size]]
+
+    def _stream(self, queryset: QuerySet) -> Iterator[bytes]:
+        after = None
+        while users := self._chunk(queryset, after):
+            after = users[-1]["name"]
+            yield NDJSONRenderer().render(users)
+
+    async def _astream(self, queryset: QuerySet) -> AsyncIterator[bytes]:
+        after = None
+        while users := await sync_to_async(self._chunk)(queryset, after):
+            after = users[-1]["name"]
+            yield NDJSONRenderer().render(users)
+
+    @replica_reads()
+    def list(self, request: Request, *args, **kwargs) -> Response | StreamingHttpResponse:
+        """
+        Lists users a page at a time, or every user as a NDJSON stream when `application/x-ndjson` is accepted
+        (or `?format=ndjson` is given). Either way only one page or chunk of rows is held in memory.
+
+        The stream reads keyset chunks by name. Under ASGI the streaming content is iterated on the event loop, where
+        the ORM can not run, so there each chunk is read through `sync_to_async`.
+        """
+        user = UserModel.objects.order_by(UserCursorPagination.ordering)
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            stream = self._astream if isinstance(request._request, ASGIRequest) else self._stream
+            return StreamingHttpResponse(stream(user), content_type=NDJSONRenderer.media_type)
+
+        if settings.user_fast_reads:
+            page = self.paginate_queryset(user.values(*self.get_serializer_class().Meta.fields))
+            return self.get_paginated_response([serialize_user_values(row) for row in page])
+
+        page = self.paginate_queryset(user)
+        serializer = self.get_serializer_class()(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @replica_reads()
     def retrieve(self, request: Request, pk: Optional[str] = None, *args, **kwargs) -> Response:
-        user = UserModel.objects.filter(name=pk).first()
+        user = UserModel.objects.get_cached("name", pk)
+        if user and settings.user_fast_reads:
+            row = {field: getattr(user, field) for field in self.get_serializer_class().Meta.fields}
+            return Response(data=serialize_user_values(row), status=status.HTTP_200_OK)
         if user:
             serializer = self.get_serializer_class()(user)
             return Response(data=serializer.data, status=status.HTTP_200_OK)
@@ -116,7 +269,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(basename="user", name="logout", methods=["POST"], detail=True)
     def logout(self, request: Request, pk: Optional[str] = None) -> Response:
-        user = UserModel.objects.filter(name=pk).first()
+        user = UserModel.objects.get_cached("name", pk)
         if user:
             _logout(request)
             return Response(status=status.HTTP_200_OK)
@@ -140,7 +293,11 @@ class UserViewSet(viewsets.ModelViewSet):
         if "password" not in request.data.keys():
             return Response(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
 
-        data = UserModel.objects.lock_wallet(name=pk, password=request.data["password"])
+        if settings.jobs_enabled:
+            payload = dict(name=pk, password=request.data["password"])
+            return accepted(injector.job_queue().enqueue("lock_wallet", payload, owner=request.user.get_username()))
+
+        data = UserModel.objects.lock_eth_account(name=pk, password=request.data["password"])
         if data:
             return Response(status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -150,16 +307,20 @@ class UserViewSet(viewsets.ModelViewSet):
         if "password" not in request.data.keys():
             return Response(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
 
-        data = UserModel.objects.unlock_wallet(name=pk, password=request.data["password"])
+        if settings.jobs_enabled:
+            payload = dict(name=pk, password=request.data["password"])
+            return accepted(injector.job_queue().enqueue("unlock_wallet", payload, owner=request.user.get_username()))
+
+        data = UserModel.objects.unlock_eth_account(name=pk, password=request.data["password"])
         if data:
             return Response(status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(basename="user", name="balance_eth_account", methods=["GET"], detail=True)
+    @replica_reads()
     def balance_eth_account(self, request: Request, pk: Optional[str] = None) -> Response:
-        from loguru import logger
-
-        logger.info(request.data)
+        # hit on every balance poll, the request body holding the password is never logged
+        rate_limited("user.balance_eth_account").debug(f"[{pk}] Balance requested")
         if "password" not in request.data.keys():
             return Response(dict(message="Missing UserInfoAttribute [password]"), status=status.HTTP_400_BAD_REQUEST)
 
@@ -167,3 +328,46 @@ class UserViewSet(viewsets.ModelViewSet):
         if data is not None:
             return Response(data=dict(balance=data), status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    @action(basename="user", name="send", methods=["POST"], detail=True)
+    def send(self, request: Request, pk: Optional[str] = None) -> Response:
+        for attribute in ("password", "to", "value"):
+            if attribute not in request.data.keys():
+                return Response(
+                    dict(message=f"Missing UserInfoAttribute [{attribute}]"), status=status.HTTP_400_BAD_REQUEST
+                )
+
+        to, value = request.data["to"], request.data["value"]
+        if not (isinstance(to, str) and is_address(to)):
+            return Response(dict(message="Invalid Address [to]"), status=status.HTTP_400_BAD_REQUEST)
+        if not (isinstance(value, int) and value >= 0):
+            return Response(dict(message="Invalid Value [value]"), status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tx_hash = UserModel.objects.send_eth(name=pk, password=request.data["password"], to=to, value=value)
+        except ValueError as error:
+            return Response(dict(message=str(error)), status=status.HTTP_400_BAD_REQUEST)
+        except TransactionTimeout as error:
+            return Response(dict(message=str(error)), status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=RETRY_LATER)
+        if tx_hash:
+            return Response(data=dict(tx_hash=tx_hash), status=status.HTTP_201_CREATED)
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    @action(basename="user", name="balances", methods=["GET"], detail=False, permission_classes=[IsAdminUser])
+    @replica_reads()
+    def balances(self, request: Request) -> Response:
+        names = request.query_params.getlist("name") or None
+        block_number, balances = UserModel.objects.balance_eth_accounts(names=names)
+        return Response(data=dict(block_number=block_number, balances=balances), status=status.HTTP_200_OK)
+
+    @action(basename="user", name="transactions", methods=["GET"], detail=True)
+    @replica_reads()
+    def transactions(self, request: Request, pk: Optional[str] = None) -> Response:
+        user = UserModel.objects.get_cached("name", pk)
+        if user:
+            address = user.eth_account.decode("utf-8").lower()
+            transfers = Transfer.objects.filter(Q(sender=address) | Q(receiver=address))
+            paginator = TransferCursorPagination()
+            page = paginator.paginate_queryset(transfers, request, view=self)
+            return paginator.get_paginated_response(TransferSerializer(page, many=True).data)
+        return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from config import settings
+from ethchange import injector
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@permission_classes([IsAdminUser])
+def stats(request: Request) -> Response:
+    """
+    Process local counters of the node client, the caches in front of it, the sender, the metrics exporter and the
+    admission control, and the depths of the job queue
+    """
+    data = dict(
+        web3_provider_mode=settings.web3_provider_mode,
+        web3_pool=injector.pooled_http_provider().stats(),
+        balance_cache=injector.balance_cache().stats(),
+        user_cache=injector.user_cache().stats(),
+        unlock_cache=injector.unlock_cache().stats(),
+        password_hasher=injector.password_hasher().stats(),
+        rpc=injector.rpc_metrics().stats(),
+        transactions=injector.transaction_sender().stats(),
+        fees=injector.fee_oracle().stats(),
+    )
+    if settings.metrics_enabled:
+        data["metrics"] = injector.metrics_exporter().stats()
+    if settings.admission_enabled:
+        data["admission"] = injector.admission_controller().stats()
+    if settings.admission_node_concurrency:
+        data["node_slots"] = injector.node_limiter().stats()
+    if settings.jobs_enabled:
+        data["jobs"] = injector.job_queue().stats()
+    if settings.web3_provider_mode == "router":
+        data["router"] = injector.router_provider().stats()
+    return Response(data=data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@permission_classes([AllowAny])
+def fees(request: Request) -> Response:
+    """Fee estimates per tier in wei, with their age in seconds and how many blocks they lag the head"""
+    return Response(data=injector.fee_oracle().estimates(injector.web3_provider()), status=status.HTTP_200_OK)
@@ -5,8 +5,12 @@ WSGI config for ethchange project.
 from __future__ import annotations
 
 import os
+from pathlib import Path
 
 from django.core.wsgi import get_wsgi_application
 
+from ethchange.logs import configure_logging
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ethchange.settings")
+configure_logging(Path(__file__).resolve().parent.parent / "volume")
 application = get_wsgi_application()
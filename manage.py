@@ -7,7 +7,7 @@ from pathlib import Path
 
 from loguru import logger
 
-from config import settings
+from ethchange.logs import configure_logging
 
 
 @logger.catch
@@ -24,10 +24,7 @@ def main():
         os.mkdir(base_dir / "logs")
 
     # Loguru configurations
-    logger.add(
-        sink=(base_dir / "logs" / "ethchange.log"),
-        level="SUCCESS" if not settings.debug else "TRACE",
-    )
+    configure_logging(base_dir)
 
     try:
         from django.core.management import execute_from_command_line
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable
+
+import pytest
+from django.test import AsyncClient, Client
+
+from test.bench.harness import int_list
+from test.stub_node import StubNode
+
+
+@pytest.fixture
+def bench_stub(request, stub_node) -> StubNode:
+    """The stub node, answering with the round trip latency of a local geth node"""
+    stub_node.latency = request.config.getoption("--stub-latency")
+    return stub_node
+
+
+@pytest.fixture
+def concurrency_levels(request) -> list[int]:
+    return int_list(request.config.getoption("--bench-concurrency"))
+
+
+@pytest.fixture
+def user_counts(request) -> list[int]:
+    return int_list(request.config.getoption("--bench-users"))
+
+
+@pytest.fixture
+def bench_requests(request) -> int:
+    return request.config.getoption("--bench-requests")
+
+
+def thread_clients(user=None) -> Callable[[], Client]:
+    """Returns a getter of one test client per thread, logged in as `user` if given"""
+    local = threading.local()
+
+    def client() -> Client:
+        if not hasattr(local, "client"):
+            local.client = Client()
+            if user is not None:
+                local.client.force_login(user)
+        return local.client
+
+    return client
+
+
+def async_client(user=None) -> AsyncClient:
+    client = AsyncClient()
+    if user is not None:
+        client.force_login(user)
+    return client
@@ -0,0 +1,99 @@
+"""
+Load generation helpers of the benchmarks.
+
+Every run sends `requests` calls from `concurrency` workers and reports the throughput and latency percentiles.
+"""
+from __future__ import annotations
+
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable
+
+from django.db import connections
+
+# one loop for every run, like the loop of an ASGI server, as the aiohttp sessions web3 caches are bound to it
+_loop = asyncio.new_event_loop()
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+    """Throughput in requests per second and latency percentiles in milliseconds"""
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return dict(
+        requests=len(latencies) + errors,
+        errors=errors,
+        elapsed_s=round(elapsed, 4),
+        throughput=round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        p50_ms=round(quantiles[49] * 1000, 3) if latencies else None,
+        p99_ms=round(quantiles[98] * 1000, 3) if latencies else None,
+    )
+
+
+def run_threads(call: Callable[[int], bool], concurrency: int, requests: int) -> dict[str, Any]:
+    """
+    Calls `call(index)` `requests` times from `concurrency` threads, a falsy result or an exception counts as an
+    error. Each thread closes its database connections once done.
+    """
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(index: int):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = call(index)
+        except Exception:  # pylint: disable=broad-except
+            ok = False
+        latency = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+
+    def worker(indexes: range):
+        try:
+            for index in indexes:
+                timed(index)
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="bench") as executor:
+        list(executor.map(worker, [range(first, requests, concurrency) for first in range(concurrency)]))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_tasks(call: Callable[[int], Awaitable[bool]], concurrency: int, requests: int) -> dict[str, Any]:
+    """Awaits `call(index)` `requests` times on one event loop with at most `concurrency` calls in flight"""
+    latencies: list[float] = []
+    errors = 0
+
+    async def timed(semaphore: asyncio.Semaphore, index: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await call(index)
+            except Exception:  # pylint: disable=broad-except
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(timed(semaphore, index) for index in range(requests)))
+
+    started = time.perf_counter()
+    _loop.run_until_complete(main())
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
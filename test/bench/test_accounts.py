@@ -0,0 +1,75 @@
+"""
+Account creation throughput of the geth and keystore backends, and of the bulk user import.
+"""
+from __future__ import annotations
+
+import io
+import json
+import time
+
+import pytest
+from django.core.management import call_command
+
+from ethchange import injector
+from ethchange.keystore import KeystoreGenerator
+from test.bench.harness import run_threads
+
+pytestmark = pytest.mark.benchmark
+
+# scrypt cost of both backends, lower than geth's default so a run stays short while the key derivation still dominates
+SCRYPT_N = 2**14
+
+
+def test_account_backends(bench_stub, benchmark_results, concurrency_levels, bench_requests, tmp_path):
+    bench_stub.new_account_scrypt_n = SCRYPT_N
+    web3 = injector.web3_provider()
+    for concurrency in concurrency_levels:
+        result = run_threads(lambda index: web3.geth.personal.new_account(f"pw{index}"), concurrency, bench_requests)
+        benchmark_results.record("accounts.geth", concurrency=concurrency, scrypt_n=SCRYPT_N, **result)
+        assert result["errors"] == 0
+
+    generator = KeystoreGenerator(keystore_dir=str(tmp_path), scrypt_n=SCRYPT_N, workers=0)
+    try:
+        generator.generate("warm-up")
+        start = time.perf_counter()
+        addresses = generator.generate_many(f"pw{index}" for index in range(bench_requests))
+        elapsed = time.perf_counter() - start
+    finally:
+        generator.executor.shutdown()
+    benchmark_results.record(
+        "accounts.keystore",
+        scrypt_n=SCRYPT_N,
+        requests=len(addresses),
+        elapsed_s=round(elapsed, 4),
+        throughput=round(len(addresses) / elapsed, 2),
+    )
+    assert len(set(addresses)) == bench_requests
+
+
+@pytest.mark.django_db(transaction=True)
+def test_import_users(bench_stub, benchmark_results, bench_requests, tmp_path):
+    path = tmp_path / "users.ndjson"
+    rows = [
+        dict(
+            name=f"import{index}",
+            password=f"pw{index}",
+            phone=4000000000 + index,
+            email=f"import{index}@ethchange.test",
+        )
+        for index in range(bench_requests)
+    ]
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+    start = time.perf_counter()
+    call_command("import_users", str(path), stdout=io.StringIO(), stderr=io.StringIO())
+    elapsed = time.perf_counter() - start
+
+    from ethchange.user.models import UserModel
+
+    assert UserModel.objects.filter(name__startswith="import").count() == bench_requests
+    benchmark_results.record(
+        "accounts.import_users",
+        requests=bench_requests,
+        elapsed_s=round(elapsed, 4),
+        throughput=round(bench_requests / elapsed, 2),
+    )
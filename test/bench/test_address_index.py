@@ -0,0 +1,71 @@
+"""
+Matching the addresses of a block against the users, through the address index and through the ORM.
+"""
+from __future__ import annotations
+
+import random
+import time
+
+import pytest
+from web3 import Web3
+
+from ethchange.user.index import AddressIndex
+from ethchange.user.models import UserModel
+from test.bench.harness import summarize
+from test.conftest import make_users, user_address
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+BLOCKS = 100
+TRANSACTIONS = 200
+# share of the addresses of a block that belong to a user
+USER_SHARE = 0.05
+
+
+def _blocks(user_count: int) -> list[list[str]]:
+    rng = random.Random(user_count)
+    blocks = []
+    for _ in range(BLOCKS):
+        addresses = []
+        for _ in range(TRANSACTIONS * 2):
+            if rng.random() < USER_SHARE:
+                addresses.append(user_address(rng.randrange(user_count)))
+            else:
+                addresses.append(Web3.toChecksumAddress("0x" + rng.randbytes(20).hex()))
+        blocks.append(addresses)
+    return blocks
+
+
+def _time_blocks(match, blocks: list[list[str]]) -> tuple[dict, int]:
+    latencies, matched = [], 0
+    for addresses in blocks:
+        start = time.perf_counter()
+        matched += len(match(addresses))
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, 0, sum(latencies)), matched
+
+
+def test_block_matching(benchmark_results, user_counts):
+    names: list[str] = []
+    for user_count in user_counts:
+        names.extend(make_users(user_count - len(names), start=len(names)))
+        blocks = _blocks(user_count)
+
+        def orm(addresses: list[str]) -> dict:
+            accounts = [address.encode("utf-8") for address in set(addresses)]
+            return dict(UserModel.objects.filter(eth_account__in=accounts).values_list("eth_account", "pkid"))
+
+        index = AddressIndex(refresh_interval=3600)
+        start = time.perf_counter()
+        index.rebuild()
+        build_ms = round((time.perf_counter() - start) * 1000, 3)
+        results = dict(
+            orm=_time_blocks(orm, blocks), index=_time_blocks(lambda addresses: index.get_many(set(addresses)), blocks)
+        )
+        results["index"][0]["build_ms"] = build_ms
+
+        for name, (result, matched) in results.items():
+            benchmark_results.record(
+                f"address_index.{name}", users=user_count, transactions=TRANSACTIONS, matched=matched, **result
+            )
+        assert len({matched for _, matched in results.values()}) == 1
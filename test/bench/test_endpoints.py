@@ -0,0 +1,149 @@
+"""
+Throughput and latency of the user endpoints per concurrency level and user table size.
+"""
+from __future__ import annotations
+
+import json
+
+import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from config import settings
+
+from test.bench.conftest import async_client, thread_clients
+from test.bench.harness import run_tasks, run_threads
+from test.conftest import make_user, make_users
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+PASSWORD = "bench-password"
+
+
+def _grow_users(names: list[str], count: int):
+    if len(names) < count:
+        names.extend(make_users(count - len(names), start=len(names)))
+
+
+def test_signup(bench_stub, benchmark_results, concurrency_levels, user_counts, bench_requests):
+    names: list[str] = []
+    run = 0
+    for user_count in user_counts:
+        _grow_users(names, user_count)
+        for concurrency in concurrency_levels:
+            client = thread_clients()
+            run += 1
+            prefix = f"signup-{run}-"
+            phones = 3000000000 + run * 100000
+
+            def signup(index: int) -> bool:
+                payload = dict(
+                    name=f"{prefix}{index}",
+                    password=PASSWORD,
+                    phone=phones + index,
+                    email=f"{prefix}{index}@ethchange.test",
+                )
+                response = client().post("/users/signup/", payload, content_type="application/json")
+                return response.status_code == 201
+
+            result = run_threads(signup, concurrency, bench_requests)
+            benchmark_results.record("endpoint.signup", users=user_count, concurrency=concurrency, **result)
+            assert result["errors"] == 0
+
+
+def test_login(bench_stub, benchmark_results, concurrency_levels, user_counts, bench_requests):
+    names: list[str] = []
+    make_user("bench", PASSWORD, 0)
+    for user_count in user_counts:
+        _grow_users(names, user_count)
+        for concurrency in concurrency_levels:
+            client = thread_clients()
+
+            def login(index: int) -> bool:
+                payload = dict(name="bench", password=PASSWORD)
+                return client().post("/users/login/", payload, content_type="application/json").status_code == 200
+
+            result = run_threads(login, concurrency, bench_requests)
+            benchmark_results.record("endpoint.login", users=user_count, concurrency=concurrency, **result)
+            assert result["errors"] == 0
+
+
+@pytest.mark.parametrize(
+    "mode, backend",
+    [("authenticate", "db"), ("low_write", "db"), ("low_write", "cache"), ("low_write", "signed_cookies")],
+)
+def test_login_modes(bench_stub, benchmark_results, concurrency_levels, bench_requests, monkeypatch, mode, backend):
+    """Login throughput and database writes per login of the previous path against the low-write one per session store"""
+    monkeypatch.setattr(settings, "auth_login_mode", mode)
+    make_user("bench", PASSWORD, 0)
+    with override_settings(SESSION_ENGINE=f"django.contrib.sessions.backends.{backend}"):
+        for concurrency in concurrency_levels:
+            client = thread_clients()
+
+            def login(index: int) -> bool:
+                payload = dict(name="bench", password=PASSWORD)
+                return client().post("/users/login/", payload, content_type="application/json").status_code == 200
+
+            with CaptureQueriesContext(connection) as queries:
+                login(0)
+            writes = sum(not query["sql"].startswith("SELECT") for query in queries.captured_queries)
+            result = run_threads(login, concurrency, bench_requests)
+            benchmark_results.record(
+                f"endpoint.login.{mode}.{backend}", concurrency=concurrency, writes_per_login=writes, **result
+            )
+            assert result["errors"] == 0
+
+
+def test_list_and_retrieve(bench_stub, benchmark_results, concurrency_levels, user_counts, bench_requests):
+    names: list[str] = []
+    user = make_user("bench", PASSWORD, 0)
+    for user_count in user_counts:
+        _grow_users(names, user_count)
+        for concurrency in concurrency_levels:
+            client = thread_clients(user)
+
+            def retrieve(index: int) -> bool:
+                return client().get(f"/users/{names[index * 7919 % len(names)]}/").status_code == 200
+
+            def page(index: int) -> bool:
+                return client().get("/users/", dict(page_size=100)).status_code == 200
+
+            for name, call in (("endpoint.retrieve", retrieve), ("endpoint.list", page)):
+                result = run_threads(call, concurrency, bench_requests)
+                benchmark_results.record(name, users=user_count, concurrency=concurrency, **result)
+                assert result["errors"] == 0
+
+
+def test_balance_sync_and_async(bench_stub, benchmark_results, concurrency_levels, bench_requests):
+    """
+    Balance lookups reach the node once per address and block, so each request asks for another user's balance.
+    The sync endpoint runs in a thread per concurrent request, the async one on a single event loop.
+    """
+    names = make_users(bench_requests)
+    user = make_user("bench", PASSWORD, 0)
+    body = json.dumps(dict(password=PASSWORD))
+    for concurrency in concurrency_levels:
+        caches["balances"].clear()
+        client = thread_clients(user)
+
+        def balance(index: int) -> bool:
+            path = f"/users/{names[index]}/balance_eth_account/"
+            return client().generic("GET", path, body, content_type="application/json").status_code == 200
+
+        result = run_threads(balance, concurrency, bench_requests)
+        benchmark_results.record("endpoint.balance.sync", concurrency=concurrency, **result)
+        assert result["errors"] == 0
+
+        caches["balances"].clear()
+        aclient = async_client(user)
+
+        async def abalance(index: int) -> bool:
+            path = f"/async/users/{names[index]}/balance_eth_account/"
+            response = await aclient.generic("GET", path, body, content_type="application/json")
+            return response.status_code == 200
+
+        result = run_tasks(abalance, concurrency, bench_requests)
+        benchmark_results.record("endpoint.balance.async", concurrency=concurrency, **result)
+        assert result["errors"] == 0
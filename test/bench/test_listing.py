@@ -0,0 +1,100 @@
+"""
+Cursor page latency and NDJSON stream throughput and memory over a large user table, and rows per second of the
+serializer and `.values()` read paths.
+"""
+from __future__ import annotations
+
+import time
+import tracemalloc
+
+import pytest
+from django.test import Client
+
+from config import settings
+from test.bench.harness import summarize
+from test.conftest import make_user, make_users
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+PAGES = 20
+
+
+@pytest.fixture
+def large_table(request) -> int:
+    count = request.config.getoption("--bench-large-users")
+    make_users(count)
+    return count
+
+
+def _stream(client: Client) -> int:
+    response = client.get("/users/", dict(format="ndjson"))
+    return sum(chunk.count(b"\n") for chunk in response.streaming_content)
+
+
+def test_cursor_pages(large_table, benchmark_results):
+    client = Client()
+    client.force_login(make_user("bench", "bench-password", 0))
+
+    latencies = []
+    path, params = "/users/", dict(page_size=100)
+    for _ in range(PAGES):
+        start = time.perf_counter()
+        response = client.get(path, params)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        path, params = response.json()["next"], None
+    benchmark_results.record("listing.cursor_page", users=large_table, **summarize(latencies, 0, sum(latencies)))
+
+
+def test_ndjson_stream(large_table, benchmark_results):
+    client = Client()
+    client.force_login(make_user("bench", "bench-password", 0))
+
+    start = time.perf_counter()
+    rows = _stream(client)
+    elapsed = time.perf_counter() - start
+    assert rows == large_table + 1
+
+    # measured in a second pass, tracing every allocation slows the stream down
+    tracemalloc.start()
+    try:
+        _stream(client)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark_results.record(
+        "listing.ndjson_stream",
+        users=large_table,
+        elapsed_s=round(elapsed, 4),
+        rows_per_s=round(rows / elapsed, 2),
+        peak_memory_kib=round(peak / 1024, 1),
+    )
+
+
+@pytest.mark.parametrize("fast_reads", [False, True], ids=["serializer", "values"])
+def test_read_paths(large_table, benchmark_results, monkeypatch, fast_reads):
+    monkeypatch.setattr(settings, "user_fast_reads", fast_reads)
+    client = Client()
+    client.force_login(make_user("bench", "bench-password", 0))
+    _stream(client)
+
+    rows, elapsed = 0, 0.0
+    path, params = "/users/", dict(page_size=settings.user_max_page_size)
+    while path:
+        start = time.perf_counter()
+        response = client.get(path, params)
+        elapsed += time.perf_counter() - start
+        rows += len(response.json()["results"])
+        path, params = response.json()["next"], None
+    assert rows == large_table + 1
+
+    start = time.perf_counter()
+    assert _stream(client) == large_table + 1
+    stream_elapsed = time.perf_counter() - start
+    benchmark_results.record(
+        "listing.read_path",
+        path="values" if fast_reads else "serializer",
+        users=large_table,
+        page_rows_per_s=round(rows / elapsed, 2),
+        stream_rows_per_s=round(rows / stream_elapsed, 2),
+    )
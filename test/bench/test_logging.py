@@ -0,0 +1,95 @@
+"""
+Latency logging adds to a request per sink configuration: no sink, a file written on the request thread, the
+queue-backed file and JSON sinks, and the rate limited call site of the balance endpoint. The time of a single log
+call on the calling thread is recorded next to the request latencies.
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+
+import pytest
+from django.core.cache import caches
+from loguru import logger
+
+from config import settings
+from ethchange import logs
+from ethchange.logs import RateLimitedLogger, configure_logging
+from test.bench.conftest import thread_clients
+from test.bench.harness import run_threads
+from test.conftest import make_user, make_users
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+PASSWORD = "bench-password"
+# log calls timed on the calling thread per configuration
+LOG_CALLS = 2000
+
+# sink settings and messages allowed per second at the balance call site of each configuration
+CONFIGS = dict(
+    none=(dict(log_console=False, log_file=""), 10**9),
+    sync_file=(dict(log_console=False, log_enqueue=False), 10**9),
+    queued_file=(dict(log_console=False, log_enqueue=True), 10**9),
+    queued_json=(dict(log_console=False, log_enqueue=True, log_json=True), 10**9),
+    queued_file_rate_limited=(dict(log_console=False, log_enqueue=True), 10),
+)
+
+
+@pytest.fixture
+def restore_handlers():
+    yield
+    logger.remove()
+    logger.add(sys.stderr)
+    logs._rate_limited.clear()
+
+
+def test_log_overhead_per_request(
+    bench_stub, benchmark_results, concurrency_levels, bench_requests, tmp_path, monkeypatch, restore_handlers
+):
+    names = make_users(bench_requests)
+    user = make_user("bench", PASSWORD, 0)
+    body = json.dumps(dict(password=PASSWORD))
+    monkeypatch.setattr(settings, "log_levels", {"": "DEBUG"})
+    baseline = dict()
+    # the first requests start the balance head watcher and open the connections, they are not measured
+    warm_client = thread_clients(user)
+    for name in names[:8]:
+        warm_client().generic("GET", f"/users/{name}/balance_eth_account/", body, content_type="application/json")
+    for config, (overrides, limit) in CONFIGS.items():
+        for setting, value in overrides.items():
+            monkeypatch.setattr(settings, setting, value)
+        configure_logging(tmp_path / config)
+        logs._rate_limited["user.balance_eth_account"] = RateLimitedLogger("user.balance_eth_account", limit, 1.0)
+
+        elapsed = 0.0
+        for index in range(LOG_CALLS):
+            started = time.perf_counter()
+            logs.rate_limited("user.balance_eth_account").debug(f"[{index}] Balance requested")
+            elapsed += time.perf_counter() - started
+            # spaced like the calls of separate requests, so the queue worker keeps up as it would in service
+            time.sleep(0.0002)
+        log_call_us = round(elapsed / LOG_CALLS * 10**6, 3)
+        logger.complete()
+
+        for concurrency in concurrency_levels:
+            caches["balances"].clear()
+            client = thread_clients(user)
+
+            def balance(index: int) -> bool:
+                path = f"/users/{names[index]}/balance_eth_account/"
+                return client().generic("GET", path, body, content_type="application/json").status_code == 200
+
+            result = run_threads(balance, concurrency, bench_requests)
+            baseline.setdefault(concurrency, result["p50_ms"])
+            benchmark_results.record(
+                f"logging.{config}",
+                concurrency=concurrency,
+                overhead_p50_ms=round(result["p50_ms"] - baseline[concurrency], 3),
+                log_call_us=log_call_us,
+                **result,
+            )
+            assert result["errors"] == 0
+        logger.complete()
+        monkeypatch.undo()
+        monkeypatch.setattr(settings, "log_levels", {"": "DEBUG"})
@@ -0,0 +1,51 @@
+"""
+Write contention on SQLite with Django's default connection options and with the tuned ones of the settings.
+
+Each profile runs against a fresh database file of its own, the journal mode of a file outlives its connections.
+"""
+from __future__ import annotations
+
+import pytest
+from django.db import connections, transaction
+
+from config import settings
+from test.bench.harness import run_threads
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+ALIAS = "contention"
+PROFILES = dict(
+    default=dict(timeout=5),
+    tuned=dict(
+        timeout=settings.sqlite_timeout,
+        transaction_mode=settings.sqlite_transaction_mode,
+        pragmas=dict(settings.sqlite_pragmas),
+    ),
+)
+
+
+def test_write_contention(benchmark_results, concurrency_levels, bench_requests, tmp_path):
+    def touch(index: int) -> bool:
+        # reads then writes in one transaction, a deferred transaction has to upgrade its read lock to write
+        with transaction.atomic(using=ALIAS), connections[ALIAS].cursor() as cursor:
+            cursor.execute("SELECT value FROM counter WHERE id = %s", [index % 16])
+            cursor.execute("UPDATE counter SET value = %s WHERE id = %s", [cursor.fetchone()[0] + 1, index % 16])
+        return True
+
+    for profile, options in PROFILES.items():
+        connections.settings[ALIAS] = dict(
+            connections.settings["default"], NAME=str(tmp_path / f"{profile}.sqlite3"), OPTIONS=options
+        )
+        try:
+            with connections[ALIAS].cursor() as cursor:
+                cursor.execute("CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)")
+                cursor.executemany("INSERT INTO counter VALUES (%s, 0)", [(index,) for index in range(16)])
+            for concurrency in concurrency_levels:
+                result = run_threads(touch, concurrency, bench_requests)
+                benchmark_results.record(f"sqlite.{profile}", concurrency=concurrency, **result)
+                if profile == "tuned":
+                    assert result["errors"] == 0
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
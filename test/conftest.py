@@ -0,0 +1,219 @@
+"""
+Test and benchmark setup.
+
+A stub node is started before Django loads so the providers of `ethchange.injector` are bound to it. The secrets
+normally read from `.secrets.toml` fall back to throwaway values.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import pytest
+
+from test.stub_node import StubNode
+
+
+STUB_NODE = StubNode().start()
+
+os.environ["DYNACONF_NODE_URI"] = STUB_NODE.uri
+os.environ.setdefault("DYNACONF_SECRET_KEY", "ethchange-test-secret-key")
+os.environ.setdefault("DYNACONF_ADMIN_USER_NAME", "admin")
+os.environ.setdefault("DYNACONF_ADMIN_USER_PASSWORD", "admin")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ethchange.settings")
+# tests and the processes they start log to a throwaway file instead of the log of the checkout
+os.environ.setdefault("DYNACONF_LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="ethchange-logs-"), "ethchange.log"))
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def pytest_configure():
+    # the settings module comes from the environment set above, which pytest-django reads before this file loads
+    import django
+
+    django.setup()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("ethchange benchmarks")
+    group.addoption(
+        "--bench-output", default=None, help="JSON results file, volume/benchmarks/<commit>.json by default"
+    )
+    group.addoption("--bench-concurrency", default="1,8,32", help="Comma separated concurrency levels")
+    group.addoption("--bench-users", default="1000,10000", help="Comma separated user table sizes")
+    group.addoption("--bench-large-users", type=int, default=100000, help="User table size of the listing benchmark")
+    group.addoption("--bench-requests", type=int, default=64, help="Requests sent per benchmark run")
+    group.addoption("--stub-latency", type=float, default=0.002, help="Seconds the stub node waits per request")
+
+
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(tmp_path_factory):
+    """Runs against a SQLite file, the shared in-memory database of the test runner fails concurrent writers"""
+    from django.db import connections
+
+    connections.settings["default"]["TEST"]["NAME"] = str(tmp_path_factory.mktemp("db") / "test.sqlite3")
+
+
+@pytest.fixture
+def stub_node() -> StubNode:
+    STUB_NODE.reset()
+    yield STUB_NODE
+    STUB_NODE.latency = 0.0
+    STUB_NODE.new_account_scrypt_n = 0
+
+
+@pytest.fixture(autouse=True)
+def _clear_process_state():
+    """Drops the process local caches and indexes that would otherwise outlive the rows of a previous test"""
+    from django.core.cache import caches
+
+    from ethchange import injector, logs
+
+    logs._rate_limited.clear()
+    # watchers are stopped first so they do not write to the caches once they are cleared
+    injector.balance_cache().stop()
+    injector.balance_cache.reset()
+    injector.fee_oracle().stop()
+    injector.fee_oracle.reset()
+    for alias in ("default", "balances", "users", "fees", "sessions", "unlocks"):
+        caches[alias].clear()
+    injector.address_index.reset()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def _drop_async_sessions():
+    """
+    Drops the aiohttp sessions web3 caches per thread for its async client after each test. The thread of a later
+    `async_to_sync` call can get the identifier of an earlier one and would reuse a session of a closed event loop.
+    """
+    from web3._utils.request import _async_session_cache
+
+    yield
+    _async_session_cache.clear()
+
+
+def user_address(index: int) -> str:
+    """Address of the user `index` of `make_users`, spread like real addresses"""
+    from web3 import Web3
+
+    return Web3.toChecksumAddress("0x" + hashlib.sha256(f"user{index}".encode()).hexdigest()[:40])
+
+
+def make_users(count: int, start: int = 0, batch_size: int = 5000) -> list[str]:
+    """
+    Inserts `count` users with unusable passwords straight into the database, returns their names.
+
+    Addresses are derived from the user index so they are unique, valid and stable across runs.
+    """
+    from ethchange.user.models import UserModel
+
+    names = []
+    for first in range(start, start + count, batch_size):
+        users = []
+        for index in range(first, min(first + batch_size, start + count)):
+            names.append(f"user{index:07d}")
+            users.append(
+                UserModel(
+                    name=names[-1],
+                    email=f"user{index}@ethchange.test",
+                    phone=1000000000 + index,
+                    password=f"!unusable{index}",
+                    eth_account=user_address(index).encode("utf-8"),
+                )
+            )
+        UserModel.objects.bulk_create(users)
+    return names
+
+
+def make_user(name: str, password: str, index: int) -> Any:
+    """Creates a user able to log in with `password`"""
+    from django.contrib.auth.hashers import make_password
+    from web3 import Web3
+
+    from ethchange.user.models import UserModel
+
+    return UserModel.objects.create(
+        name=name,
+        email=f"{name}@ethchange.test",
+        phone=2000000000 + index,
+        password=make_password(password),
+        eth_account=Web3.toChecksumAddress(f"0x{(1 << 150) + index:040x}").encode("utf-8"),
+    )
+
+
+@pytest.fixture
+def alice_user(stub_node) -> Any:
+    """The user `alice` with the password `password`, signed up with an account on the stub node"""
+    from ethchange.user.models import UserModel
+
+    return UserModel.objects.create_user(
+        name="alice", password="password", phone=1234567890, email="alice@ethchange.test"
+    )
+
+
+@pytest.fixture
+def alice(alice_user) -> Any:
+    """A client logged in as `alice_user`"""
+    from django.test import Client
+
+    client = Client()
+    client.force_login(alice_user)
+    return client
+
+
+class BenchmarkResults:
+    """Collects benchmark results and writes them as one JSON document per run"""
+
+    def __init__(self, path: Path, metadata: dict[str, Any]):
+        self.path = path
+        self.metadata = metadata
+        self.results: list[dict[str, Any]] = []
+
+    def record(self, name: str, **result) -> dict[str, Any]:
+        self.results.append(dict(name=name, **result))
+        return self.results[-1]
+
+    def write(self):
+        if self.results:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(dict(self.metadata, results=self.results), indent=2))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request) -> BenchmarkResults:
+    import django
+
+    commit = _git_commit()
+    output = request.config.getoption("--bench-output")
+    path = Path(output) if output else ROOT_DIR / "volume" / "benchmarks" / f"{commit or 'unknown'}.json"
+    results = BenchmarkResults(
+        path,
+        dict(
+            commit=commit,
+            created=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            python=platform.python_version(),
+            django=django.get_version(),
+            machine=platform.machine(),
+            cpus=os.cpu_count(),
+            stub_latency=request.config.getoption("--stub-latency"),
+        ),
+    )
+    yield results
+    results.write()
@@ -0,0 +1,281 @@
+"""
+In-process stand-in for the JSON-RPC API of a geth node.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import secrets
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Optional
+
+import rlp
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from web3 import Web3
+
+
+class StubNode:
+    """
+    Serves the JSON-RPC methods the app calls from a thread, on an ephemeral local port.
+
+    The chain is deterministic: block hashes derive from the block number and the number of reorgs that replaced it,
+    and only the transfers added through `add_transfer` are included. `latency` delays every HTTP request,
+    `new_account_scrypt_n` makes `personal_newAccount` pay the key derivation cost geth pays, `fail` answers every
+    request with HTTP 503 and `error_code` answers every call with that JSON-RPC error. With `london` off the node has
+    no `eth_feeHistory`.
+
+    With `keystore_dir` set, `personal_unlockAccount` opens the keystore file of the account in that directory like
+    geth does, so it sees the files written by the keystore account backend.
+
+    Accounts created through `personal_newAccount` hold real keys and sign real transactions. Sent transactions are
+    checked against the nonce of their sender like geth's pool does: a nonce already used is rejected, a gap is
+    queued until the missing nonce arrives.
+    """
+
+    def __init__(self, block_number: int = 100, latency: float = 0.0, new_account_scrypt_n: int = 0):
+        self.block_number = self._start_block = block_number
+        self.latency = latency
+        self.new_account_scrypt_n = new_account_scrypt_n
+        self.fail = False
+        self.error_code: Optional[int] = None
+        self.keystore_dir: Optional[Path] = None
+        self.london = True
+        self.calls: Counter[str] = Counter()
+        self.accounts: dict[str, str] = dict()
+        self.balances: dict[str, int] = dict()
+        self.nonces: Counter[str] = Counter()
+        self.transactions: dict[str, Transaction] = dict()
+        self.http_requests = 0
+        self._keys: dict[str, bytes] = dict()
+        self._queued: dict[str, dict[int, str]] = dict()
+        self._transfers: dict[int, list[tuple[str, Optional[str], int]]] = dict()
+        self._reorgs: dict[int, int] = dict()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def uri(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> StubNode:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-node", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.block_number = self._start_block
+            self.fail = False
+            self.error_code = None
+            self.keystore_dir = None
+            self.london = True
+            self.calls.clear()
+            self.http_requests = 0
+            self._transfers.clear()
+            self._reorgs.clear()
+
+    def mine(self, count: int = 1) -> int:
+        with self._lock:
+            self.block_number += count
+            return self.block_number
+
+    def add_transfer(self, block_number: int, sender: str, receiver: Optional[str], value: int):
+        with self._lock:
+            self._transfers.setdefault(block_number, []).append((sender, receiver, value))
+
+    def reorg(self, from_block: int):
+        """Replaces every block from `from_block` on with a sibling of a different hash"""
+        with self._lock:
+            self._reorgs[from_block] = len(self._reorgs) + 1
+
+    def block_hash(self, number: int) -> str:
+        epoch = max((epoch for start, epoch in self._reorgs.items() if start <= number), default=0)
+        return "0x" + hashlib.sha256(f"{number}:{epoch}".encode()).hexdigest()
+
+    def block(self, number: int) -> Optional[dict[str, Any]]:
+        if number > self.block_number or number < 0:
+            return None
+        block_hash = self.block_hash(number)
+        transactions = [
+            dict(
+                hash="0x" + hashlib.sha256(f"{block_hash}:{index}".encode()).hexdigest(),
+                transactionIndex=hex(index),
+                value=hex(value),
+                to=receiver,
+                **{"from": sender},
+            )
+            for index, (sender, receiver, value) in enumerate(self._transfers.get(number, []))
+        ]
+        return dict(
+            number=hex(number), hash=block_hash, parentHash=self.block_hash(number - 1), transactions=transactions
+        )
+
+    def _new_account(self, password: str) -> str:
+        if self.new_account_scrypt_n:
+            hashlib.scrypt(
+                password.encode(), salt=secrets.token_bytes(32), n=self.new_account_scrypt_n, r=8, p=1, maxmem=2**30
+            )
+        account = Account.create(secrets.token_hex(16))
+        with self._lock:
+            self.accounts[account.address.lower()] = password
+            self._keys[account.address.lower()] = account.key
+        return account.address
+
+    def _unlock_keyfile(self, address: str, password: str) -> bool:
+        from ethchange.keystore import keyfile_path
+
+        path = keyfile_path(self.keystore_dir, address)
+        if path is None:
+            raise ValueError("no key for given address or file")
+        try:
+            Account.decrypt(json.loads(path.read_text()), password)
+        except ValueError as error:
+            raise ValueError("could not decrypt key with given password") from error
+        return True
+
+    def _sign_transaction(self, tx: dict, password: str) -> dict:
+        sender = tx["from"].lower()
+        if self.accounts.get(sender) != password:
+            raise ValueError("could not decrypt key with given password")
+        fields = dict(
+            nonce=int(tx["nonce"], 16),
+            gasPrice=int(tx["gasPrice"], 16),
+            gas=int(tx["gas"], 16),
+            to=tx["to"],
+            value=int(tx["value"], 16),
+            data=b"",
+            chainId=int(tx["chainId"], 16),
+        )
+        signed = Account.sign_transaction(fields, self._keys[sender])
+        return dict(raw=signed.rawTransaction.hex(), tx=dict(tx, hash=signed.hash.hex()))
+
+    def _send_raw_transaction(self, raw: str) -> str:
+        transaction = rlp.decode(bytes.fromhex(raw.removeprefix("0x")), Transaction)
+        sender = Account.recover_transaction(raw).lower()
+        tx_hash = Web3.keccak(hexstr=raw).hex()
+        with self._lock:
+            queued = self._queued.setdefault(sender, dict())
+            if transaction.nonce < self.nonces[sender]:
+                raise ValueError("nonce too low")
+            if transaction.nonce in queued:
+                raise ValueError("already known")
+            queued[transaction.nonce] = tx_hash
+            self.transactions[tx_hash] = transaction
+            # transactions become pending once every lower nonce of their sender arrived
+            while self.nonces[sender] in queued:
+                queued.pop(self.nonces[sender])
+                self.nonces[sender] += 1
+        return tx_hash
+
+    def _balance(self, address: str) -> int:
+        return self.balances.get(address.lower(), int(address[-4:], 16) * 10)
+
+    def call(self, method: str, params: list) -> Any:
+        """Returns the result of `method`, raises KeyError for an unknown method"""
+        self.calls[method] += 1
+        if method == "eth_blockNumber":
+            return hex(self.block_number)
+        if method == "eth_getBalance":
+            return hex(self._balance(params[0]))
+        if method == "eth_getBlockByNumber":
+            return self.block(int(params[0], 16) if params[0] != "latest" else self.block_number)
+        if method == "eth_chainId":
+            return "0x5"
+        if method == "net_version":
+            return "5"
+        if method == "personal_newAccount":
+            return self._new_account(params[0])
+        if method == "personal_unlockAccount" and self.keystore_dir is not None:
+            return self._unlock_keyfile(params[0], params[1])
+        if method == "personal_unlockAccount":
+            return self.accounts.get(params[0].lower(), params[1]) == params[1]
+        if method == "personal_lockAccount":
+            return True
+        if method == "personal_listAccounts":
+            return list(self.accounts)
+        if method == "personal_signTransaction":
+            return self._sign_transaction(params[0], params[1])
+        if method == "eth_sendRawTransaction":
+            return self._send_raw_transaction(params[0])
+        if method == "eth_getTransactionCount":
+            return hex(self.nonces[params[0].lower()])
+        if method == "eth_gasPrice":
+            return hex(10**9)
+        if method == "eth_maxPriorityFeePerGas" and self.london:
+            return hex(10**8)
+        if method == "eth_feeHistory" and self.london:
+            return self._fee_history(int(params[0], 16) if isinstance(params[0], str) else params[0], params[2])
+        raise KeyError(method)
+
+    def base_fee(self, number: int) -> int:
+        return (10 + number % 5) * 10**9
+
+    def _fee_history(self, block_count: int, percentiles: list[float]) -> dict:
+        oldest = max(self.block_number - block_count + 1, 0)
+        numbers = range(oldest, self.block_number + 1)
+        return dict(
+            oldestBlock=hex(oldest),
+            baseFeePerGas=[hex(self.base_fee(number)) for number in [*numbers, self.block_number + 1]],
+            gasUsedRatio=[0.5 for _ in numbers],
+            # the priority fees of a block grow with the percentile and vary from block to block
+            reward=[
+                [hex(int(percentile * 10**7) * (1 + number % 3)) for percentile in percentiles] for number in numbers
+            ],
+        )
+
+    def _respond(self, request: dict) -> dict:
+        if self.error_code is not None:
+            return dict(jsonrpc="2.0", id=request.get("id"), error=dict(code=self.error_code, message="node error"))
+        try:
+            result = self.call(request["method"], request.get("params", []))
+        except KeyError:
+            error = dict(code=-32601, message=f"the method {request['method']} does not exist/is not available")
+            return dict(jsonrpc="2.0", id=request.get("id"), error=error)
+        except ValueError as exc:
+            return dict(jsonrpc="2.0", id=request.get("id"), error=dict(code=-32000, message=str(exc)))
+        return dict(jsonrpc="2.0", id=request.get("id"), result=result)
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                node.http_requests += 1
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if node.latency:
+                    time.sleep(node.latency)
+                if node.fail:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                if isinstance(body, list) and node.error_code is None:
+                    response = [node._respond(request) for request in body]
+                else:
+                    # like geth rejecting a batch as a whole, an erroring node answers a batch with a single error
+                    response = node._respond(body if isinstance(body, dict) else dict(id=None))
+                data = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import IntegrityError, connections
+from eth_account import Account
+
+from config import settings
+from ethchange import accounts, injector
+from ethchange.accounts import AccountPool
+from ethchange.keystore import KeystoreGenerator, keyfile_path
+from ethchange.user.models import PooledEthAccount, UserModel
+from test.conftest import make_user
+
+# claims only rebind once their transaction committed, the rows have to be committed for that
+pytestmark = pytest.mark.django_db(transaction=True)
+
+PASSPHRASE = "pool passphrase"
+
+
+@pytest.fixture
+def account_pool(stub_node, monkeypatch, tmp_path):
+    """Account pool of the keystore backend writing to a temporary keystore directory the stub node reads"""
+    generator = KeystoreGenerator(keystore_dir=str(tmp_path), scrypt_n=2**4, workers=1)
+    pool = AccountPool(
+        injector.web3_provider(), generator, PASSPHRASE, str(tmp_path), low_water_mark=0, size=0, rebind_workers=1
+    )
+    stub_node.keystore_dir = tmp_path
+    monkeypatch.setattr(settings, "account_pool_enabled", True)
+    with injector.account_pool.override(pool):
+        yield pool
+    pool._rebind_executor.shutdown()
+    generator.executor.shutdown()
+
+
+def _opens_with(pool: AccountPool, address: bytes, password: str) -> bool:
+    try:
+        Account.decrypt(json.loads(keyfile_path(pool._keystore_dir, address.decode("utf-8")).read_text()), password)
+    except ValueError:
+        return False
+    return True
+
+
+def test_concurrent_claims_hand_out_each_account_once(account_pool):
+    account_pool.refill(16)
+
+    def claim(index: int) -> bytes:
+        try:
+            return account_pool.claim(f"password{index}")
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(8) as executor:
+        claimed = list(executor.map(claim, range(20)))
+
+    handed_out = [account for account in claimed if account]
+    assert len(handed_out) == len(set(handed_out)) == 16
+    assert account_pool.available() == 0
+
+
+def test_failed_signup_returns_the_account(account_pool):
+    account_pool.refill(1)
+    make_user("bob", "password", 0)
+
+    # the phone number is taken, the insert fails after the account was claimed
+    with pytest.raises(IntegrityError):
+        UserModel.objects.create_user("alice", "password", 2000000000, "alice@ethchange.test")
+
+    assert account_pool.available() == 1
+    assert _opens_with(account_pool, bytes(PooledEthAccount.objects.get().eth_account), PASSPHRASE)
+
+
+def test_failed_import_returns_the_accounts(account_pool):
+    account_pool.refill(2)
+    pooled = {bytes(row.eth_account) for row in PooledEthAccount.objects.all()}
+    make_user("bob", "password", 0)
+    user_infos = [
+        dict(name="dave", password="password", phone=4000000000, email="dave@ethchange.test"),
+        dict(name="erin", password="password", phone=4000000001, email="erin@ethchange.test"),
+    ]
+
+    # the phone number of the last user is taken, the insert fails after the accounts were claimed
+    taken = dict(name="carol", password="password", phone=2000000000, email="carol@ethchange.test")
+    with pytest.raises(IntegrityError):
+        UserModel.objects.bulk_create_users(user_infos + [taken], workers=2)
+    assert account_pool.available() == 2
+
+    users = UserModel.objects.bulk_create_users(user_infos, workers=2)
+    assert account_pool.available() == 0
+    assert {user.eth_account for user in users} == pooled
+
+
+def test_unlock_right_after_signup(account_pool):
+    account_pool.refill(1)
+    # the rebind worker is busy until the unlock already started waiting for the account
+    release = threading.Event()
+    account_pool._rebind_executor.submit(release.wait, 5)
+    threading.Timer(0.2, release.set).start()
+
+    user = UserModel.objects.create_user("alice", "password", 2000000000, "alice@ethchange.test")
+    assert PooledEthAccount.objects.filter(claimed__isnull=False).exists()
+    assert UserModel.objects.unlock_eth_account("alice", "password")
+
+    assert _opens_with(account_pool, user.eth_account, "password")
+    assert not PooledEthAccount.objects.exists()
+
+
+def test_unlock_retries_failed_rebind(account_pool, monkeypatch):
+    def disk_full(*args):
+        raise OSError("No space left on device")
+
+    account_pool.refill(1)
+    reencrypt_keyfile = accounts.reencrypt_keyfile
+    monkeypatch.setattr(accounts, "reencrypt_keyfile", disk_full)
+
+    user = UserModel.objects.create_user("alice", "password", 2000000000, "alice@ethchange.test")
+    account_pool._rebind_executor.submit(lambda: None).result()
+    assert _opens_with(account_pool, user.eth_account, PASSPHRASE)
+
+    monkeypatch.setattr(accounts, "reencrypt_keyfile", reencrypt_keyfile)
+    assert UserModel.objects.unlock_eth_account("alice", "password")
+    assert _opens_with(account_pool, user.eth_account, "password")
+    assert not PooledEthAccount.objects.exists()
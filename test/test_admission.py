@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import json
+import threading
+
+import pytest
+from django.conf import settings as django_settings
+from django.test import Client, override_settings
+from web3 import HTTPProvider
+
+from ethchange import injector
+from ethchange.admission import AdmissionController, NodeBusy, NodeLimiter
+from ethchange.metrics import InfluxExporter, MetricsRegistry, RpcMetrics, instrumented_web3
+from ethchange.rpc import batch_request
+
+ADMISSION_MIDDLEWARE = override_settings(
+    MIDDLEWARE=[*django_settings.MIDDLEWARE, "ethchange.admission.admission_middleware"]
+)
+BALANCE = json.dumps(dict(password="password"))
+
+
+def _controller(user_limit: list, limit: list) -> AdmissionController:
+    return AdmissionController(
+        routes={"usermodel-balance-eth-account": "balance", "async-balance": "balance"},
+        limits=dict(balance=limit),
+        user_limit=user_limit,
+        max_users=2,
+    )
+
+
+def _balance(client: Client, path: str = "/users/alice/balance_eth_account/"):
+    return client.generic("GET", path, BALANCE, content_type="application/json")
+
+
+def test_user_and_endpoint_buckets():
+    controller = _controller(user_limit=[1.0, 2], limit=[1.0, 3])
+    assert [controller.admit("balance", "alice") for _ in range(2)] == [0.0, 0.0]
+    assert 0 < controller.admit("balance", "alice") <= 1.0
+    assert controller.admit("balance", "bob") == 0.0
+    # the endpoint bucket is empty, bob keeps the token of the rejected request
+    assert controller.admit("balance", "bob") > 0
+    assert controller._users[("balance", "bob")].tokens == pytest.approx(1.0, abs=0.01)
+
+    assert controller.stats()["groups"]["balance"] == dict(admitted=3, limited_user=1, limited_endpoint=1)
+    controller.admit("balance", "carol")
+    assert controller.stats()["users"] == 2
+
+
+@pytest.mark.django_db
+def test_middleware_answers_429(alice):
+    with ADMISSION_MIDDLEWARE, injector.admission_controller.override(_controller([0.5, 2], [100.0, 100])):
+        statuses = [_balance(alice).status_code for _ in range(3)]
+        response = _balance(alice)
+        assert _balance(alice, "/async/users/alice/balance_eth_account/").status_code == 429
+        # endpoints outside the routes are not limited
+        assert all(alice.get("/users/alice/").status_code == 200 for _ in range(5))
+
+    assert statuses == [200, 200, 429]
+    assert response.status_code == 429 and response["Retry-After"] == "2"
+
+
+def test_node_slots_shed_calls(stub_node):
+    limiter = NodeLimiter(concurrency=1, wait=0.05)
+    web3 = instrumented_web3(HTTPProvider(stub_node.uri), None, limiter=limiter)
+    stub_node.latency = 0.3
+
+    first = threading.Thread(target=lambda: web3.eth.block_number)
+    first.start()
+    while not limiter.stats()["in_flight"]:
+        pass
+    with pytest.raises(NodeBusy):
+        web3.eth.block_number
+    with pytest.raises(NodeBusy):
+        batch_request(web3, [("eth_blockNumber", [])])
+    first.join()
+
+    stub_node.latency = 0.0
+    assert batch_request(web3, [("eth_blockNumber", [])]) == [hex(stub_node.block_number)]
+    stats = limiter.stats()
+    assert stats["calls"] == 2 and stats["shed"] == 2 and stats["queued"] == 2 and stats["in_flight"] == 0
+
+
+@pytest.mark.django_db
+def test_busy_node_answers_503(alice, stub_node):
+    limiter = NodeLimiter(concurrency=1, wait=0.01)
+    web3 = instrumented_web3(HTTPProvider(stub_node.uri), None, limiter=limiter)
+    with injector.web3_provider.override(web3), limiter.slot():
+        response = _balance(alice)
+    assert response.status_code == 503 and response["Retry-After"] == "1"
+    assert _balance(alice).status_code == 200
+
+
+def test_exporter_admission_lines():
+    controller = _controller(user_limit=[1.0, 1], limit=[1.0, 10])
+    controller.admit("balance", "alice")
+    controller.admit("balance", "alice")
+    limiter = NodeLimiter(concurrency=1, wait=0.0)
+    with limiter.slot(), pytest.raises(NodeBusy), limiter.slot():
+        pass
+
+    exporter = InfluxExporter(
+        MetricsRegistry([10]),
+        RpcMetrics([10]),
+        "http://127.0.0.1:1",
+        org="ethchange",
+        bucket="metrics",
+        token="token",
+        interval=3600,
+        batch_size=500,
+        buffer_size=1000,
+        timeout=1.0,
+        admission=controller,
+        node_limiter=limiter,
+    )
+    group_line, slots_line = exporter.admission_lines(controller.stats(), limiter.stats(), 1000)
+    assert group_line.endswith(",group=balance admitted=1i,limited_user=1i,limited_endpoint=0i 1000")
+    assert "calls=1i,queued=1i,shed=1i" in slots_line and slots_line.startswith("node_slots,host=")
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, Client
+
+from ethchange.user.models import UserModel
+
+# the async views run their queries in other threads, which do not see the rows of a test transaction
+pytestmark = pytest.mark.django_db(transaction=True)
+
+SIGNUP = dict(name="alice", password="password", phone=1234567890, email="alice@ethchange.test")
+PASSWORD = json.dumps(dict(password="password"))
+
+
+def test_async_endpoints(stub_node):
+    client = AsyncClient()
+
+    # one event loop for all requests, the async provider keeps its HTTP session per loop
+    async def requests() -> list:
+        anonymous = await client.generic("GET", "/async/users/alice/balance_eth_account/", PASSWORD, "application/json")
+        signup = await client.post("/async/users/signup/", SIGNUP, content_type="application/json")
+        exists = await client.post("/async/users/signup/", SIGNUP, content_type="application/json")
+        balance = await client.generic("GET", "/async/users/alice/balance_eth_account/", PASSWORD, "application/json")
+        unlock = await client.post("/async/users/alice/unlock_wallet/", PASSWORD, content_type="application/json")
+        wrong = await client.post(
+            "/async/users/alice/lock_wallet/", dict(password="wrong"), content_type="application/json"
+        )
+        return [anonymous, signup, exists, balance, unlock, wrong]
+
+    anonymous, signup, exists, balance, unlock, wrong = async_to_sync(requests)()
+    assert [response.status_code for response in (anonymous, signup, exists, balance, unlock, wrong)] == [
+        403,
+        201,
+        400,
+        200,
+        200,
+        400,
+    ]
+    assert stub_node.calls["personal_newAccount"] == 1 and stub_node.calls["personal_unlockAccount"] == 1
+
+    # the sync endpoint answers the same
+    sync = Client()
+    sync.force_login(UserModel.objects.get(name="alice"))
+    response = sync.generic("GET", "/users/alice/balance_eth_account/", PASSWORD, "application/json")
+    assert response.json() == balance.json()
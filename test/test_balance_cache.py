@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from ethchange import injector
+from ethchange.cache import BalanceCache
+from test.conftest import user_address
+
+ADDRESS = user_address(0)
+
+
+@pytest.fixture
+def balance_cache() -> BalanceCache:
+    balance_cache = BalanceCache(alias="balances", poll_interval=0.05)
+    yield balance_cache
+    balance_cache.stop()
+
+
+def test_hits_and_misses(stub_node, balance_cache):
+    web3 = injector.web3_provider()
+    stub_node.balances[ADDRESS.lower()] = 5
+
+    assert [balance_cache.get_balance(ADDRESS, web3) for _ in range(3)] == [5, 5, 5]
+    assert stub_node.calls["eth_getBalance"] == 1
+    assert async_to_sync(balance_cache.aget_balance)(ADDRESS, injector.async_web3_provider()) == 5
+    assert stub_node.calls["eth_getBalance"] == 1
+
+    head = balance_cache.head(web3)
+    assert balance_cache.get_balances([ADDRESS, user_address(1)], head) == {ADDRESS: 5}
+    balance_cache.set_balances({user_address(1): 7}, head)
+    assert balance_cache.get_balances([ADDRESS, user_address(1)], head) == {ADDRESS: 5, user_address(1): 7}
+    assert balance_cache.stats() == dict(hits=6, misses=2, heads=1, head=head)
+
+
+def test_new_heads_invalidate_balances(stub_node, balance_cache):
+    web3 = injector.web3_provider()
+    stub_node.balances[ADDRESS.lower()] = 5
+    assert balance_cache.get_balance(ADDRESS, web3) == 5
+
+    stub_node.balances[ADDRESS.lower()] = 6
+    assert balance_cache.get_balance(ADDRESS, web3) == 5
+    head = stub_node.mine()
+    deadline = time.monotonic() + 2
+    while balance_cache.head(web3) != head and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # the watcher moved the head, lookups read the balance at the new block
+    assert balance_cache.get_balance(ADDRESS, web3) == 6
+    assert balance_cache.stats()["heads"] == 2
+
+    # without the watcher the head expires instead of pinning lookups to an old block
+    balance_cache.stop()
+    stub_node.mine()
+    time.sleep(0.2)
+    assert balance_cache.head(web3) == head + 1
+
+
+def test_async_lookups_start_the_watcher(stub_node, balance_cache):
+    web3 = injector.async_web3_provider()
+    stub_node.balances[ADDRESS.lower()] = 5
+
+    # one event loop for both lookups, web3 caches its aiohttp session per thread
+    @async_to_sync
+    async def lookups() -> tuple[int, int, int]:
+        before = await balance_cache.aget_balance(ADDRESS, web3)
+        stub_node.balances[ADDRESS.lower()] = 6
+        head = stub_node.mine()
+        deadline = time.monotonic() + 2
+        while balance_cache.stats()["head"] != head and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return before, await balance_cache.aget_balance(ADDRESS, web3), head
+
+    before, after, head = lookups()
+    assert (before, after) == (5, 6)
+    stats = balance_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["head"]) == (0, 2, head)
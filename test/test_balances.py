@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+
+from ethchange import rpc
+from test.conftest import make_user, make_users, user_address
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def batches(stub_node, monkeypatch) -> list:
+    """Records the calls of every balance batch, the node mines a block after the first one"""
+    recorded = []
+    batch_request = rpc.batch_request
+
+    def record(web3, calls, *args, **kwargs):
+        recorded.append(calls)
+        if len(recorded) == 1:
+            stub_node.mine()
+        return batch_request(web3, calls, *args, **kwargs)
+
+    monkeypatch.setattr(rpc, "batch_request", record)
+    return recorded
+
+
+@pytest.fixture
+def admin() -> Client:
+    user = make_user("admin", "password", 0)
+    user.is_staff = True
+    user.save()
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _expected(names: list[str], stub_node) -> dict[str, int]:
+    for index in range(len(names)):
+        stub_node.balances[user_address(index).lower()] = 10**18 + index
+    return {name: 10**18 + index for index, name in enumerate(names)}
+
+
+def test_balances_are_pinned_to_one_block(stub_node, batches, admin):
+    names = make_users(250)
+    expected = _expected(names, stub_node)
+    block_number = stub_node.block_number
+
+    response = admin.get("/users/balances/", dict(name=names))
+    assert response.status_code == 200
+    assert response.json() == dict(block_number=block_number, balances=expected)
+
+    # chunks of BALANCE_BATCH_SIZE names, every call reads the block of the snapshot
+    assert [len(calls) for calls in batches] == [100, 100, 50]
+    assert {params[1] for calls in batches for _, params in calls} == {hex(block_number)}
+    assert stub_node.block_number == block_number + 1
+
+
+def test_balances_are_admin_only(stub_node):
+    make_users(3)
+    assert Client().get("/users/balances/").status_code == 403
+
+    client = Client()
+    client.force_login(make_user("alice", "password", 1))
+    assert client.get("/users/balances/").status_code == 403
+
+
+def test_dump_balances_matches_the_balances_action(stub_node, admin):
+    names = make_users(150)
+    expected = _expected(names, stub_node)
+    stdout = io.StringIO()
+    call_command("dump_balances", stdout=stdout)
+    rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    assert len({row["block_number"] for row in rows}) == 1
+    dumped = {row["name"]: row["balance"] for row in rows}
+    assert {name: dumped[name] for name in names} == expected
+    assert admin.get("/users/balances/").json()["balances"] == dumped
+
+    stdout = io.StringIO()
+    call_command("dump_balances", "--name", names[0], "--name", names[-1], stdout=stdout)
+    assert [json.loads(line)["name"] for line in stdout.getvalue().splitlines()] == [names[0], names[-1]]
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from ethchange.db import routers
+from ethchange.db.routers import ReplicaRouter, replica_reads
+from ethchange.user.models import UserModel
+from test.conftest import ROOT_DIR
+
+
+@pytest.fixture
+def router(monkeypatch) -> ReplicaRouter:
+    # the router only reads the database aliases, the replicas are never connected to
+    databases = {alias: dict() for alias in (DEFAULT_DB_ALIAS, "replica_0", "replica_1")}
+    monkeypatch.setattr(routers, "settings", SimpleNamespace(DATABASES=databases))
+    return ReplicaRouter()
+
+
+# reads in a transaction stay on the primary, the test transaction of django_db would hide the replica routing
+@pytest.mark.django_db(transaction=True)
+def test_replica_router(router):
+    assert router.db_for_read(UserModel) == DEFAULT_DB_ALIAS
+    with replica_reads():
+        assert [router.db_for_read(UserModel) for _ in range(3)] == ["replica_0", "replica_1", "replica_0"]
+        assert router.db_for_write(UserModel) == DEFAULT_DB_ALIAS
+        with transaction.atomic():
+            assert router.db_for_read(UserModel) == DEFAULT_DB_ALIAS
+        assert router.db_for_read(UserModel) == "replica_1"
+    assert router.db_for_read(UserModel) == DEFAULT_DB_ALIAS
+    assert router.allow_migrate(DEFAULT_DB_ALIAS, "user") and not router.allow_migrate("replica_0", "user")
+
+
+def test_postgresql_profile():
+    script = (
+        "import json; from ethchange import settings; "
+        "print(json.dumps({alias: database['NAME'] for alias, database in settings.DATABASES.items()}))"
+    )
+    env = dict(os.environ, DYNACONF_DATABASE_ENGINE="postgresql", DYNACONF_DATABASE_REPLICAS='@json ["replica"]')
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT_DIR, env=env, capture_output=True, check=True)
+    assert json.loads(output.stdout) == dict(default="ethchange", replica_0="ethchange")
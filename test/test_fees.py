@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from django.test import Client
+
+from ethchange import injector
+from ethchange.fees import FeeOracle
+
+
+@pytest.fixture
+def oracle() -> FeeOracle:
+    oracle = FeeOracle(
+        alias="fees", poll_interval=0.01, history_blocks=5, tiers=dict(fast=90, slow=10, normal=50), max_age=30
+    )
+    yield oracle
+    oracle.stop()
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_estimates_from_fee_history(stub_node, oracle):
+    estimate = oracle.estimates(injector.web3_provider())
+
+    assert oracle.tiers == ["slow", "normal", "fast"]
+    assert estimate["block_number"] == stub_node.block_number
+    assert estimate["base_fee"] == stub_node.base_fee(stub_node.block_number + 1)
+    slow, normal, fast = (estimate["tiers"][tier] for tier in oracle.tiers)
+    assert slow["max_priority_fee_per_gas"] < normal["max_priority_fee_per_gas"] < fast["max_priority_fee_per_gas"]
+    assert normal["gas_price"] == estimate["base_fee"] + normal["max_priority_fee_per_gas"]
+    assert normal["max_fee_per_gas"] == 2 * estimate["base_fee"] + normal["max_priority_fee_per_gas"]
+    assert estimate["blocks_behind"] == 0
+
+
+def test_requests_read_cached_estimates(stub_node, oracle):
+    web3 = injector.web3_provider()
+    oracle.estimates(web3)
+    oracle.stop()
+    calls = stub_node.calls["eth_feeHistory"]
+    for _ in range(10):
+        oracle.estimates(web3)
+    assert stub_node.calls["eth_feeHistory"] == calls
+
+
+def test_watcher_refreshes_each_block(stub_node, oracle):
+    web3 = injector.web3_provider()
+    first = oracle.estimates(web3)
+    head = stub_node.mine()
+
+    _wait_for(lambda: oracle.estimates(web3)["block_number"] == head)
+    assert oracle.estimates(web3)["updated"] > first["updated"]
+    assert oracle.stats()["refreshes"] >= 2
+
+
+def test_staleness_is_reported(stub_node, oracle):
+    web3 = injector.web3_provider()
+    oracle.estimates(web3)
+    oracle.stop()
+    stub_node.mine(3)
+    oracle.cache.set(FeeOracle.HEAD_KEY, stub_node.block_number)
+    time.sleep(0.05)
+
+    estimate = oracle.estimates(web3)
+    assert estimate["blocks_behind"] == 3
+    assert estimate["age"] >= 0.05
+
+
+def test_falls_back_to_gas_price(stub_node, oracle):
+    stub_node.london = False
+    estimate = oracle.estimates(injector.web3_provider())
+    assert estimate["base_fee"] is None
+    assert {tier["gas_price"] for tier in estimate["tiers"].values()} == {10**9}
+
+
+def test_falls_back_without_rewards(stub_node, oracle, monkeypatch):
+    fee_history = stub_node._fee_history
+    monkeypatch.setattr(stub_node, "_fee_history", lambda *args: dict(fee_history(*args), reward=[]))
+    estimate = oracle.estimates(injector.web3_provider())
+
+    assert estimate["block_number"] == stub_node.block_number
+    assert estimate["base_fee"] == stub_node.base_fee(stub_node.block_number + 1)
+    assert estimate["tiers"]["normal"] == dict(
+        gas_price=10**9, max_priority_fee_per_gas=10**8, max_fee_per_gas=2 * estimate["base_fee"] + 10**8
+    )
+
+
+def test_fees_endpoint(stub_node):
+    response = Client().get("/fees/")
+    assert response.status_code == 200
+    assert set(response.json()["tiers"]) == {"slow", "normal", "fast"}
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+
+from ethchange import injector
+from ethchange.user.management.commands.import_users import Command
+from ethchange.user.models import UserModel
+from test.conftest import make_user
+
+pytestmark = pytest.mark.django_db
+
+
+class Interrupted(Exception):
+    """Stands in for the import process dying"""
+
+
+@pytest.fixture
+def users_file(tmp_path):
+    path = tmp_path / "users.ndjson"
+    rows = [
+        dict(
+            name=f"import{index}",
+            password=f"pw{index}",
+            phone=4000000000 + index,
+            email=f"import{index}@ethchange.test",
+        )
+        for index in range(25)
+    ]
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    return path
+
+
+def _import(path, *args) -> str:
+    stdout = io.StringIO()
+    call_command(
+        "import_users", str(path), "--batch-size", "10", "--workers", "2", *args, stdout=stdout, stderr=io.StringIO()
+    )
+    return stdout.getvalue()
+
+
+def _assert_imported_once(stub_node):
+    names = UserModel.objects.filter(name__startswith="import").values_list("name", flat=True)
+    assert sorted(names) == sorted(f"import{index}" for index in range(25))
+    assert stub_node.calls["personal_newAccount"] == 25
+
+
+def test_resume_after_interrupted_import(stub_node, users_file, monkeypatch):
+    save_checkpoint = Command._save_checkpoint
+    saved = []
+
+    def interrupt_after_second_batch(checkpoint, rows):
+        # the second batch is committed, the process dies before its checkpoint is written
+        if saved:
+            raise Interrupted()
+        saved.append(rows)
+        save_checkpoint(checkpoint, rows)
+
+    monkeypatch.setattr(Command, "_save_checkpoint", staticmethod(interrupt_after_second_batch))
+    with pytest.raises(Interrupted):
+        _import(users_file)
+    assert UserModel.objects.filter(name__startswith="import").count() == 20
+
+    monkeypatch.setattr(Command, "_save_checkpoint", staticmethod(save_checkpoint))
+    output = _import(users_file, "--resume")
+    assert "Resuming after row 10" in output and "Imported 5 users, 10 skipped" in output
+    _assert_imported_once(stub_node)
+    assert not users_file.with_name("users.ndjson.checkpoint").exists()
+
+
+def test_rerun_skips_users_already_imported(stub_node, users_file):
+    make_user("import3", "pw3", 0)
+    UserModel.objects.filter(name="import3").update(phone=4000000003, email="import3@ethchange.test")
+    stub_node.calls.clear()
+
+    assert "Imported 24 users, 1 skipped" in _import(users_file)
+    assert "Imported 0 users, 25 skipped" in _import(users_file)
+    assert UserModel.objects.filter(name__startswith="import").count() == 25
+    assert stub_node.calls["personal_newAccount"] == 24
+
+
+def test_imported_users_are_indexed(stub_node, users_file):
+    address_index = injector.address_index()
+    address_index.rebuild()
+    _import(users_file)
+
+    user = UserModel.objects.get(name="import3")
+    assert address_index.get(user.eth_account) == user.pk
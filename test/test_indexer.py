@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import pytest
+from django.test import Client
+from web3 import Web3
+
+from ethchange import injector
+from ethchange.indexer.models import IndexedBlock, Transfer
+from ethchange.user.index import AddressIndex
+from test.conftest import make_user, make_users, user_address
+
+pytestmark = pytest.mark.django_db
+
+OTHER = Web3.toChecksumAddress("0x" + "ab" * 20)
+
+
+def _address(user) -> str:
+    return user.eth_account.decode("utf-8")
+
+
+def test_sync_records_user_transfers(stub_node):
+    user = make_user("alice", "password", 0)
+    stub_node.add_transfer(96, _address(user), OTHER, 10)
+    stub_node.add_transfer(97, OTHER, OTHER, 20)
+    stub_node.add_transfer(98, OTHER, _address(user), 30)
+
+    indexer = injector.transaction_indexer(start_block=95, batch_size=2)
+    assert indexer.sync() == 100
+    assert list(Transfer.objects.order_by("block_number").values_list("block_number", "value")) == [(96, 10), (98, 30)]
+    assert Transfer.objects.filter(receiver=_address(user).lower()).count() == 1
+
+
+def test_transfer_values_round_trip(stub_node):
+    user = make_user("alice", "password", 0)
+    values = [2**64 + 1, 2**256 - 1]
+    stub_node.add_transfer(96, _address(user), OTHER, values[0])
+    stub_node.add_transfer(97, OTHER, _address(user), values[1])
+
+    injector.transaction_indexer(start_block=95).sync()
+    assert [transfer.value for transfer in Transfer.objects.order_by("block_number")] == values
+    assert Transfer.objects.filter(value=values[1]).count() == 1
+
+    client = Client()
+    client.force_login(user)
+    response = client.get("/users/alice/transactions/")
+    assert [transfer["value"] for transfer in response.json()["results"]] == [str(value) for value in values[::-1]]
+
+
+def test_sync_rolls_back_reorgs(stub_node):
+    user = make_user("alice", "password", 0)
+    stub_node.add_transfer(99, _address(user), OTHER, 10)
+    indexer = injector.transaction_indexer(start_block=95)
+    indexer.sync()
+    replaced = Transfer.objects.get().tx_hash
+
+    stub_node.reorg(98)
+    stub_node.mine()
+    assert indexer.sync() == 97
+    assert not Transfer.objects.exists()
+
+    assert indexer.sync() == 101
+    assert IndexedBlock.objects.get(number=99).hash == stub_node.block_hash(99)
+    assert Transfer.objects.get().tx_hash != replaced
+
+
+def test_sync_stops_at_missing_block(stub_node):
+    indexer = injector.transaction_indexer(start_block=95)
+    stub_node.block_number = 120
+    head = indexer.sync()
+    stub_node.block_number = 100
+    assert head == 120
+    assert indexer.sync() == 120
+
+
+def test_address_index_follows_signals():
+    index = injector.address_index()
+    make_users(10)
+    index.refresh()
+    assert len(index) == 10
+
+    user = make_user("alice", "password", 0)
+    assert index.get(_address(user)) == user.pk
+    assert _address(user).lower() in index
+
+    user.delete()
+    assert _address(user) not in index
+
+
+def test_address_index_get_many():
+    make_users(100)
+    index = AddressIndex(refresh_interval=3600)
+    addresses = [user_address(number) for number in range(90, 110)]
+    assert list(index.get_many(addresses)) == addresses[:10]
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth import authenticate
+from django.test import Client
+from django.utils import timezone
+
+from config import settings
+from ethchange import injector
+from ethchange.jobs.models import Job
+from ethchange.jobs.queue import JobQueue, JobWorker
+from ethchange.metrics import InfluxExporter, MetricsRegistry, RpcMetrics
+from ethchange.user.models import UserModel
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+SIGNUP = dict(name="alice", password="password", phone=1234567890, email="alice@ethchange.test")
+
+
+@pytest.fixture
+def queue() -> JobQueue:
+    return JobQueue(
+        handlers=dict(signup="ethchange.user.jobs.signup", unlock_wallet="ethchange.user.jobs.unlock_wallet"),
+        node="http://node",
+        node_concurrency=2,
+        max_attempts=3,
+        retry_backoff=0.05,
+        retry_max_delay=1.0,
+        timeout=60,
+        retention=3600,
+    )
+
+
+@pytest.fixture
+def jobs_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "jobs_enabled", True)
+
+
+def _run_jobs(queue: JobQueue):
+    JobWorker(queue, workers=2, poll_interval=0.01).run(once=True)
+
+
+def test_signup_job(stub_node, jobs_enabled):
+    client = Client()
+    response = client.post("/users/signup/", SIGNUP, content_type="application/json")
+    assert response.status_code == 202
+    assert client.get(response["Location"]).json()["status"] == Job.QUEUED
+    assert not UserModel.objects.filter(name="alice").exists()
+
+    _run_jobs(injector.job_queue())
+
+    job = client.get(response["Location"]).json()
+    assert job["status"] == Job.SUCCEEDED and job["attempts"] == 1
+    assert job["result"]["eth_account"].lower() in stub_node.accounts
+    assert authenticate(username="alice", password="password") is not None
+    # the password is not kept once the job finished
+    assert bytes(Job.objects.get(pk=job["id"]).payload) == b""
+
+
+def test_wallet_jobs(stub_node, jobs_enabled):
+    UserModel.objects.create_user(**SIGNUP)
+    UserModel.objects.create_user(name="bob", password="password", phone=1234567891, email="bob@ethchange.test")
+    alice, bob = Client(), Client()
+    alice.force_login(UserModel.objects.get(name="alice"))
+    bob.force_login(UserModel.objects.get(name="bob"))
+
+    wrong = alice.post("/users/alice/unlock_wallet/", dict(password="wrong"), content_type="application/json")
+    unlock = alice.post("/users/alice/unlock_wallet/", dict(password="password"), content_type="application/json")
+    lock = alice.post("/users/alice/lock_wallet/", dict(password="password"), content_type="application/json")
+    assert {wrong.status_code, unlock.status_code, lock.status_code} == {202}
+    _run_jobs(injector.job_queue())
+
+    rejected = alice.get(wrong["Location"]).json()
+    assert rejected["status"] == Job.FAILED and rejected["error"] == "Invalid Credentials" and rejected["attempts"] == 1
+    assert alice.get(unlock["Location"]).json()["result"] == dict(unlocked=True)
+    assert alice.get(lock["Location"]).json()["result"] == dict(locked=True)
+    assert bob.get(unlock["Location"]).status_code == 404
+    assert stub_node.calls["personal_unlockAccount"] == 1 and stub_node.calls["personal_lockAccount"] == 1
+
+
+def test_wallet_endpoints_without_jobs(stub_node):
+    UserModel.objects.create_user(**SIGNUP)
+    client = Client()
+    client.force_login(UserModel.objects.get(name="alice"))
+
+    for action in ("unlock_wallet", "lock_wallet"):
+        response = client.post(f"/users/alice/{action}/", dict(password="password"), content_type="application/json")
+        assert response.status_code == 200
+        response = client.post(f"/users/alice/{action}/", dict(password="wrong"), content_type="application/json")
+        assert response.status_code == 400
+
+
+def test_transient_failures_retry_with_backoff(stub_node, queue):
+    UserModel.objects.create_user(**SIGNUP)
+    job = queue.enqueue("unlock_wallet", dict(name="alice", password="password"))
+    stub_node.fail = True
+
+    (claimed,) = queue.claim(10)
+    queue.run(claimed)
+    job.refresh_from_db()
+    assert job.status == Job.QUEUED and job.attempts == 1 and "503" in job.error
+    assert job.run_after >= timezone.now() + timedelta(seconds=0.02)
+    assert queue.claim(10) == []
+
+    time.sleep(0.06)
+    (claimed,) = queue.claim(10)
+    queue.run(claimed)
+    job.refresh_from_db()
+    # the delay doubles per attempt
+    assert job.attempts == 2 and job.run_after - timezone.now() > timedelta(seconds=0.06)
+
+    stub_node.fail = False
+    time.sleep(0.1)
+    _run_jobs(queue)
+    job.refresh_from_db()
+    assert job.status == Job.SUCCEEDED and job.attempts == 3
+    assert queue.stats()["retried"] == 2
+
+
+def test_gives_up_after_max_attempts(stub_node, queue):
+    UserModel.objects.create_user(**SIGNUP)
+    job = queue.enqueue("unlock_wallet", dict(name="alice", password="password"))
+    Job.objects.filter(pk=job.pk).update(attempts=2)
+    stub_node.fail = True
+
+    (claimed,) = queue.claim(10)
+    queue.run(claimed)
+    job.refresh_from_db()
+    assert job.status == Job.FAILED and job.attempts == 3
+
+
+def test_node_concurrency_cap(queue):
+    for index in range(5):
+        queue.enqueue("signup", dict(SIGNUP, name=f"user{index}"))
+
+    # workers claiming at once still stay within the cap of the node
+    with ThreadPoolExecutor(4) as executor:
+        claimed = [job for jobs in executor.map(queue.claim, [10] * 4) for job in jobs]
+    assert len(claimed) == 2 and queue.claim(10) == []
+
+    Job.objects.filter(pk=claimed[0].pk).update(status=Job.SUCCEEDED)
+    assert len(queue.claim(10)) == 1
+    assert queue.depths()["running_per_node"] == {"http://node": 2}
+
+
+def test_lost_jobs_are_queued_again(queue):
+    job = queue.enqueue("signup", SIGNUP)
+    queue.claim(1)
+    Job.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(seconds=61))
+
+    queue.maintain()
+    job.refresh_from_db()
+    assert job.status == Job.QUEUED and queue.stats()["requeued"] == 1
+
+
+def test_requeued_signup_reuses_its_account(stub_node, queue, monkeypatch):
+    job = queue.enqueue("signup", SIGNUP)
+    create_user = UserModel.objects.create_user
+
+    def crash(**kwargs):
+        # the worker dies after the account was created on the node, before the user row is written
+        monkeypatch.setattr(UserModel.objects, "create_user", create_user)
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(UserModel.objects, "create_user", crash)
+    (claimed,) = queue.claim(1)
+    queue.run(claimed)
+    job.refresh_from_db()
+    assert job.status == Job.QUEUED and job.progress["eth_account"].lower() in stub_node.accounts
+
+    time.sleep(0.06)
+    _run_jobs(queue)
+    job.refresh_from_db()
+    assert job.status == Job.SUCCEEDED and job.result["eth_account"] == job.progress["eth_account"]
+    assert stub_node.calls["personal_newAccount"] == 1
+
+
+def test_superseded_attempt_is_not_recorded(stub_node, queue):
+    job = queue.enqueue("signup", SIGNUP)
+    (stale,) = queue.claim(1)
+    Job.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(seconds=61))
+    queue.maintain()
+    (claimed,) = queue.claim(1)
+
+    # the attempt presumed dead finishes late, it neither creates the account again nor overwrites the job
+    queue.run(claimed)
+    queue.run(stale)
+    job.refresh_from_db()
+    assert job.status == Job.SUCCEEDED and job.attempts == 2
+    assert stub_node.calls["personal_newAccount"] == 1 and queue.stats()["succeeded"] == 1
+
+
+def test_queue_depth_metrics(queue):
+    for index in range(3):
+        queue.enqueue("signup", dict(SIGNUP, name=f"user{index}"))
+    queue.claim(1)
+
+    depths = queue.depths()
+    assert depths["statuses"] == dict(queued=2, running=1, succeeded=0, failed=0)
+    assert depths["ready"] == 2 and depths["oldest_ready_age"] >= 0
+
+    exporter = InfluxExporter(
+        MetricsRegistry([10]),
+        RpcMetrics([10]),
+        "http://127.0.0.1:1",
+        org="ethchange",
+        bucket="metrics",
+        token="token",
+        interval=3600,
+        batch_size=500,
+        buffer_size=1000,
+        timeout=1.0,
+        job_queue=queue,
+    )
+    queue_line, node_line = exporter.job_lines(depths, 1000)
+    assert (
+        queue_line.startswith("job_queue,host=") and "queued=2i,running=1i" in queue_line and ",ready=2i" in queue_line
+    )
+    assert node_line.endswith(",node=http://node running=1i 1000")
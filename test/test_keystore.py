@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+import re
+from datetime import datetime, timezone
+
+import pytest
+from eth_account import Account
+
+from ethchange.keystore import KeystoreGenerator, keyfile_path, reencrypt_keyfile
+
+# geth's name of a keystore file, `UTC--<ISO 8601 creation time with dashes>--<address without 0x>`
+KEYFILE_NAME = re.compile(r"UTC--(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}\.\d{9})Z--([0-9a-f]{40})")
+
+
+@pytest.fixture
+def generator(tmp_path) -> KeystoreGenerator:
+    generator = KeystoreGenerator(keystore_dir=str(tmp_path), scrypt_n=2**4, workers=1)
+    yield generator
+    generator.executor.shutdown()
+
+
+def test_generated_keyfile_opens_with_its_password(generator, tmp_path):
+    address = generator.generate("password")
+    (path,) = tmp_path.iterdir()
+    keyfile = json.loads(path.read_text())
+
+    assert Account.from_key(Account.decrypt(keyfile, "password")).address == address
+    assert keyfile["version"] == 3 and keyfile["address"] == address.lower().removeprefix("0x")
+    with pytest.raises(ValueError):
+        Account.decrypt(keyfile, "wrong password")
+
+
+def test_generated_keyfile_name(generator, tmp_path):
+    address = generator.generate("password")
+    (path,) = tmp_path.iterdir()
+
+    match = KEYFILE_NAME.fullmatch(path.name)
+    assert match and match.group(2) == address.lower().removeprefix("0x")
+    created = datetime.strptime(match.group(1)[:-3], "%Y-%m-%dT%H-%M-%S.%f").replace(tzinfo=timezone.utc)
+    assert abs((datetime.now(timezone.utc) - created).total_seconds()) < 60
+    assert keyfile_path(tmp_path, address) == path
+
+
+def test_reencrypted_keyfile_keeps_its_key(generator, tmp_path):
+    address = generator.generate("password")
+    path = keyfile_path(tmp_path, address)
+    reencrypt_keyfile(path, "password", "new password")
+    keyfile = json.loads(path.read_text())
+
+    assert Account.from_key(Account.decrypt(keyfile, "new password")).address == address
+    with pytest.raises(ValueError):
+        Account.decrypt(keyfile, "password")
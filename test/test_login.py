@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from config import settings
+from ethchange import injector
+from ethchange.user.backends import PasswordHasher
+from ethchange.user.models import UserModel
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+LOGIN = dict(name="alice", password="password")
+PBKDF2 = "django.contrib.auth.hashers.PBKDF2PasswordHasher"
+
+
+def _user_writes(queries: CaptureQueriesContext) -> list[str]:
+    table = UserModel._meta.db_table
+    return [query["sql"] for query in queries.captured_queries if query["sql"].startswith(f'UPDATE "{table}"')]
+
+
+def test_login_writes_last_login_only(alice_user):
+    client = Client()
+    with CaptureQueriesContext(connection) as queries:
+        assert client.post("/users/login/", LOGIN, content_type="application/json").status_code == 200
+
+    (write,) = _user_writes(queries)
+    assert write.split(" WHERE ")[0].split(" SET ")[1].startswith('"last_login" = ') and "," not in write
+    assert client.get("/users/alice/").status_code == 200
+    # the cached user is refreshed, not dropped, by the last_login write
+    assert UserModel.objects.get_cached("name", "alice").last_login is not None
+
+
+@pytest.mark.parametrize("mode", ["low_write", "authenticate"])
+def test_wrong_password_is_rejected(alice_user, monkeypatch, mode):
+    monkeypatch.setattr(settings, "auth_login_mode", mode)
+    response = Client().post("/users/login/", dict(LOGIN, password="wrong"), content_type="application/json")
+    assert response.status_code == 400
+    assert Client().post("/users/login/", LOGIN, content_type="application/json").status_code == 200
+
+
+def test_busy_hasher_sheds_logins(alice_user, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_check_password(*args):
+        started.set()
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr("ethchange.user.backends.check_password", slow_check_password)
+    hasher = PasswordHasher(workers=1, queue_size=0, timeout=5)
+    with injector.password_hasher.override(hasher):
+        first = threading.Thread(target=lambda: Client().post("/users/login/", LOGIN, content_type="application/json"))
+        first.start()
+        started.wait(5)
+        response = Client().post("/users/login/", LOGIN, content_type="application/json")
+        release.set()
+        first.join()
+
+    assert response.status_code == 503 and response["Retry-After"] == "1"
+    assert hasher.stats() == dict(verified=1, rejected=0, upgraded=0, shed=1)
+
+
+@override_settings(PASSWORD_HASHERS=[PBKDF2, "django.contrib.auth.hashers.MD5PasswordHasher"])
+def test_outdated_hash_is_upgraded(alice_user):
+    UserModel.objects.filter(pk=alice_user.pk).update(password=make_password("password", hasher="md5"))
+    assert Client().post("/users/login/", LOGIN, content_type="application/json").status_code == 200
+    assert UserModel.objects.get(pk=alice_user.pk).password.startswith("pbkdf2_sha256$")
+    assert injector.password_hasher().stats()["upgraded"] >= 1
+
+
+@pytest.mark.parametrize("backend", ["cache", "signed_cookies"])
+def test_sessions_outside_the_database(alice_user, backend):
+    with override_settings(SESSION_ENGINE=f"django.contrib.sessions.backends.{backend}"):
+        client = Client()
+        assert client.post("/users/login/", LOGIN, content_type="application/json").status_code == 200
+        assert client.get("/users/alice/").status_code == 200
+    assert not Session.objects.exists()
+
+
+def test_signup_logs_in_without_rehashing(stub_node, monkeypatch):
+    checks = []
+    monkeypatch.setattr(
+        "django.contrib.auth.backends.ModelBackend.authenticate", lambda *args, **kwargs: checks.append(args)
+    )
+    client = Client()
+    payload = dict(LOGIN, phone=1234567890, email="alice@ethchange.test")
+    assert client.post("/users/signup/", payload, content_type="application/json").status_code == 201
+    assert client.get("/users/alice/").status_code == 200
+    assert checks == []
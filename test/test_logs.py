@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+from loguru import logger
+
+from config import settings
+from ethchange.logs import RateLimitedLogger, configure_logging, rotation
+
+
+@pytest.fixture
+def messages() -> list:
+    records = []
+    handler = logger.add(lambda message: records.append(message.record), level="DEBUG", format="{message}")
+    yield records
+    logger.remove(handler)
+
+
+@pytest.fixture
+def restore_handlers():
+    yield
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+def test_rate_limited_call_site(messages):
+    limited = RateLimitedLogger("site", limit=3, interval=0.1)
+    for index in range(10):
+        limited.info(f"call {index}")
+    time.sleep(0.1)
+    limited.info("call 10")
+
+    assert [record["message"] for record in messages] == [
+        "call 0",
+        "call 1",
+        "call 2",
+        "call 10 ([7] similar messages dropped)",
+    ]
+    # the record points at the caller, not at the rate limiter
+    assert {record["name"] for record in messages} == {__name__}
+    assert messages[-1]["extra"] == dict(site="site", dropped=7)
+
+
+def test_rotation_by_size_and_time(monkeypatch):
+    should_rotate = rotation(max_bytes=100, at="")
+    assert not should_rotate("x" * 10, SimpleNamespace(tell=lambda: 80))
+    assert should_rotate("x" * 30, SimpleNamespace(tell=lambda: 80))
+
+    now = time.localtime()
+    should_rotate = rotation(max_bytes=0, at=f"{now.tm_hour:02d}:{now.tm_min:02d}")
+    # the first check schedules the next rollover, a day ahead as this minute already started
+    assert not should_rotate("x", SimpleNamespace(tell=lambda: 0))
+    assert not should_rotate("x", SimpleNamespace(tell=lambda: 0))
+
+
+def test_json_file_sink_with_module_levels(tmp_path, monkeypatch, restore_handlers):
+    monkeypatch.setattr(settings, "log_console", False)
+    monkeypatch.setattr(settings, "log_json", True)
+    monkeypatch.setattr(settings, "log_file", "{base_dir}/logs/ethchange.log")
+    monkeypatch.setattr(settings, "log_levels", {"": "INFO", "ethchange.metrics": "WARNING"})
+    configure_logging(tmp_path)
+
+    logger.debug("dropped below the default level")
+    logger.bind(site="test").info("written")
+    metrics_logger = logger.patch(lambda record: record.update(name="ethchange.metrics"))
+    metrics_logger.info("dropped below the module level")
+    metrics_logger.warning("written for the module")
+    logger.complete()
+
+    lines = (tmp_path / "logs" / "ethchange.log").read_text().splitlines()
+    records = [json.loads(line)["record"] for line in lines]
+    assert [record["message"] for record in records] == ["written", "written for the module"]
+    assert records[0]["extra"] == dict(site="test") and records[1]["name"] == "ethchange.metrics"
+
+
+def test_every_module_silenced(tmp_path, monkeypatch, restore_handlers):
+    monkeypatch.setattr(settings, "log_console", True)
+    monkeypatch.setattr(settings, "log_file", "{base_dir}/logs/ethchange.log")
+    monkeypatch.setattr(settings, "log_levels", {"": False, "ethchange.metrics": False})
+    assert configure_logging(tmp_path) == []
+
+    monkeypatch.setattr(settings, "log_levels", {"ethchange.metrics": False})
+    assert len(configure_logging(tmp_path)) == 2
+
+
+@pytest.mark.django_db
+def test_balance_polls_are_rate_limited(alice, messages):
+    for _ in range(5):
+        response = alice.generic(
+            "GET", "/users/alice/balance_eth_account/", json.dumps(dict(password="password")), "application/json"
+        )
+        assert response.status_code == 200
+
+    logged = [record["message"] for record in messages if record["extra"].get("site") == "user.balance_eth_account"]
+    assert logged == ["[alice] Balance requested"]
+    assert not any("password" in record["message"] for record in messages)
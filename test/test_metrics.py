@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from django.test import Client
+
+from ethchange import injector
+from ethchange.metrics import InfluxExporter, MetricsRegistry, RpcMetrics
+from test.conftest import make_user
+
+
+class InfluxStandIn:
+    """Accepts line protocol writes like the InfluxDB v2 write endpoint and keeps them"""
+
+    def __init__(self):
+        self.writes: list[tuple[str, str]] = []
+        self.status = 204
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+                if stand_in.status < 300:
+                    stand_in.writes.append((self.path, body))
+                self.send_response(stand_in.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def lines(self) -> list[str]:
+        return [line for _, body in self.writes for line in body.split("\n")]
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def influx() -> InfluxStandIn:
+    stand_in = InfluxStandIn()
+    yield stand_in
+    stand_in.stop()
+
+
+def _exporter(url: str, registry: MetricsRegistry, rpc_metrics: RpcMetrics, **kwargs) -> InfluxExporter:
+    options = dict(interval=3600, batch_size=500, buffer_size=1000, timeout=2.0) | kwargs
+    return InfluxExporter(registry, rpc_metrics, url, org="ethchange", bucket="metrics", token="token", **options)
+
+
+def test_exporter_writes_line_protocol(influx):
+    registry, rpc_metrics = MetricsRegistry([10, 100]), RpcMetrics([10, 100])
+    exporter = _exporter(influx.url, registry, rpc_metrics, batch_size=2)
+    registry.start_request()
+    registry.finish_request("GET", "users/<pk>/", 200, 42.0, queries=3, query_time=0.01)
+    rpc_metrics.record("eth_getBalance", "http://node", 5.0, 80, 60, failed=False, retries=0)
+
+    exporter.collect()
+    assert exporter.flush()
+    assert len(influx.writes) == 2
+    assert all(path.startswith("/api/v2/write?") and "precision=ms" in path for path, _ in influx.writes)
+
+    lines = {line.split(",", 1)[0]: line for line in influx.lines}
+    assert set(lines) == {"http_in_flight", "http_requests", "http_latency", "rpc_calls"}
+    assert "route=users/<pk>/" in lines["http_requests"] and " count=1i " in lines["http_requests"]
+    assert "le_10=0i,le_100=1i,le_inf=1i" in lines["http_latency"] and "db_queries=3i" in lines["http_latency"]
+    assert "node=http://node" in lines["rpc_calls"] and "le_10=1i" in lines["rpc_calls"]
+    assert exporter.stats()["written"] == 4
+
+
+def test_exporter_buffers_while_influx_fails(influx):
+    registry, rpc_metrics = MetricsRegistry([10]), RpcMetrics([10])
+    exporter = _exporter(influx.url, registry, rpc_metrics, buffer_size=3)
+    influx.status = 503
+    for _ in range(4):
+        registry.start_request()
+        registry.finish_request("GET", "stats/", 200, 1.0, queries=0, query_time=0.0)
+        exporter.collect()
+        assert not exporter.flush()
+
+    assert exporter.stats() == dict(written=0, dropped=9, failures=4, buffered=3, in_flight=0)
+    influx.status = 204
+    assert exporter.flush()
+    assert len(influx.lines) == 3
+
+
+@pytest.mark.django_db
+def test_middleware_records_requests(influx, settings):
+    settings.MIDDLEWARE = ["ethchange.metrics.metrics_middleware", *settings.MIDDLEWARE]
+    registry = MetricsRegistry([10, 100])
+    user = make_user("alice", "password", 0)
+    client = Client()
+    client.force_login(user)
+
+    exporter = _exporter(influx.url, registry, injector.rpc_metrics())
+    with injector.metrics_registry.override(registry), injector.metrics_exporter.override(exporter):
+        assert client.get("/users/alice/").status_code == 200
+        assert client.get("/missing/").status_code == 404
+
+    snapshot = registry.snapshot()
+    statuses = {(method, status): route for method, route, status in snapshot["statuses"]}
+    assert statuses[("GET", 404)] == "unresolved"
+    [(_, latency_sum, count, queries, _)] = [
+        endpoint for (method, route), endpoint in snapshot["endpoints"].items() if route == statuses[("GET", 200)]
+    ]
+    assert count == 1 and latency_sum > 0 and queries > 0
+    assert snapshot["in_flight"] == 0 and snapshot["max_in_flight"] == 1
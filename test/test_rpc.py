@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import pytest
+from web3 import Web3
+from web3.types import RPCEndpoint
+
+from ethchange.metrics import RpcMetrics, RpcMetricsMiddleware, instrumented_web3
+from ethchange.rpc import PooledHTTPProvider, RouterProvider, batch_request
+from test.stub_node import StubNode
+
+POOL = dict(pool_size=2, timeout=2.0, retries=0, backoff_factor=0.0)
+
+
+@pytest.fixture
+def nodes() -> list[StubNode]:
+    nodes = [StubNode().start() for _ in range(3)]
+    yield nodes
+    for node in nodes:
+        node.stop()
+
+
+def _router(nodes: list[StubNode], keystore: StubNode) -> RouterProvider:
+    return RouterProvider(
+        [node.uri for node in nodes], keystore.uri, max_lag=2, max_failures=3, health_interval=3600, **POOL
+    )
+
+
+def test_router_round_robin(nodes):
+    web3 = Web3(_router(nodes, nodes[0]))
+    for _ in range(6):
+        assert web3.eth.chain_id == 5
+    assert [node.calls["eth_chainId"] for node in nodes] == [2, 2, 2]
+
+
+def test_router_fails_over(nodes):
+    web3 = Web3(_router(nodes, nodes[0]))
+    web3.eth.chain_id
+    # the node goes down after the health check, while it is still in rotation
+    nodes[1].fail = True
+    for node in nodes:
+        node.calls.clear()
+    for _ in range(6):
+        assert web3.eth.chain_id == 5
+    assert nodes[0].calls["eth_chainId"] + nodes[2].calls["eth_chainId"] == 6
+    assert web3.provider.stats()[nodes[1].uri]["errors"] > 0
+
+
+def test_router_fails_over_node_errors_only(nodes):
+    web3 = Web3(_router(nodes, nodes[0]))
+    web3.eth.chain_id
+    for node in nodes:
+        node.calls.clear()
+
+    # an error answering the call itself is returned as is, without trying other nodes or counting against the node
+    with pytest.raises(ValueError):
+        web3.manager.request_blocking(RPCEndpoint("eth_unknown"), [])
+    assert sum(node.calls["eth_unknown"] for node in nodes) == 1
+    assert all(stats["errors"] == 0 for stats in web3.provider.stats().values())
+
+    nodes[1].error_code = -32005
+    for _ in range(6):
+        assert web3.eth.chain_id == 5
+    assert nodes[0].calls["eth_chainId"] + nodes[2].calls["eth_chainId"] == 6
+    assert web3.provider.stats()[nodes[1].uri]["errors"] == 2
+
+
+def test_router_skips_lagging_nodes(nodes):
+    nodes[2].block_number = 90
+    web3 = Web3(_router(nodes, nodes[0]))
+    for _ in range(4):
+        web3.eth.chain_id
+    assert nodes[2].calls["eth_chainId"] == 0
+    assert web3.provider.stats()[nodes[2].uri]["in_sync"] is False
+
+
+def test_router_pins_personal_calls(nodes):
+    keystore = StubNode().start()
+    try:
+        web3 = Web3(_router(nodes, keystore))
+        address = web3.geth.personal.new_account("password")
+        assert address.lower() in keystore.accounts
+        assert all(node.calls["personal_newAccount"] == 0 for node in nodes)
+
+        # the pending nonce is read where the transfers are signed, other counts are reads like any other
+        assert web3.eth.get_transaction_count(address, "pending") == 0
+        web3.eth.get_transaction_count(address, "latest")
+        assert keystore.calls["eth_getTransactionCount"] == 1
+        assert sum(node.calls["eth_getTransactionCount"] for node in nodes) == 1
+    finally:
+        keystore.stop()
+
+
+def test_batch_request(nodes):
+    web3 = Web3(PooledHTTPProvider(nodes[0].uri, **POOL))
+    addresses = [Web3.toChecksumAddress(f"0x{index:040x}") for index in range(1, 6)]
+    balances = batch_request(web3, [("eth_getBalance", [address, "latest"]) for address in addresses])
+    assert [int(balance, 16) for balance in balances] == [index * 10 for index in range(1, 6)]
+    assert web3.provider.stats()["requests"] == 1
+
+    with pytest.raises(ValueError):
+        batch_request(web3, [("eth_chainId", []), ("eth_unknown", [])])
+
+    # a node rejecting the whole batch answers with a single error
+    nodes[0].error_code = -32600
+    with pytest.raises(ValueError, match="-32600"):
+        batch_request(web3, [("eth_chainId", [])])
+
+
+def test_pooled_provider_reuses_connections(nodes):
+    web3 = Web3(PooledHTTPProvider(nodes[0].uri, **POOL))
+    for _ in range(5):
+        assert web3.eth.chain_id == 5
+    assert web3.provider.stats() == dict(requests=5, opened=1, reused=4)
+
+
+def test_rpc_metrics(nodes):
+    metrics = RpcMetrics(latency_buckets=[1, 10, 100])
+    web3 = instrumented_web3(PooledHTTPProvider(nodes[0].uri, **POOL), RpcMetricsMiddleware(metrics, slow_call_ms=0))
+    web3.eth.chain_id
+    batch_request(web3, [("eth_blockNumber", []), ("eth_blockNumber", [])])
+
+    stats = metrics.stats()
+    assert stats["eth_chainId"][nodes[0].uri]["count"] == 1
+    assert stats["batch:eth_blockNumber"][nodes[0].uri]["request_bytes"] > 0
+    assert sum(stats["eth_chainId"][nodes[0].uri]["latency_buckets"].values()) == 1
+
+    nodes[0].fail = True
+    with pytest.raises(Exception):
+        web3.eth.block_number
+    assert metrics.stats()["eth_blockNumber"][nodes[0].uri]["errors"] == 1
+    assert len(metrics.snapshot()) == 3
+    assert metrics.snapshot() == dict()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import datetime
+import decimal
+import json
+import sys
+import uuid
+from types import SimpleNamespace
+from urllib.parse import urlencode, urlsplit
+
+import pytest
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.test import Client
+from loguru import logger
+from rest_framework.renderers import JSONRenderer
+
+from config import settings
+from ethchange.user.views import ORJSONRenderer
+from test.conftest import make_user, make_users
+
+
+def _responses(client: Client, names: list[str]) -> list[bytes]:
+    responses = []
+    path, params = "/users/", dict(page_size=100)
+    while path:
+        response = client.get(path, params)
+        assert response.status_code == 200
+        responses.append(response.content)
+        path, params = response.json()["next"], None
+
+    responses.extend(client.get(f"/users/{name}/").content for name in names)
+    responses.append(b"".join(client.get("/users/", dict(format="ndjson")).streaming_content))
+    return responses
+
+
+class ASGIClient:
+    """Sends GET requests through `ethchange.asgi.application` with the session cookie of a logged in `Client`"""
+
+    def __init__(self, application, client: Client):
+        self.application = application
+        self.cookie = "; ".join(f"{name}={morsel.value}" for name, morsel in client.cookies.items()).encode()
+
+    async def _get(self, path: str, query: str) -> tuple[int, bytes]:
+        scope = dict(
+            type="http",
+            asgi=dict(version="3.0"),
+            http_version="1.1",
+            method="GET",
+            scheme="http",
+            path=path,
+            raw_path=path.encode(),
+            query_string=query.encode(),
+            headers=[(b"host", b"testserver"), (b"cookie", self.cookie)],
+            client=("127.0.0.1", 1024),
+            server=("testserver", 80),
+        )
+        communicator = ApplicationCommunicator(self.application, scope)
+        await communicator.send_input(dict(type="http.request", body=b""))
+        start, body = await communicator.receive_output(5), b""
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return start["status"], body
+
+    def get(self, path: str, params: dict = None) -> SimpleNamespace:
+        url = urlsplit(path)
+        status_code, content = async_to_sync(self._get)(url.path, url.query or urlencode(params or {}))
+        return SimpleNamespace(
+            status_code=status_code, content=content, streaming_content=[content], json=lambda: json.loads(content)
+        )
+
+
+@pytest.fixture
+def asgi_application():
+    from ethchange.asgi import application
+
+    yield application
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+@pytest.mark.django_db
+def test_fast_reads_match_serializer(monkeypatch):
+    names = make_users(250)
+    user = make_user("jürgen ", "password", 0)
+    client = Client()
+    client.force_login(user)
+
+    fast = _responses(client, [names[0], names[-1], user.name])
+    monkeypatch.setattr(settings, "user_fast_reads", False)
+    assert _responses(client, [names[0], names[-1], user.name]) == fast
+    assert len(fast) == 3 + 3 + 1
+
+
+# the ASGI handler closes the connection of the test transaction on request_started, the rows are committed instead
+@pytest.mark.django_db(transaction=True)
+def test_asgi_reads_match_wsgi(asgi_application, monkeypatch):
+    # the stream spans several chunks
+    monkeypatch.setattr(settings, "user_stream_chunk_size", 100)
+    names = make_users(250)
+    user = make_user("alice", "password", 0)
+    client = Client()
+    client.force_login(user)
+
+    responses = _responses(ASGIClient(asgi_application, client), [names[0], names[-1]])
+    assert responses == _responses(client, [names[0], names[-1]])
+    assert len(responses[-1].splitlines()) == 251
+
+
+def test_orjson_renderer_matches_json_renderer():
+    data = dict(
+        text='ü     "quoted"',
+        number=1.5,
+        big=2**63,
+        created=datetime.datetime(2023, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+        day=datetime.date(2023, 1, 2),
+        amount=decimal.Decimal("1.10"),
+        key=uuid.UUID(int=1),
+        nested=[None, True, {1: "int key"}],
+    )
+    assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+    assert ORJSONRenderer().render(None) == b""
+    assert ORJSONRenderer().render(dict(balance=20 * 10**18)) == b'{"balance":20000000000000000000}'
+    assert ORJSONRenderer().render(data, "application/json; indent=2") == JSONRenderer().render(
+        data, "application/json; indent=2"
+    )
+
+
+@pytest.mark.django_db
+def test_balances_beyond_64_bits(stub_node):
+    user = make_user("whale", "password", 0)
+    stub_node.balances[user.eth_account.decode("utf-8").lower()] = 2**64 + 1
+    client = Client()
+    client.force_login(user)
+
+    response = client.generic(
+        "GET", "/users/whale/balance_eth_account/", '{"password": "password"}', content_type="application/json"
+    )
+    assert response.status_code == 200 and response.content == b'{"balance":18446744073709551617}'
+    user.is_staff = True
+    user.save(update_fields=["is_staff"])
+    response = client.get("/users/balances/", dict(name="whale"))
+    assert response.status_code == 200 and response.json()["balances"]["whale"] == 2**64 + 1
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+from django.core.management import call_command
+
+import ethchange
+from ethchange import providers
+from ethchange.user.management.commands.profile_startup import ROOT_DIR
+
+
+def test_startup_does_not_import_web3():
+    script = (
+        "import sys; from ethchange.wsgi import application; from ethchange import injector; "
+        "print(sorted(name for name in ('web3', 'ethchange.rpc', 'ethchange.transactions') if name in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
+
+
+def test_profile_startup_command():
+    stdout = io.StringIO()
+    call_command("profile_startup", "--targets", "wsgi", "--runs", "1", "--json", stdout=stdout)
+    (report,) = json.loads(stdout.getvalue())
+
+    assert report["target"] == "wsgi" and report["wall_min_ms"] > 0
+    assert "django" in report["packages"]
+    assert {"ethchange.settings", "ethchange.user.models"} <= set(report["ethchange"])
+
+
+def test_injector_build_errors_keep_their_cause(monkeypatch):
+    def broken():
+        raise AttributeError("'Settings' object has no attribute 'node_uri'")
+
+    monkeypatch.delitem(vars(ethchange), "injector")
+    monkeypatch.delitem(vars(ethchange), "ProviderContainer")
+    monkeypatch.setattr(providers, "ProviderContainer", broken)
+
+    with pytest.raises(RuntimeError, match="node_uri") as info:
+        ethchange.injector
+    assert isinstance(info.value.__cause__, AttributeError)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from web3 import Web3
+
+from ethchange import injector
+from ethchange.transactions import NonceManager, TransactionSender, TransactionTimeout
+
+RECEIVER = Web3.toChecksumAddress("0x" + "cd" * 20)
+
+# nonces are allocated in their own transactions, from the threads sending
+nonce_db = pytest.mark.django_db(transaction=True)
+
+
+def make_sender(batch_interval: float = 0.05, timeout: float = 10.0) -> TransactionSender:
+    return TransactionSender(
+        injector.web3_provider(),
+        injector.fee_oracle(),
+        gas=21000,
+        gas_price=0,
+        fee_tier="normal",
+        batch_size=16,
+        batch_interval=batch_interval,
+        timeout=timeout,
+    )
+
+
+@pytest.fixture
+def sender() -> TransactionSender:
+    return make_sender()
+
+
+@pytest.fixture
+def account(stub_node) -> str:
+    return injector.web3_provider().geth.personal.new_account("password")
+
+
+@nonce_db
+def test_concurrent_sends_from_one_account(stub_node, sender, account):
+    with ThreadPoolExecutor(32) as executor:
+        tx_hashes = list(executor.map(lambda index: sender.send(account, "password", RECEIVER, index), range(64)))
+
+    assert len(set(tx_hashes)) == 64
+    assert stub_node.nonces[account.lower()] == 64
+    assert sorted(stub_node.transactions[tx_hash].value for tx_hash in tx_hashes) == list(range(64))
+    assert stub_node.calls["eth_getTransactionCount"] == 1
+    assert stub_node.calls["eth_sendRawTransaction"] == 64
+    stats = sender.stats()
+    assert stats["sent"] == 64 and stats["failed"] == 0 and stats["batches"] < 64
+
+
+@nonce_db
+def test_workers_share_nonces(stub_node, account):
+    # every worker process has its own nonce manager, the nonces come from the same rows
+    workers = [NonceManager(injector.web3_provider()) for _ in range(4)]
+    with ThreadPoolExecutor(16) as executor:
+        nonces = list(executor.map(lambda index: workers[index % 4].next(account), range(64)))
+
+    assert sorted(nonces) == list(range(64))
+    assert stub_node.calls["eth_getTransactionCount"] == 1
+
+
+@nonce_db
+def test_failed_send_resyncs_nonce(stub_node, sender, account):
+    sender.send(account, "password", RECEIVER, 1)
+    # the account sends from elsewhere, the local nonce falls behind the node
+    stub_node.nonces[account.lower()] += 2
+
+    with pytest.raises(ValueError, match="nonce too low"):
+        sender.send(account, "password", RECEIVER, 2)
+    tx_hash = sender.send(account, "password", RECEIVER, 3)
+
+    assert stub_node.transactions[tx_hash].nonce == 3
+    assert stub_node.calls["eth_getTransactionCount"] == 2
+    assert sender.stats()["resyncs"] == 1
+
+
+@nonce_db
+def test_wrong_password_does_not_skip_nonces(stub_node, sender, account):
+    with pytest.raises(ValueError):
+        sender.send(account, "wrong", RECEIVER, 1)
+    tx_hash = sender.send(account, "password", RECEIVER, 1)
+    assert stub_node.transactions[tx_hash].nonce == 0
+
+
+@nonce_db
+def test_timed_out_send_is_not_submitted(stub_node, sender, account):
+    # the batch waits longer than the send does
+    slow = make_sender(batch_interval=0.5, timeout=0.05)
+    with pytest.raises(TransactionTimeout):
+        slow.send(account, "password", RECEIVER, 1)
+    time.sleep(0.6)
+
+    assert stub_node.calls["eth_sendRawTransaction"] == 0
+    assert slow.stats()["resyncs"] == 1
+    tx_hash = sender.send(account, "password", RECEIVER, 2)
+    assert stub_node.transactions[tx_hash].nonce == 0
+
+
+@nonce_db
+def test_send_endpoint_timeout(stub_node, alice):
+    payload = dict(password="password", to=RECEIVER, value=10**15)
+    with injector.transaction_sender.override(make_sender(batch_interval=0.5, timeout=0.05)):
+        response = alice.post("/users/alice/send/", payload, content_type="application/json")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+@nonce_db
+def test_send_endpoint(stub_node, alice):
+    payload = dict(password="password", to=RECEIVER, value=10**15)
+    response = alice.post("/users/alice/send/", payload, content_type="application/json")
+    assert response.status_code == 201
+    assert stub_node.transactions[response.json()["tx_hash"]].value == 10**15
+
+    for invalid in (dict(password="wrong"), dict(to="0x1234"), dict(value=-1), dict(value="10")):
+        response = alice.post("/users/alice/send/", dict(payload, **invalid), content_type="application/json")
+        assert response.status_code == 400
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+
+from ethchange import injector
+from ethchange.cache import UnlockCache
+
+PASSWORD = dict(password="password")
+
+
+ACTIONS = ("unlock_wallet", "unlock_wallet", "unlock_wallet", "lock_wallet", "unlock_wallet")
+
+
+def _assert_unlocks_skipped(stub_node, statuses: list[int]):
+    assert statuses == [200] * len(ACTIONS)
+    assert stub_node.calls["personal_unlockAccount"] == 2
+    assert stub_node.calls["personal_lockAccount"] == 1
+    assert injector.unlock_cache().stats() == dict(unlocks=2, avoided=2, locks=1)
+
+
+@pytest.mark.django_db
+def test_repeated_unlocks_skip_the_node(alice, stub_node):
+    statuses = [
+        alice.post(f"/users/alice/{action}/", PASSWORD, content_type="application/json").status_code
+        for action in ACTIONS
+    ]
+    _assert_unlocks_skipped(stub_node, statuses)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_repeated_async_unlocks_skip_the_node(alice_user, stub_node):
+    client = AsyncClient()
+    client.force_login(alice_user)
+
+    # one event loop for all requests, the async provider keeps its HTTP session per loop
+    async def unlock_and_lock() -> list[int]:
+        return [
+            (await client.post(f"/async/users/alice/{action}/", PASSWORD, content_type="application/json")).status_code
+            for action in ACTIONS
+        ]
+
+    _assert_unlocks_skipped(stub_node, async_to_sync(unlock_and_lock)())
+
+
+def test_unlock_state_expires_before_geth_locks(stub_node):
+    address = injector.web3_provider().geth.personal.new_account("password")
+    unlock_cache = UnlockCache(alias="unlocks", node=stub_node.uri, duration=1, margin=0.9)
+
+    assert unlock_cache.unlock(address, "password", injector.web3_provider())
+    assert unlock_cache.unlock(address, "password", injector.web3_provider())
+    time.sleep(0.15)
+    assert unlock_cache.unlock(address, "password", injector.web3_provider())
+    assert stub_node.calls["personal_unlockAccount"] == 2
+
+
+def test_failed_unlocks_are_not_recorded(stub_node):
+    address = injector.web3_provider().geth.personal.new_account("password")
+    unlock_cache = UnlockCache(alias="unlocks", node=stub_node.uri, duration=300, margin=5)
+
+    assert not unlock_cache.unlock(address, "wrong", injector.web3_provider())
+    assert unlock_cache.unlock(address, "password", injector.web3_provider())
+    assert stub_node.calls["personal_unlockAccount"] == 2 and unlock_cache.stats()["avoided"] == 0
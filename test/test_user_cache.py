@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import pytest
+from django.contrib.auth.hashers import make_password
+from django.test import Client
+
+from ethchange import injector
+from ethchange.user.models import UserModel
+from test.conftest import make_user
+
+pytestmark = pytest.mark.django_db
+
+
+def _stats() -> dict:
+    stats = injector.user_cache().stats()
+    return {stat: stats[stat] for stat in ("hits", "misses", "stale")}
+
+
+def test_lookups_hit_the_cache(django_assert_num_queries):
+    user = make_user("alice", "password", 0)
+    before = _stats()
+
+    with django_assert_num_queries(1):
+        assert UserModel.objects.get_cached("name", "alice") == user
+        assert UserModel.objects.get_cached("pk", user.pk) == user
+        assert UserModel.objects.get_cached("eth_account", user.eth_account.decode("utf-8")) == user
+    assert UserModel.objects.get_cached("name", "nobody") is None
+
+    after = _stats()
+    assert after["hits"] - before["hits"] == 2 and after["misses"] - before["misses"] == 2
+
+
+def test_saves_and_deletes_invalidate_the_cache():
+    user = make_user("alice", "password", 0)
+    UserModel.objects.get_cached("name", "alice")
+
+    user.email = "alice@example.org"
+    user.save()
+    assert UserModel.objects.get_cached("name", "alice").email == "alice@example.org"
+
+    # a renamed user is no longer found under its old name
+    user.name = "alicia"
+    user.save()
+    assert UserModel.objects.get_cached("name", "alice") is None
+    assert UserModel.objects.get_cached("name", "alicia").pk == user.pk
+
+    user.delete()
+    assert UserModel.objects.get_cached("name", "alicia") is None
+
+
+def test_authentication_sees_changes_of_other_processes():
+    user = make_user("alice", "password", 0)
+    UserModel.objects.get_cached("name", "alice")
+
+    # queryset updates skip the signals, like a change made by another process
+    UserModel.objects.filter(pk=user.pk).update(password=make_password("changed"))
+    assert UserModel.objects.get_cached("name", "alice").check_password("password")
+    assert UserModel.objects.get_current("name", "alice").check_password("changed")
+    assert not UserModel.objects.unlock_eth_account("alice", "password")
+    assert _stats()["stale"] == 1
+
+    UserModel.objects.filter(pk=user.pk).update(is_staff=True)
+    assert UserModel.objects.get_current("pk", user.pk).is_staff
+
+    UserModel.objects.filter(pk=user.pk)._raw_delete(UserModel.objects.db)
+    assert UserModel.objects.get_current("name", "alice") is None
+
+
+def test_sessions_end_with_changes_of_other_processes():
+    user = make_user("alice", "password", 0)
+    client = Client()
+    client.force_login(user)
+    assert client.get("/users/alice/").status_code == 200
+
+    # the session carries a hash of the old password, it no longer matches the one in the database
+    UserModel.objects.filter(pk=user.pk).update(password=make_password("changed"))
+    assert client.get("/users/alice/").status_code == 403
+
+    client.force_login(UserModel.objects.get(pk=user.pk))
+    assert client.get("/users/alice/").status_code == 200
+    UserModel.objects.filter(pk=user.pk)._raw_delete(UserModel.objects.db)
+    assert client.get("/users/alice/").status_code == 403